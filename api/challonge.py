@@ -0,0 +1,372 @@
+import asyncio
+import os
+import random
+from datetime import datetime
+
+import aiohttp
+from dotenv import load_dotenv
+
+from utils.log import printlog
+
+# challonge.py
+# Async Challonge API client
+#
+# Mirrors the module interface of pychallonge (challonge.tournaments.create(...),
+# challonge.matches.update(...), ...) so call sites only need to add "await".
+# Requests share a single keep-alive connection pool, are bounded by a per-call timeout
+# and are retried with exponential backoff on rate limits, server errors and dropped
+# connections. Set CHALLONGE_URL (or call set_base_url) to point the client at a stub server.
+
+load_dotenv()
+
+CHALLONGE_URL = os.getenv("CHALLONGE_URL", "https://api.challonge.com/v1")
+CHALLONGE_TIMEOUT = float(os.getenv("CHALLONGE_TIMEOUT", 10))
+CHALLONGE_RETRIES = int(os.getenv("CHALLONGE_RETRIES", 3))
+CHALLONGE_CONNECTIONS = int(os.getenv("CHALLONGE_CONNECTIONS", 20))
+
+# Responses that are worth retrying; anything else is returned or raised immediately
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+
+# Fields that pychallonge never converted to dates/floats
+STRING_FIELDS = {
+    "name",
+    "display_name",
+    "display_name_with_invitation_email_address",
+    "username",
+    "challonge_username",
+    "misc",
+}
+
+_config = {"user": None, "api_key": None, "base_url": CHALLONGE_URL}
+_session: aiohttp.ClientSession = None
+
+
+class ChallongeException(Exception):
+    """Raised when the Challonge API returns an error response."""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+def set_credentials(username: str, api_key: str):
+    """Sets the Challonge API credentials used for all requests.
+
+    Args:
+        username (str): The Challonge username.
+        api_key (str): The Challonge API key.
+    """
+    _config["user"] = username
+    _config["api_key"] = api_key
+
+
+def set_base_url(base_url: str):
+    """Sets the base url of the Challonge API (ex. a local stub server).
+
+    Args:
+        base_url (str): The API base url, without a trailing slash.
+    """
+    _config["base_url"] = base_url.rstrip("/")
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Returns the shared HTTP session, creating it on first use.
+    Must be called from within the running event loop.
+
+    Returns:
+        aiohttp.ClientSession: The shared session.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=CHALLONGE_CONNECTIONS),
+            auth=aiohttp.BasicAuth(_config["user"] or "", _config["api_key"] or ""),
+            timeout=aiohttp.ClientTimeout(total=CHALLONGE_TIMEOUT),
+        )
+    return _session
+
+
+async def close():
+    """Closes the shared HTTP session."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def fetch(
+    method: str,
+    uri: str,
+    params_prefix: str = None,
+    timeout: float = None,
+    retries: int = None,
+    **params,
+):
+    """Sends a request to the Challonge API and returns the decoded JSON response.
+    Rate limits, server errors and connection errors are retried with exponential backoff.
+    Timed out requests are only retried for GET, since other requests may have been applied.
+    Callers that retry on their own (ex. the outbox) pass retries=0.
+
+    Args:
+        method (str): The HTTP method.
+        uri (str): The API path, without the base url or ".json" suffix.
+        params_prefix (str, optional): The prefix for the request parameters (ex. "tournament"). Defaults to None.
+        timeout (float, optional): The total timeout for each attempt in seconds. Defaults to CHALLONGE_TIMEOUT.
+        retries (int, optional): The number of retries. Defaults to CHALLONGE_RETRIES.
+        **params: The request parameters.
+
+    Raises:
+        ChallongeException: If the API returned an error response.
+
+    Returns:
+        The decoded JSON response.
+    """
+    url = f"{_config['base_url']}/{uri}.json"
+    query = prepare_params(params, params_prefix)
+    request_timeout = aiohttp.ClientTimeout(total=timeout or CHALLONGE_TIMEOUT)
+    retries = CHALLONGE_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        retry = attempt < retries
+        try:
+            async with get_session().request(
+                method, url, params=query, timeout=request_timeout
+            ) as response:
+                if response.status in RETRY_STATUSES and retry:
+                    retry_after = response.headers.get("Retry-After")
+                    await backoff(attempt, retry_after)
+                    continue
+                try:
+                    data = await response.json(content_type=None)
+                except ValueError:
+                    if response.status < 400:
+                        raise
+                    # Challonge and its proxy answer some errors with an HTML page
+                    data = (await response.text())[:200]
+                if response.status >= 400:
+                    errors = (
+                        data.get("errors", data) if isinstance(data, dict) else data
+                    )
+                    raise ChallongeException(
+                        f"{method} {uri} failed with status {response.status}: {errors}",
+                        response.status,
+                    )
+                return data
+        except aiohttp.ClientConnectionError as e:
+            if not retry:
+                raise
+            printlog(f"Challonge request {method} {uri} failed; retrying.", e)
+        except asyncio.TimeoutError:
+            if not retry or method != "GET":
+                raise
+            printlog(f"Challonge request {method} {uri} timed out; retrying.")
+        await backoff(attempt)
+
+
+async def backoff(attempt: int, retry_after: str = None):
+    """Waits before the next retry attempt.
+
+    Args:
+        attempt (int): The number of the failed attempt, starting at 0.
+        retry_after (str, optional): The Retry-After header of the response, if any. Defaults to None.
+    """
+    try:
+        delay = float(retry_after)
+    except (TypeError, ValueError):
+        delay = BACKOFF_BASE * 2**attempt * (1 + random.random())
+    await asyncio.sleep(min(delay, BACKOFF_MAX))
+
+
+async def fetch_and_parse(method: str, uri: str, params_prefix: str = None, **params):
+    """Sends a request to the Challonge API and returns the parsed response.
+
+    Args:
+        method (str): The HTTP method.
+        uri (str): The API path, without the base url or ".json" suffix.
+        params_prefix (str, optional): The prefix for the request parameters. Defaults to None.
+        **params: The request parameters.
+
+    Returns:
+        The parsed response; a dictionary or a list of dictionaries.
+    """
+    return parse(await fetch(method, uri, params_prefix, **params))
+
+
+def prepare_value(value):
+    """Converts a parameter value to the format expected by the Challonge API."""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return str(value).lower()
+    return value
+
+
+def prepare_params(params: dict, prefix: str = None) -> list:
+    """Flattens request parameters to (key, value) pairs, ex. tournament[name]=...
+
+    Args:
+        params (dict): The request parameters.
+        prefix (str, optional): The parameter prefix. Defaults to None.
+
+    Returns:
+        list: The query parameters.
+    """
+    query = []
+    for key, value in params.items():
+        name = f"{prefix}[{key}]" if prefix else key
+        if isinstance(value, dict):
+            query += prepare_params(value, name)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                if isinstance(item, dict):
+                    # ex. participants[][name]=...
+                    query += prepare_params(item, f"{name}[]")
+                else:
+                    query.append((f"{name}[]", prepare_value(item)))
+        elif value is not None:
+            query.append((name, prepare_value(value)))
+    return query
+
+
+def parse(data):
+    """Unwraps a Challonge response the same way pychallonge does.
+    {"tournament": {...}} becomes {...}, lists are unwrapped item by item, and
+    date/number strings are converted. Nested lists are left as returned by the API.
+
+    Args:
+        data: The decoded JSON response.
+
+    Returns:
+        The parsed response.
+    """
+    if not data:
+        return []
+    if isinstance(data, list):
+        return [parse(item) for item in data]
+    document = {
+        key: value for wrapper in data.values() for key, value in wrapper.items()
+    }
+    for key, value in document.items():
+        if key in STRING_FIELDS or not isinstance(value, str):
+            continue
+        try:
+            document[key] = datetime.fromisoformat(value)
+        except ValueError:
+            try:
+                document[key] = float(value)
+            except ValueError:
+                pass
+    return document
+
+
+class Tournaments:
+    """Challonge tournament endpoints."""
+
+    async def index(self, **params):
+        return await fetch_and_parse("GET", "tournaments", **params)
+
+    async def create(
+        self, name: str, url: str, tournament_type="single elimination", **params
+    ):
+        params.update({"name": name, "url": url, "tournament_type": tournament_type})
+        return await fetch_and_parse("POST", "tournaments", "tournament", **params)
+
+    async def show(self, tournament, **params):
+        return await fetch_and_parse("GET", f"tournaments/{tournament}", **params)
+
+    async def update(self, tournament, **params):
+        return await fetch_and_parse(
+            "PUT", f"tournaments/{tournament}", "tournament", **params
+        )
+
+    async def destroy(self, tournament, **params):
+        return await fetch("DELETE", f"tournaments/{tournament}", **params)
+
+    async def start(self, tournament, **params):
+        return await fetch_and_parse(
+            "POST", f"tournaments/{tournament}/start", **params
+        )
+
+    async def finalize(self, tournament, **params):
+        return await fetch_and_parse(
+            "POST", f"tournaments/{tournament}/finalize", **params
+        )
+
+    async def reset(self, tournament, **params):
+        return await fetch_and_parse(
+            "POST", f"tournaments/{tournament}/reset", **params
+        )
+
+
+class Participants:
+    """Challonge participant endpoints."""
+
+    async def index(self, tournament, **params):
+        return await fetch_and_parse(
+            "GET", f"tournaments/{tournament}/participants", **params
+        )
+
+    async def create(self, tournament, name: str, **params):
+        params.update({"name": name})
+        return await fetch_and_parse(
+            "POST", f"tournaments/{tournament}/participants", "participant", **params
+        )
+
+    async def bulk_add(self, tournament, participants: list, **params):
+        params.update({"participants": participants})
+        return await fetch_and_parse(
+            "POST", f"tournaments/{tournament}/participants/bulk_add", **params
+        )
+
+    async def show(self, tournament, participant_id, **params):
+        return await fetch_and_parse(
+            "GET", f"tournaments/{tournament}/participants/{participant_id}", **params
+        )
+
+    async def update(self, tournament, participant_id, **params):
+        return await fetch_and_parse(
+            "PUT",
+            f"tournaments/{tournament}/participants/{participant_id}",
+            "participant",
+            **params,
+        )
+
+    async def destroy(self, tournament, participant_id, **params):
+        return await fetch(
+            "DELETE", f"tournaments/{tournament}/participants/{participant_id}", **params
+        )
+
+    async def randomize(self, tournament):
+        return await fetch_and_parse(
+            "POST", f"tournaments/{tournament}/participants/randomize"
+        )
+
+
+class Matches:
+    """Challonge match endpoints."""
+
+    async def index(self, tournament, **params):
+        return await fetch_and_parse(
+            "GET", f"tournaments/{tournament}/matches", **params
+        )
+
+    async def show(self, tournament, match_id, **params):
+        return await fetch_and_parse(
+            "GET", f"tournaments/{tournament}/matches/{match_id}", **params
+        )
+
+    async def update(self, tournament, match_id, **params):
+        return await fetch_and_parse(
+            "PUT", f"tournaments/{tournament}/matches/{match_id}", "match", **params
+        )
+
+    async def reopen(self, tournament, match_id):
+        return await fetch_and_parse(
+            "POST", f"tournaments/{tournament}/matches/{match_id}/reopen"
+        )
+
+
+tournaments = Tournaments()
+participants = Participants()
+matches = Matches()
@@ -0,0 +1,57 @@
+import aiohttp
+
+from utils.constants import IMGUR_CLIENT_ID, IMGUR_URL
+from utils.log import printlog
+
+# imgur.py
+# Async image uploads to imgur, used to host bracket images for Discord embeds.
+
+IMGUR_TIMEOUT = 30
+
+_session: aiohttp.ClientSession = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Returns the shared HTTP session, creating it on first use.
+
+    Returns:
+        aiohttp.ClientSession: The shared session.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            headers={"Authorization": f"Client-ID {IMGUR_CLIENT_ID}"},
+            timeout=aiohttp.ClientTimeout(total=IMGUR_TIMEOUT),
+        )
+    return _session
+
+
+async def close():
+    """Closes the shared HTTP session."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def upload_image(image: bytes):
+    """Uploads an image to imgur.
+
+    Args:
+        image (bytes): The image data.
+
+    Returns:
+        The link to the hosted image if successful. Otherwise, None.
+    """
+    form = aiohttp.FormData()
+    form.add_field("image", image, content_type="image/png")
+    try:
+        async with get_session().post(f"{IMGUR_URL}/image", data=form) as response:
+            if response.status != 200:
+                printlog(f"Failed to upload image to imgur; status {response.status}.")
+                return None
+            data = await response.json()
+    except Exception as e:
+        printlog("Failed to upload image to imgur.", e)
+        return None
+    return data["data"]["link"]
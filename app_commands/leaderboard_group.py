@@ -12,7 +12,15 @@ LeaderboardGroup = app_commands.Group(
 )
 
 
-@app_commands.command(description="Retrieves the leaderboard stats for a player.")
+@LeaderboardGroup.command(
+    description="Shows the server leaderboard, 10 players per page."
+)
+async def show(interaction: Interaction):
+    await interaction.response.defer(ephemeral=True)
+    await leaderboard.retrieve_leaderboard(interaction)
+
+
+@LeaderboardGroup.command(description="Retrieves the leaderboard stats for a player.")
 async def player(interaction: Interaction, player_mention: str = ""):
     await interaction.response.defer(ephemeral=True)
     await leaderboard.retrieve_leaderboard_user_stats(
@@ -0,0 +1,534 @@
+import argparse
+import asyncio
+import itertools
+import random
+import statistics
+import time
+from datetime import datetime
+
+from aiohttp import web
+from discord import Embed
+
+import db.mdb as mdb
+from api import challonge, imgur
+from db import schema
+from guilds import guild as _guild
+from modules import bracket as _bracket
+from modules import editor as _editor
+from modules import match as _match
+from modules import outbox as _outbox
+from modules import render as _render
+from modules import tournament as _tournament
+from utils.constants import (
+    EVENTS,
+    GUILDS,
+    HISTORY,
+    LEADERBOARD,
+    MATCHES,
+    OUTBOX,
+    PARTICIPANTS,
+    SNAPSHOTS,
+    TOURNAMENTS,
+)
+
+# bracket_load.py
+# Load test: a large double elimination bracket, from the first match call to grand finals.
+# Usage: python -m benchmarks.bracket_load [--players 256] [--call-interval 0] [--seed 1]
+#
+# Challonge is replaced by a local stub server that keeps the state of the bracket, and
+# Discord by in-memory threads and messages; imgur uploads are counted instead of sent.
+# Everything else (database, bracket progression, match calls, ratings, embed edits and
+# bracket rendering) is the bot's own code. A bench tournament is seeded into the
+# configured database and started the way start_tournament does. Then every open match is
+# reported concurrently, wave after wave, until the bracket is complete. Bench documents
+# are removed afterwards.
+
+BENCH_GUILD_OFFSET = 900_000_000_000
+BENCH_ID = BENCH_GUILD_OFFSET + 23
+
+
+####################
+## CHALLONGE STUB ##
+####################
+
+
+def create_double_elimination(players: list, match_ids) -> list:
+    """Returns the matches of a double elimination bracket in the Challonge match format.
+
+    Args:
+        players (list): The participant challonge ids, in seeding order. A power of two.
+        match_ids: An iterator of match ids, in the order Challonge creates them.
+
+    Returns:
+        list: The matches; the grand finals reset is the last one.
+    """
+
+    def new_match(round, player1=None, player2=None, prereq1=None, prereq2=None):
+        return {
+            "id": next(match_ids),
+            "round": round,
+            "state": "open" if player1 and player2 else "pending",
+            "player1_id": player1,
+            "player2_id": player2,
+            "player1_prereq_match_id": prereq1["match"]["id"] if prereq1 else None,
+            "player2_prereq_match_id": prereq2["match"]["id"] if prereq2 else None,
+            "player1_is_prereq_match_loser": bool(prereq1 and prereq1["loser"]),
+            "player2_is_prereq_match_loser": bool(prereq2 and prereq2["loser"]),
+            "winner_id": None,
+            "loser_id": None,
+        }
+
+    def winner(match):
+        return {"match": match, "loser": False}
+
+    def loser(match):
+        return {"match": match, "loser": True}
+
+    # Winners bracket
+    winners_rounds = [
+        [new_match(1, players[i], players[i + 1]) for i in range(0, len(players), 2)]
+    ]
+    while len(winners_rounds[-1]) > 1:
+        previous = winners_rounds[-1]
+        winners_rounds.append(
+            [
+                new_match(
+                    len(winners_rounds) + 1,
+                    prereq1=winner(previous[i]),
+                    prereq2=winner(previous[i + 1]),
+                )
+                for i in range(0, len(previous), 2)
+            ]
+        )
+
+    # Losers bracket; players dropping from each winners round face the survivors
+    first = winners_rounds[0]
+    losers_rounds = [
+        [
+            new_match(-1, prereq1=loser(first[i]), prereq2=loser(first[i + 1]))
+            for i in range(0, len(first), 2)
+        ]
+    ]
+    for dropping in winners_rounds[1:]:
+        previous = losers_rounds[-1]
+        losers_rounds.append(
+            [
+                new_match(
+                    -(len(losers_rounds) + 1),
+                    prereq1=winner(previous[i]),
+                    prereq2=loser(dropping[i]),
+                )
+                for i in range(len(dropping))
+            ]
+        )
+        previous = losers_rounds[-1]
+        if len(previous) > 1:
+            losers_rounds.append(
+                [
+                    new_match(
+                        -(len(losers_rounds) + 1),
+                        prereq1=winner(previous[i]),
+                        prereq2=winner(previous[i + 1]),
+                    )
+                    for i in range(0, len(previous), 2)
+                ]
+            )
+
+    # Grand finals and the reset
+    finals_round = len(winners_rounds) + 1
+    grand_finals = new_match(
+        finals_round,
+        prereq1=winner(winners_rounds[-1][0]),
+        prereq2=winner(losers_rounds[-1][0]),
+    )
+    grand_finals_reset = new_match(
+        finals_round, prereq1=winner(grand_finals), prereq2=loser(grand_finals)
+    )
+    return (
+        [match for round in winners_rounds for match in round]
+        + [match for round in losers_rounds for match in round]
+        + [grand_finals, grand_finals_reset]
+    )
+
+
+class ChallongeStub:
+    """Serves the match endpoints used by the bot for one bracket, and its SVG image."""
+
+    def __init__(self, matches: list, num_players: int):
+        self.matches = {match["id"]: match for match in matches}
+        # A column per round: winners rounds first, then losers rounds
+        rounds = sorted(
+            {match["round"] for match in matches}, key=lambda r: (r < 0, abs(r))
+        )
+        self.columns = {round: column for column, round in enumerate(rounds)}
+        self.reset_id = matches[-1]["id"]
+        self.num_players = num_players
+        self.requests = 0
+        self.app = web.Application()
+        self.app.add_routes(
+            [
+                web.get("/tournaments/{tournament}/matches.json", self.index),
+                web.put("/tournaments/{tournament}/matches/{match}.json", self.update),
+                web.get("/bench.svg", self.svg),
+            ]
+        )
+
+    async def index(self, request: web.Request):
+        self.requests += 1
+        state = request.query.get("state")
+        return web.json_response(
+            [
+                {"match": match}
+                for match in self.matches.values()
+                if not state or match["state"] == state
+            ]
+        )
+
+    async def update(self, request: web.Request):
+        self.requests += 1
+        match = self.matches[int(request.match_info["match"])]
+        winner_id = int(request.query["match[winner_id]"])
+        loser_id = (
+            match["player2_id"]
+            if winner_id == match["player1_id"]
+            else match["player1_id"]
+        )
+        match.update(
+            {"state": "complete", "winner_id": winner_id, "loser_id": loser_id}
+        )
+        for next_match in self.matches.values():
+            for slot in ("player1", "player2"):
+                if next_match[f"{slot}_prereq_match_id"] == match["id"]:
+                    next_match[f"{slot}_id"] = (
+                        loser_id
+                        if next_match[f"{slot}_is_prereq_match_loser"]
+                        else winner_id
+                    )
+            if (
+                next_match["state"] == "pending"
+                and next_match["player1_id"]
+                and next_match["player2_id"]
+            ):
+                # The reset is only played if the losers bracket finalist wins
+                if (
+                    next_match["id"] == self.reset_id
+                    and winner_id == match["player1_id"]
+                ):
+                    next_match["state"] = "complete"
+                else:
+                    next_match["state"] = "open"
+        return web.json_response({"match": match})
+
+    async def svg(self, request: web.Request):
+        # One box per match, shaded by its state, so every result changes the image
+        rows = {}
+        boxes = []
+        for match in self.matches.values():
+            row = rows.get(match["round"], 0)
+            rows[match["round"]] = row + 1
+            fill = {"open": "#fc6", "complete": "#9c9"}.get(match["state"], "#ccc")
+            boxes.append(
+                f'<rect x="{self.columns[match["round"]] * 220}" y="{row * 60}"'
+                f' width="200" height="50" fill="{fill}"/>'
+            )
+        width = len(self.columns) * 220
+        height = self.num_players // 2 * 60
+        return web.Response(
+            body=(
+                f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">'
+                + "".join(boxes)
+                + "</svg>"
+            ).encode(),
+            content_type="image/svg+xml",
+        )
+
+
+##################
+## DISCORD STUB ##
+##################
+
+
+class BenchMessage:
+    def __init__(self, channel, message_id: int, content=None, embed=None):
+        self.id = message_id
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.embeds = [embed] if embed else []
+
+    async def edit(self, content=None, embed=None, view=None, **fields):
+        self.channel.edits += 1
+        if embed:
+            self.embeds = [embed]
+        return self
+
+
+class BenchChannel:
+    def __init__(self, guild, channel_id: int, type: str):
+        self.id = channel_id
+        self.guild = guild
+        self.type = type
+        self.messages = {}
+        self.sent = 0
+        self.edits = 0
+        self.message_ids = itertools.count(channel_id * 10_000)
+
+    async def send(self, content=None, embed=None, view=None):
+        self.sent += 1
+        message = BenchMessage(self, next(self.message_ids), content, embed)
+        self.messages[message.id] = message
+        return message
+
+    async def fetch_message(self, message_id: int):
+        return self.messages[message_id]
+
+
+class BenchGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.channels = {}
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+
+class BenchClient:
+    def add_view(self, view, message_id: int = None):
+        pass
+
+
+#############
+## RUNNING ##
+#############
+
+
+def seed(num_players: int, challonge_url: str):
+    """Inserts the bench guild, tournament and participants."""
+    created_at = datetime(2023, 1, 1)
+    mdb.db[GUILDS].insert_one({"guild_id": BENCH_ID, "name": "bench"})
+    mdb.db[TOURNAMENTS].insert_one(
+        {
+            "guild_id": BENCH_ID,
+            "id": BENCH_ID,
+            "channel_id": BENCH_ID,
+            "title": "Bench Bracket",
+            "tournament_type": "double elimination",
+            "jump_url": "https://discord.com/channels/bench",
+            "result_url": None,
+            "author": {"username": "bench", "id": 0, "avatar_url": None},
+            "challonge": {"id": BENCH_ID, "url": challonge_url},
+            "winner": None,
+            "max_participants": num_players,
+            "created_at": created_at,
+            "start_time": created_at,
+            "end_time": None,
+            "completed": False,
+            "open": True,
+            "in_progress": False,
+            "num_rounds": None,
+            "bracket": None,
+        }
+    )
+    mdb.db[PARTICIPANTS].insert_many(
+        [
+            {
+                "guild_id": BENCH_ID,
+                "tournament_id": BENCH_ID,
+                "id": 100_000_000_000_000_000 + p,
+                "challonge_id": BENCH_ID * 1000 + p,
+                "name": f"player-{p}",
+                "seed": p + 1,
+                "placement": None,
+                "active": True,
+            }
+            for p in range(num_players)
+        ]
+    )
+
+
+def clean():
+    """Removes every bench document."""
+    for collection in (
+        GUILDS,
+        TOURNAMENTS,
+        PARTICIPANTS,
+        MATCHES,
+        LEADERBOARD,
+        HISTORY,
+        EVENTS,
+        SNAPSHOTS,
+        OUTBOX,
+    ):
+        mdb.db[collection].delete_many({"guild_id": {"$gte": BENCH_GUILD_OFFSET}})
+
+
+async def load_tournament():
+    """Loads the bench tournament the way a vote does."""
+    db_guild = await _guild.find_guild(
+        BENCH_ID, {TOURNAMENTS: {**schema.ACTIVE_TOURNAMENT, "id": BENCH_ID}}
+    )
+    return db_guild, _tournament.find_tournament_by_id(db_guild, BENCH_ID)
+
+
+async def start(client, channel, thread) -> int:
+    """Starts the bench tournament the way start_tournament does after Challonge."""
+    db_guild = await _guild.find_guild(BENCH_ID, {TOURNAMENTS: {"id": BENCH_ID}})
+    db_tournament = _tournament.find_tournament_by_id(db_guild, BENCH_ID)
+    challonge_matches = await challonge.matches.index(BENCH_ID)
+    bracket = _bracket.create_bracket(
+        challonge_matches, db_tournament["tournament_type"]
+    )
+    db_tournament.update(
+        {
+            "open": False,
+            "in_progress": True,
+            "num_rounds": bracket["num_rounds"],
+            "bracket": bracket,
+        }
+    )
+    await _tournament.set_tournament(BENCH_ID, db_tournament["title"], db_tournament)
+    matches = [match for match in challonge_matches if match["state"] == "open"]
+    async with _match.match_call_locks[BENCH_ID]:
+        count = await _match.call_matches(
+            client, thread, db_guild, db_tournament, matches
+        )
+    await _tournament.edit_tournament_message(db_tournament, channel, thread)
+    return count
+
+
+async def report(client, thread, match_id: int, rng: random.Random, latencies: list):
+    """Reports one match with a random winner the way a confirmed vote does."""
+    started = time.perf_counter()
+    db_guild, db_tournament = await load_tournament()
+    db_match = _match.find_match(db_tournament, match_id)
+    await _match.report_match(
+        client,
+        thread.messages[match_id],
+        db_guild,
+        db_tournament,
+        db_match,
+        rng.choice(["1️⃣", "2️⃣"]),
+    )
+    latencies.append(time.perf_counter() - started)
+
+
+async def main(num_players: int, call_interval: float, seed_value: int):
+    if num_players < 4 or num_players & (num_players - 1):
+        raise SystemExit("--players must be a power of two of at least 4")
+    rng = random.Random(seed_value)
+    players = [BENCH_ID * 1000 + p for p in range(num_players)]
+    stub = ChallongeStub(
+        create_double_elimination(players, itertools.count(BENCH_ID * 10_000)),
+        num_players,
+    )
+    runner = web.AppRunner(stub.app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    challonge.set_base_url(f"http://127.0.0.1:{port}")
+
+    uploads = []
+
+    async def upload_image(image: bytes):
+        uploads.append(len(image))
+        return f"https://i.imgur.com/bench-{len(uploads)}.png"
+
+    imgur.upload_image = upload_image
+    _match.MATCH_CALL_INTERVAL = call_interval
+
+    guild = BenchGuild(BENCH_ID)
+    channel = BenchChannel(guild, BENCH_ID, "text")
+    guild.channels[channel.id] = channel
+    thread = channel
+    client = BenchClient()
+
+    await schema.ensure_indexes()
+    clean()
+    seed(num_players, f"http://127.0.0.1:{port}/bench")
+    tournament_embed = Embed(title="Bench Bracket")
+    for name in ("Tournament Type", "Starting At", "Entrants", "Bracket Link"):
+        tournament_embed.add_field(name=name, value="-")
+    channel.messages[BENCH_ID] = BenchMessage(channel, BENCH_ID, embed=tournament_embed)
+    try:
+        started = time.perf_counter()
+        called = await start(client, channel, thread)
+        start_time = time.perf_counter() - started
+        if called < 0:
+            raise RuntimeError("the first matches could not be called")
+        print(
+            f"start:   players={num_players} called={called} time={start_time * 1000:.1f}ms"
+        )
+
+        latencies = []
+        waves = 0
+        previous_matches = None
+        started = time.perf_counter()
+        while True:
+            _, db_tournament = await load_tournament()
+            open_matches = [
+                db_match["id"]
+                for db_match in db_tournament["matches"]
+                if not db_match["completed"]
+            ]
+            if not open_matches:
+                break
+            if open_matches == previous_matches:
+                raise RuntimeError(f"{len(open_matches)} matches could not be reported")
+            previous_matches = open_matches
+            waves += 1
+            await asyncio.gather(
+                *[
+                    report(client, thread, match_id, rng, latencies)
+                    for match_id in open_matches
+                ]
+            )
+        report_time = time.perf_counter() - started
+        latencies.sort()
+        print(
+            f"reports: matches={len(latencies)} waves={waves} time={report_time * 1000:.1f}ms"
+            f" p50={statistics.median(latencies) * 1000:.1f}ms"
+            f" p95={latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms"
+            f" max={latencies[-1] * 1000:.1f}ms"
+        )
+
+        # Let the last bracket render and embed edits go out
+        while _render.render_jobs or _editor.edit_jobs:
+            await asyncio.sleep(0.1)
+        await _editor.close()
+        # Results reach the stub through the outbox, so wait for it before checking the bracket
+        drained = await _outbox.drain(BENCH_ID)
+        await _outbox.close()
+        completed = all(match["state"] == "complete" for match in stub.matches.values())
+        entrants = _editor.current_embed(channel.messages[BENCH_ID]).fields[2].value
+        print(
+            f"discord: sent={channel.sent} edits={channel.edits}"
+            f" entrants_field={len(entrants)} chars"
+        )
+        print(
+            f"stubs:   challonge_requests={stub.requests} outbox_drained={drained}"
+            f" bracket_complete={completed}"
+            f" renders={len(uploads)} largest_png={max(uploads, default=0)} bytes"
+        )
+    finally:
+        await _outbox.close()
+        clean()
+        await _render.close()
+        await challonge.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Large double elimination bracket load test."
+    )
+    parser.add_argument("--players", type=int, default=256)
+    parser.add_argument(
+        "--call-interval",
+        type=float,
+        default=0,
+        help="Seconds between match call batches (MATCH_CALL_INTERVAL).",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main(args.players, args.call_interval, args.seed))
@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+import db.mdb as mdb
+from utils.constants import GUILDS
+
+# db_latency.py
+# Benchmark: concurrent guild lookups (button presses) against the database layer.
+# Usage: python -m benchmarks.db_latency [--guilds 50] [--presses 20]
+#
+# Runs the same burst of guild lookups twice: once calling PyMongo directly inside the
+# coroutines (the old behaviour) and once through db.mdb. A heartbeat task measures how
+# long the event loop is stalled while the burst is in flight.
+
+BENCH_GUILD_OFFSET = 900_000_000_000
+
+
+async def heartbeat(stop: asyncio.Event, gaps: list, interval: float = 0.001):
+    """Records the delay between scheduled event loop ticks until stopped."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        gaps.append(time.perf_counter() - start - interval)
+
+
+async def blocking_press(guild_id: int, latencies: list):
+    """Simulates a button press that calls PyMongo directly on the event loop."""
+    start = time.perf_counter()
+    mdb.db[GUILDS].find_one({"guild_id": guild_id})
+    latencies.append(time.perf_counter() - start)
+
+
+async def executor_press(guild_id: int, latencies: list):
+    """Simulates a button press that goes through the database layer."""
+    start = time.perf_counter()
+    await mdb.find_document({"guild_id": guild_id}, GUILDS)
+    latencies.append(time.perf_counter() - start)
+
+
+async def run_burst(press, num_guilds: int, presses: int):
+    """Fires `presses` concurrent lookups for each guild and reports the timings."""
+    latencies, gaps = [], []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(heartbeat(stop, gaps))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[
+            press(BENCH_GUILD_OFFSET + i % num_guilds, latencies)
+            for i in range(num_guilds * presses)
+        ]
+    )
+    total = time.perf_counter() - start
+    stop.set()
+    await ticker
+    return {
+        "total_ms": total * 1000,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "max_loop_stall_ms": max(gaps, default=0) * 1000,
+    }
+
+
+async def main(num_guilds: int, presses: int):
+    collection = mdb.db[GUILDS]
+    collection.insert_many(
+        [
+            {
+                "guild_id": BENCH_GUILD_OFFSET + i,
+                "name": f"bench-{i}",
+                "tournaments": [],
+            }
+            for i in range(num_guilds)
+        ]
+    )
+    try:
+        for name, press in (("blocking", blocking_press), ("executor", executor_press)):
+            result = await run_burst(press, num_guilds, presses)
+            print(
+                f"{name:>9}: total={result['total_ms']:.1f}ms p50={result['p50_ms']:.2f}ms "
+                f"max={result['max_ms']:.2f}ms loop_stall={result['max_loop_stall_ms']:.2f}ms"
+            )
+    finally:
+        collection.delete_many({"guild_id": {"$gte": BENCH_GUILD_OFFSET}})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Database latency benchmark.")
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--presses", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.guilds, args.presses))
@@ -0,0 +1,91 @@
+import argparse
+import time
+
+from db import schema
+from modules import match as _match
+from modules import participant as _participant
+from utils.constants import MATCHES, PARTICIPANTS
+
+# document_index.py
+# Benchmark: participant and match lookups with and without DocumentIndex.
+# Usage: python -m benchmarks.document_index [--entrants 24 128 512] [--repeat 20]
+#
+# Times the lookup loops of sync_seeding (every participant by challonge id) and of
+# call_matches (every match by challonge id, then both of its players), once on plain
+# lists as built by hand and once on the indexed lists returned by the schema loaders.
+# The indexed timings include building the index, which happens once per load.
+
+
+def make_tournament(num_entrants: int) -> dict:
+    """Creates a double elimination sized tournament document with plain lists."""
+    participants = [
+        {
+            "id": 100_000 + p,
+            "challonge_id": 200_000 + p,
+            "name": f"player-{p}",
+            "active": True,
+        }
+        for p in range(num_entrants)
+    ]
+    matches = [
+        {
+            "id": 300_000 + m,
+            "challonge_id": 400_000 + m,
+            "player1": {"id": 100_000 + 2 * m % num_entrants, "vote": None},
+            "player2": {"id": 100_000 + (2 * m + 1) % num_entrants, "vote": None},
+            "round": 1,
+            "completed": False,
+            "winner_emote": None,
+            "next_matches": [],
+        }
+        for m in range(2 * num_entrants - 1)
+    ]
+    return {"id": 1, "title": "bench", PARTICIPANTS: participants, MATCHES: matches}
+
+
+def lookup_loop(db_tournament: dict):
+    """Runs the lookups of one seeding sync and one pass over the called matches."""
+    for participant in db_tournament[PARTICIPANTS]:
+        _participant.find_participant_by_challonge_id(
+            db_tournament, participant["challonge_id"]
+        )
+    for db_match in db_tournament[MATCHES]:
+        _match.find_match_by_challonge_id(db_tournament, db_match["challonge_id"])
+        _participant.find_participant(db_tournament, db_match["player1"]["id"])
+        _participant.find_participant(db_tournament, db_match["player2"]["id"])
+
+
+def index_tournament(db_tournament: dict) -> dict:
+    """Returns a copy of a tournament with its arrays indexed like a loaded document."""
+    return {
+        **db_tournament,
+        PARTICIPANTS: schema.index_documents(PARTICIPANTS, db_tournament[PARTICIPANTS]),
+        MATCHES: schema.index_documents(MATCHES, db_tournament[MATCHES]),
+    }
+
+
+def measure(db_tournament: dict, indexed: bool, repeat: int) -> float:
+    """Returns the mean time of one lookup loop in seconds."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        target = index_tournament(db_tournament) if indexed else db_tournament
+        lookup_loop(target)
+    return (time.perf_counter() - start) / repeat
+
+
+def main(entrants: list, repeat: int):
+    for num_entrants in entrants:
+        db_tournament = make_tournament(num_entrants)
+        scan_time = measure(db_tournament, False, repeat)
+        index_time = measure(db_tournament, True, repeat)
+        print(
+            f"{num_entrants:>4} entrants: scan={scan_time * 1000:.3f}ms index={index_time * 1000:.3f}ms speedup={scan_time / index_time:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Document index lookup benchmark.")
+    parser.add_argument("--entrants", type=int, nargs="+", default=[24, 128, 512])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.entrants, args.repeat)
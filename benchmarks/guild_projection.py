@@ -0,0 +1,146 @@
+import argparse
+import time
+from datetime import datetime
+
+import bson
+
+from db import schema
+from utils.constants import CHALLENGES, LEADERBOARD
+
+# guild_projection.py
+# Benchmark: bytes transferred and BSON decode time for the guild reads used by handlers.
+# Usage: python -m benchmarks.guild_projection [--tournaments 500] [--participants 16]
+#
+# Builds a guild with a long tournament history and compares three reads:
+#   embedded - the old single guild document with every array embedded
+#   full     - find_guild(guild_id), every document in the normalized collections
+#   active   - find_guild(guild_id, {TOURNAMENTS: ACTIVE_TOURNAMENT}), the vote handler read
+# No database is needed; the documents are encoded and decoded with the bson package,
+# which is what PyMongo does with every reply.
+
+GUILD_ID = 900_000_000_000
+
+
+def make_tournament(i: int, num_participants: int, active: bool) -> dict:
+    """Creates a tournament document in the embedded format."""
+    tournament_id = GUILD_ID + i
+    participants = [
+        {
+            "id": 100_000 + p,
+            "challonge_id": tournament_id * 100 + p,
+            "name": f"player-{p}",
+            "placement": p + 1,
+            "active": True,
+        }
+        for p in range(num_participants)
+    ]
+    matches = [
+        {
+            "id": tournament_id * 1000 + m,
+            "challonge_id": tournament_id * 100 + m,
+            "player1": {"id": 100_000 + 2 * m % num_participants, "vote": "1️⃣"},
+            "player2": {"id": 100_000 + (2 * m + 1) % num_participants, "vote": "1️⃣"},
+            "round": m // 4 + 1,
+            "opened_at": datetime(2023, 1, 1),
+            "completed": False if active else datetime(2023, 1, 1),
+            "winner_emote": None if active else "1️⃣",
+            "next_matches": [tournament_id * 1000 + m + 1],
+        }
+        for m in range(num_participants - 1)
+    ]
+    return {
+        "id": tournament_id,
+        "channel_id": GUILD_ID,
+        "title": f"Tournament {i}",
+        "tournament_type": "double elimination",
+        "author": {"id": 1, "username": "bench", "avatar_url": "https://example.com"},
+        "challonge": {"id": tournament_id, "url": f"https://challonge.com/t{i}"},
+        "image_url": "https://i.imgur.com/example.png",
+        "start_time": datetime(2023, 1, 1),
+        "completed": False if active else datetime(2023, 1, 1),
+        "open": False,
+        "in_progress": active,
+        "max_participants": num_participants,
+        "num_rounds": 4,
+        "participants": participants,
+        "matches": matches,
+    }
+
+
+def build_guild(num_tournaments: int, num_participants: int) -> dict:
+    """Creates a guild document with num_tournaments tournaments; the last one is active."""
+    return {
+        "guild_id": GUILD_ID,
+        "name": "bench",
+        "config": {"create_events": False},
+        "tournaments": [
+            make_tournament(i, num_participants, i == num_tournaments - 1)
+            for i in range(num_tournaments)
+        ],
+        "challenges": [
+            {"id": c, "player1": {"id": 1}, "player2": {"id": 2}, "completed": True}
+            for c in range(num_tournaments)
+        ],
+        "leaderboard": [
+            {
+                "id": u,
+                "name": f"user-{u}",
+                "wins": 10,
+                "losses": 10,
+                "matches": [0] * 20,
+            }
+            for u in range(num_participants * 4)
+        ],
+    }
+
+
+def normalized_documents(db_guild: dict, tournament_filter=None) -> list:
+    """Returns the documents a normalized read of the guild would transfer."""
+    guild_id = db_guild["guild_id"]
+    documents = [schema.guild_header(db_guild)]
+    for db_tournament in db_guild["tournaments"]:
+        if tournament_filter and not tournament_filter(db_tournament):
+            continue
+        tournament_doc, participant_docs, match_docs = schema.split_tournament(
+            guild_id, db_tournament
+        )
+        documents += [tournament_doc, *participant_docs, *match_docs]
+    if not tournament_filter:
+        for array in (CHALLENGES, LEADERBOARD):
+            documents += [{**doc, "guild_id": guild_id} for doc in db_guild[array]]
+    return documents
+
+
+def measure(documents: list, repeat: int):
+    """Returns the encoded size and the mean decode time of a list of documents."""
+    payload = b"".join(bson.encode(document) for document in documents)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        bson.decode_all(payload)
+    return len(payload), (time.perf_counter() - start) / repeat
+
+
+def main(num_tournaments: int, num_participants: int, repeat: int):
+    db_guild = build_guild(num_tournaments, num_participants)
+    reads = {
+        "embedded": [db_guild],
+        "full": normalized_documents(db_guild),
+        "active": normalized_documents(
+            db_guild,
+            lambda t: t["in_progress"] and not t["completed"],
+        ),
+    }
+    for name, documents in reads.items():
+        size, decode_time = measure(documents, repeat)
+        print(
+            f"{name:>8}: docs={len(documents):<6} bytes={size:<10} decode={decode_time * 1000:.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Guild read projection benchmark.")
+    parser.add_argument("--tournaments", type=int, default=500)
+    parser.add_argument("--participants", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.tournaments, args.participants, args.repeat)
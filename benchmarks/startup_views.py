@@ -0,0 +1,138 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+import db.mdb as mdb
+from db import schema
+from guilds import guild as _guild
+from modules import participant as _participant
+from modules import tournament as _tournament
+from utils.constants import GUILDS, MATCHES, PARTICIPANTS, TOURNAMENTS
+
+# startup_views.py
+# Benchmark: finding the messages that need persistent views when the bot starts.
+# Usage: python -m benchmarks.startup_views [--guilds 20] [--history 50 200] [--participants 16]
+#
+# Seeds bench guilds into the configured database, each with a number of completed
+# tournaments (history), one tournament open for registration and one in progress.
+# Then times the old startup scan (every guild with all of its tournaments, then a
+# participant lookup per open match) against schema.find_persistent_views, once per
+# history size. Bench documents are removed afterwards.
+
+BENCH_GUILD_OFFSET = 900_000_000_000
+
+
+def make_tournament(guild_id: int, i: int, num_participants: int, state: str):
+    """Returns the tournament, participant and match documents of a bench tournament."""
+    tournament_id = guild_id * 1000 + i
+    completed = datetime(2023, 1, 1) if state == "completed" else False
+    tournament = {
+        "guild_id": guild_id,
+        "id": tournament_id,
+        "title": f"Tournament {i}",
+        "challonge": {"id": tournament_id, "url": "https://challonge.com/bench"},
+        "completed": completed,
+        "in_progress": state == "active",
+        "max_participants": num_participants,
+    }
+    participants = [
+        {
+            "guild_id": guild_id,
+            "tournament_id": tournament_id,
+            "id": p,
+            "challonge_id": tournament_id * 100 + p,
+            "name": f"player-{p}",
+            "active": True,
+        }
+        for p in range(num_participants)
+    ]
+    matches = [
+        {
+            "guild_id": guild_id,
+            "tournament_id": tournament_id,
+            "id": tournament_id * 1000 + m,
+            "challonge_id": tournament_id * 100 + m,
+            "player1": {"id": 2 * m % num_participants, "vote": None},
+            "player2": {"id": (2 * m + 1) % num_participants, "vote": None},
+            "completed": False if state == "active" and m % 2 else completed,
+            "next_matches": [],
+        }
+        for m in range(num_participants - 1 if state != "registration" else 0)
+    ]
+    return tournament, participants, matches
+
+
+def seed(num_guilds: int, history: int, num_participants: int):
+    """Inserts the bench guilds and their tournaments."""
+    documents = {GUILDS: [], TOURNAMENTS: [], PARTICIPANTS: [], MATCHES: []}
+    for g in range(num_guilds):
+        guild_id = BENCH_GUILD_OFFSET + g
+        documents[GUILDS].append({"guild_id": guild_id, "name": f"bench-{g}"})
+        states = ["completed"] * history + ["registration", "active"]
+        for i, state in enumerate(states):
+            tournament, participants, matches = make_tournament(
+                guild_id, i, num_participants, state
+            )
+            documents[TOURNAMENTS].append(tournament)
+            documents[PARTICIPANTS] += participants
+            documents[MATCHES] += matches
+    for collection, docs in documents.items():
+        if docs:
+            mdb.db[collection].insert_many(docs)
+
+
+def clean():
+    """Removes every bench document."""
+    for collection in (GUILDS, TOURNAMENTS, PARTICIPANTS, MATCHES):
+        mdb.db[collection].delete_many({"guild_id": {"$gte": BENCH_GUILD_OFFSET}})
+
+
+async def scan_guilds() -> int:
+    """The old setup_hook: loads every guild and rebuilds the views of its tournaments."""
+    views = 0
+    for db_guild in await _guild.get_all_guilds():
+        views += len(_tournament.find_registration_tournaments(db_guild))
+        active_tournament = _tournament.find_active_tournament(db_guild)
+        if active_tournament:
+            for match in active_tournament["matches"]:
+                if not match["completed"]:
+                    _participant.find_participant(
+                        active_tournament, match["player1"]["id"]
+                    )
+                    _participant.find_participant(
+                        active_tournament, match["player2"]["id"]
+                    )
+                    views += 1
+    return views
+
+
+async def find_views() -> int:
+    """The new setup_hook: reads only the open work."""
+    registration_ids, open_matches = await schema.find_persistent_views()
+    return len(registration_ids) + len(open_matches)
+
+
+async def main(num_guilds: int, histories: list, num_participants: int):
+    await schema.ensure_indexes()
+    for history in histories:
+        seed(num_guilds, history, num_participants)
+        try:
+            for name, load in (("scan", scan_guilds), ("indexed", find_views)):
+                start = time.perf_counter()
+                views = await load()
+                elapsed = time.perf_counter() - start
+                print(
+                    f"history={history:<5} {name:>8}: views={views:<6} time={elapsed * 1000:.1f}ms"
+                )
+        finally:
+            clean()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup view registration benchmark.")
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--history", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--participants", type=int, default=16)
+    args = parser.parse_args()
+    asyncio.run(main(args.guilds, args.history, args.participants))
@@ -0,0 +1,258 @@
+import asyncio
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from utils.constants import (
+    CHALLENGES,
+    GUILDS,
+    LEADERBOARD,
+    MATCHES,
+    PARTICIPANTS,
+    TOURNAMENTS,
+)
+from utils.log import printlog
+
+# cache.py
+# In-process cache of loaded guild documents
+#
+# find_guild results are cached by guild id and by the array filters/projections they were
+# loaded with, since handlers load different parts of a guild. Callers get their own copy,
+# so in-memory edits never leak into the cache. Every write made through mdb to a guild
+# collection drops that guild's entries before the next read (writes are not patched into
+# cached copies, since most are update operators whose result is not returned). Entries
+# also expire after GUILD_CACHE_TTL seconds, and the least recently used entries are evicted
+# beyond GUILD_CACHE_SIZE. With several bot processes on one database, set
+# GUILD_CACHE_CHANGE_STREAM=1 to also drop entries on writes made by the other processes
+# (requires a replica set).
+
+GUILD_CACHE_TTL = float(os.getenv("GUILD_CACHE_TTL", 60))
+GUILD_CACHE_SIZE = int(os.getenv("GUILD_CACHE_SIZE", 512))
+GUILD_CACHE_CHANGE_STREAM = os.getenv("GUILD_CACHE_CHANGE_STREAM", "0") == "1"
+
+# Collections whose documents are part of a cached guild
+CACHED_COLLECTIONS = (
+    GUILDS,
+    TOURNAMENTS,
+    CHALLENGES,
+    LEADERBOARD,
+    PARTICIPANTS,
+    MATCHES,
+)
+
+# Cached guilds by key, least recently used first: {key: {"guild_id", "document", "reads", "expires_at"}}
+guild_cache = OrderedDict()
+guild_cache_stats = {
+    "hits": 0,
+    "misses": 0,
+    "reads_saved": 0,
+    "invalidations": 0,
+    "evictions": 0,
+    "expirations": 0,
+    "interactions": 0,
+}
+
+# Bumped on every invalidation, so that reads which started before a write are not cached
+_generations = defaultdict(int)
+_global_generation = 0
+
+_watcher: threading.Thread = None
+_watcher_stop = threading.Event()
+
+
+def make_key(guild_id: int, arrays: dict = None, projections: dict = None) -> tuple:
+    """Returns the cache key of a guild read.
+
+    Args:
+        guild_id (int): The target guild id.
+        arrays (dict, optional): The array filters of the read. Defaults to None.
+        projections (dict, optional): The array projections of the read. Defaults to None.
+
+    Returns:
+        tuple: The cache key.
+    """
+    return (
+        guild_id,
+        json.dumps(arrays, sort_keys=True, default=str),
+        json.dumps(projections, sort_keys=True, default=str),
+    )
+
+
+def stamp(guild_id: int) -> tuple:
+    """Returns the current generation of a guild. Take it before reading from the database.
+
+    Args:
+        guild_id (int): The target guild id.
+
+    Returns:
+        tuple: The generation stamp, to pass to put.
+    """
+    return (_global_generation, _generations[guild_id])
+
+
+def get(key: tuple):
+    """Returns a copy of a cached guild and marks it as recently used.
+
+    Args:
+        key (tuple): The cache key (see make_key).
+
+    Returns:
+        A copy of the cached guild document if found and not expired. Otherwise, None.
+    """
+    entry = guild_cache.get(key)
+    if entry is not None and entry["expires_at"] <= time.monotonic():
+        del guild_cache[key]
+        guild_cache_stats["expirations"] += 1
+        entry = None
+    if entry is None:
+        guild_cache_stats["misses"] += 1
+        return None
+    guild_cache_stats["hits"] += 1
+    guild_cache_stats["reads_saved"] += entry["reads"]
+    guild_cache.move_to_end(key)
+    return copy.deepcopy(entry["document"])
+
+
+def put(key: tuple, db_guild: dict, guild_stamp: tuple, reads: int = 1):
+    """Caches a copy of a guild read, unless the guild was written to since the read started.
+
+    Args:
+        key (tuple): The cache key (see make_key).
+        db_guild (dict): The guild document that was read.
+        guild_stamp (tuple): The generation stamp taken before the read.
+        reads (int, optional): The number of database queries the read took. Defaults to 1.
+    """
+    guild_id = key[0]
+    if guild_stamp != stamp(guild_id):
+        return
+    guild_cache[key] = {
+        "guild_id": guild_id,
+        "document": copy.deepcopy(db_guild),
+        "reads": reads,
+        "expires_at": time.monotonic() + GUILD_CACHE_TTL,
+    }
+    guild_cache.move_to_end(key)
+    while len(guild_cache) > GUILD_CACHE_SIZE:
+        guild_cache.popitem(last=False)
+        guild_cache_stats["evictions"] += 1
+
+
+def invalidate(guild_id: int = None):
+    """Drops the cached reads of a guild, or of every guild if no id is given.
+
+    Args:
+        guild_id (int, optional): The target guild id. Defaults to None.
+    """
+    global _global_generation
+    guild_cache_stats["invalidations"] += 1
+    if guild_id is None:
+        _global_generation += 1
+        guild_cache.clear()
+        return
+    _generations[guild_id] += 1
+    for key in [
+        key for key, entry in guild_cache.items() if entry["guild_id"] == guild_id
+    ]:
+        del guild_cache[key]
+
+
+def invalidate_write(collection: str, documents: list):
+    """Drops the cached guilds affected by a write.
+
+    Args:
+        collection (str): The written collection.
+        documents (list): The write filters or inserted documents. A guild is only targeted if every one of them has a "guild_id".
+    """
+    if collection not in CACHED_COLLECTIONS:
+        return
+    guild_ids = {
+        document.get("guild_id") if isinstance(document, dict) else None
+        for document in documents
+    }
+    if (
+        not guild_ids
+        or None in guild_ids
+        or not all(isinstance(guild_id, int) for guild_id in guild_ids)
+    ):
+        invalidate()
+        return
+    for guild_id in guild_ids:
+        invalidate(guild_id)
+
+
+def record_interaction():
+    """Counts a Discord interaction, for the reads saved per interaction."""
+    guild_cache_stats["interactions"] += 1
+
+
+def cache_info() -> dict:
+    """Returns the counters and size of the guild cache."""
+    lookups = guild_cache_stats["hits"] + guild_cache_stats["misses"]
+    interactions = guild_cache_stats["interactions"]
+    return {
+        **guild_cache_stats,
+        "size": len(guild_cache),
+        "hit_rate": guild_cache_stats["hits"] / lookups if lookups else 0,
+        "reads_saved_per_interaction": (
+            guild_cache_stats["reads_saved"] / interactions if interactions else 0
+        ),
+    }
+
+
+def watch_changes(database, loop: asyncio.AbstractEventLoop):
+    """Drops cached guilds on every change to the guild collections. Runs on its own thread
+    until stop_change_stream is called, reconnecting after errors.
+
+    Args:
+        database (Database): The PyMongo database.
+        loop (asyncio.AbstractEventLoop): The event loop that owns the cache.
+    """
+    pipeline = [{"$match": {"ns.coll": {"$in": list(CACHED_COLLECTIONS)}}}]
+    resume_token = None
+    while not _watcher_stop.is_set():
+        try:
+            with database.watch(
+                pipeline, full_document="updateLookup", resume_after=resume_token
+            ) as stream:
+                while not _watcher_stop.is_set():
+                    change = stream.try_next()
+                    if change is None:
+                        continue
+                    resume_token = stream.resume_token
+                    # Deleted documents have no guild_id left, so every guild is dropped
+                    guild_id = (change.get("fullDocument") or {}).get("guild_id")
+                    loop.call_soon_threadsafe(invalidate, guild_id)
+        except Exception as e:
+            printlog("Guild cache change stream failed; reconnecting.", e)
+            loop.call_soon_threadsafe(invalidate)
+            _watcher_stop.wait(5)
+
+
+def start_change_stream(database):
+    """Starts invalidating cached guilds from MongoDB change streams, if enabled.
+    Must be called from within the running event loop.
+
+    Args:
+        database (Database): The PyMongo database.
+    """
+    global _watcher
+    if not GUILD_CACHE_CHANGE_STREAM or _watcher is not None:
+        return
+    _watcher_stop.clear()
+    _watcher = threading.Thread(
+        target=watch_changes,
+        args=(database, asyncio.get_running_loop()),
+        name="guild-cache-watcher",
+        daemon=True,
+    )
+    _watcher.start()
+
+
+def stop_change_stream():
+    """Stops the change stream thread, if it is running."""
+    global _watcher
+    _watcher_stop.set()
+    _watcher = None
@@ -0,0 +1,146 @@
+import os
+import threading
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
+
+# client.py
+# The MongoDB client shared by every module
+#
+# The client is created on first use with the settings below, and is created with
+# connect=False so that importing a module does not open a connection; the first query
+# (ex. ensure_indexes in setup_hook) does. Connection pool events are counted by a
+# listener, so pool usage can be reported with pool_stats.
+
+load_dotenv()
+
+MONGO_ADDR = os.getenv("MONGO")
+MONGO_DATABASE = os.getenv("MONGO_DATABASE", "beta-bot")
+# Largest and smallest number of open connections per server
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+# Milliseconds to wait for a suitable server before a query fails
+MONGO_SERVER_SELECTION_TIMEOUT = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT", 5000))
+# Write concern "w" value, ex. 1 or majority
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "majority")
+# Read preference name, ex. primary, primaryPreferred, secondaryPreferred, nearest
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+
+
+class PoolStatsListener(ConnectionPoolListener):
+    """Counts connection pool events. Called from PyMongo's threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {
+            "created": 0,
+            "closed": 0,
+            "checked_out": 0,
+            "checked_in": 0,
+            "checkout_failures": 0,
+            "in_use": 0,
+            "max_in_use": 0,
+            "pool_clears": 0,
+        }
+
+    def count(self, *names: str):
+        with self.lock:
+            for name in names:
+                self.stats[name] += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.count("pool_clears")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.count("created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.count("closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.count("checkout_failures")
+
+    def connection_checked_out(self, event):
+        with self.lock:
+            self.stats["checked_out"] += 1
+            self.stats["in_use"] += 1
+            self.stats["max_in_use"] = max(
+                self.stats["max_in_use"], self.stats["in_use"]
+            )
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.stats["checked_in"] += 1
+            self.stats["in_use"] -= 1
+
+
+pool_listener = PoolStatsListener()
+_client: MongoClient = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> MongoClient:
+    """Returns the shared MongoDB client, creating it on first use.
+
+    Returns:
+        MongoClient: The client. No connection is opened until the first query.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            write_concern = MONGO_WRITE_CONCERN
+            _client = MongoClient(
+                MONGO_ADDR,
+                connect=False,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT,
+                w=int(write_concern) if write_concern.isdigit() else write_concern,
+                readPreference=MONGO_READ_PREFERENCE,
+                event_listeners=[pool_listener],
+            )
+        return _client
+
+
+def get_database(name: str = MONGO_DATABASE):
+    """Returns a database of the shared client.
+
+    Args:
+        name (str, optional): The database name. Defaults to MONGO_DATABASE.
+
+    Returns:
+        Database: The PyMongo database.
+    """
+    return get_client()[name]
+
+
+def pool_stats() -> dict:
+    """Returns the connection pool counters and settings of the shared client."""
+    with pool_listener.lock:
+        stats = dict(pool_listener.stats)
+    stats["max_pool_size"] = MONGO_MAX_POOL_SIZE
+    stats["min_pool_size"] = MONGO_MIN_POOL_SIZE
+    return stats
+
+
+def close_client():
+    """Closes the connection pools of the shared client, if it was created."""
+    with _client_lock:
+        if _client is not None:
+            _client.close()
@@ -0,0 +1,493 @@
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+
+from db import mdb, schema
+from utils.constants import EVENTS, SNAPSHOTS, TOURNAMENTS
+from utils.log import printlog
+
+# eventlog.py
+# Tournament event log
+#
+# Every change to a tournament is appended to the events collection (ex. vote_cast,
+# match_reported, participant_joined) and then applied to the tournaments, participants
+# and matches collections, which hold the current state. An event stores the facts of the
+# change ("data") and the writes that apply it ("writes"). Writes only set fields, add to
+# sets, put whole documents or delete documents, so applying an event again has no effect.
+#
+# An event is committed once it is logged. If its writes cannot all be applied, the events
+# from that one on are applied again, in order, before the next event of the tournament.
+#
+# Every EVENT_SNAPSHOT_INTERVAL events, the state of the tournament is saved as a snapshot.
+# On startup, the events after the latest snapshot of every incomplete tournament are
+# applied again, which completes any change that was logged but not applied before a
+# crash. A snapshot is also saved when a tournament starts; resetting the tournament
+# returns to it and truncates the log.
+
+# Events logged between periodic snapshots of a tournament
+EVENT_SNAPSHOT_INTERVAL = int(os.getenv("EVENT_SNAPSHOT_INTERVAL", 50))
+
+# Kinds of snapshots; only the latest of each kind is kept
+PERIODIC = "periodic"
+START = "start"
+
+# Events are logged and applied one at a time per tournament id
+event_locks = defaultdict(asyncio.Lock)
+# Events logged since the latest snapshot by tournament id; counted on first use
+events_since_snapshot = {}
+# The oldest logged event whose writes have not all been applied, by tournament id
+unapplied_events = {}
+
+
+############
+## WRITES ##
+############
+
+
+def set_fields(collection: str, document_id: int, fields: dict) -> dict:
+    """Returns a write that sets fields of a document. Dotted paths set nested fields.
+
+    Args:
+        collection (str): The target collection (tournaments, participants or matches).
+        document_id (int): The id of the target document.
+        fields (dict): The new values by field path.
+    """
+    # Paths are stored as pairs, since stored field names cannot contain dots
+    return {
+        "op": "set",
+        "in": collection,
+        "id": document_id,
+        "fields": [[path, value] for path, value in fields.items()],
+    }
+
+
+def add_to_set(collection: str, document_id: int, field: str, value) -> dict:
+    """Returns a write that adds a value to an array field of a document, unless it is
+    already there."""
+    return {
+        "op": "add",
+        "in": collection,
+        "id": document_id,
+        "field": field,
+        "value": value,
+    }
+
+
+def put(collection: str, document: dict) -> dict:
+    """Returns a write that inserts a participant or match document, or replaces it."""
+    return {"op": "put", "in": collection, "document": schema.strip_document(document)}
+
+
+def delete(collection: str, document_ids: list) -> dict:
+    """Returns a write that deletes participant or match documents."""
+    return {"op": "delete", "in": collection, "ids": list(document_ids)}
+
+
+def retain(collection: str, document_ids: list) -> dict:
+    """Returns a write that deletes every participant or match document of the tournament
+    except the given ones."""
+    return {"op": "retain", "in": collection, "ids": list(document_ids)}
+
+
+def writes_from_update(collection: str, document_id: int, update_obj: dict) -> list:
+    """Translates $set and $addToSet update operators to writes.
+
+    Args:
+        collection (str): The target collection.
+        document_id (int): The id of the target document.
+        update_obj (dict): The update operators (ex. {"$set": {"player1.vote": "1️⃣"}}).
+
+    Raises:
+        ValueError: If the update uses any other operator.
+
+    Returns:
+        list: The writes.
+    """
+    writes = []
+    for operator, fields in update_obj.items():
+        if operator == "$set":
+            writes.append(set_fields(collection, document_id, fields))
+        elif operator == "$addToSet":
+            writes += [
+                add_to_set(collection, document_id, field, value)
+                for field, value in fields.items()
+            ]
+        else:
+            raise ValueError(f"Update operator '{operator}' cannot be logged.")
+    return writes
+
+
+def diff_tournament(old_tournament: dict, new_tournament: dict) -> list:
+    """Returns the writes that turn one version of a tournament into another.
+    Only the fields and documents that differ are written.
+
+    Args:
+        old_tournament (dict): The stored tournament document in the embedded format.
+        new_tournament (dict): The new tournament document in the embedded format.
+
+    Returns:
+        list: The writes.
+    """
+    tournament_id = new_tournament["id"]
+    writes = []
+    fields = {
+        key: value
+        for key, value in new_tournament.items()
+        if key not in schema.TOURNAMENT_ARRAYS
+        and key != "_id"
+        and old_tournament.get(key) != value
+    }
+    if fields:
+        writes.append(set_fields(TOURNAMENTS, tournament_id, fields))
+    for collection in schema.TOURNAMENT_ARRAYS:
+        old_documents = {
+            document["id"]: document for document in old_tournament.get(collection, [])
+        }
+        new_ids = []
+        for document in new_tournament.get(collection, []):
+            new_ids.append(document["id"])
+            old_document = old_documents.get(document["id"])
+            if old_document is None:
+                writes.append(put(collection, document))
+                continue
+            fields = {
+                key: value
+                for key, value in document.items()
+                if key != "_id" and old_document.get(key) != value
+            }
+            if fields:
+                writes.append(set_fields(collection, document["id"], fields))
+        removed_ids = set(old_documents) - set(new_ids)
+        if removed_ids:
+            writes.append(delete(collection, removed_ids))
+    return writes
+
+
+def build_requests(guild_id: int, tournament_id: int, writes: list) -> dict:
+    """Translates writes to PyMongo write operations.
+
+    Args:
+        guild_id (int): The id of the guild the tournament belongs to.
+        tournament_id (int): The id of the tournament.
+        writes (list): The writes, in order.
+
+    Returns:
+        dict: The write operations by collection, in order.
+    """
+    requests = {}
+    for write in writes:
+        collection = write["in"]
+        if collection == TOURNAMENTS:
+            target = {"guild_id": guild_id, "id": write["id"]}
+        else:
+            target = {"guild_id": guild_id, "tournament_id": tournament_id}
+        op = write["op"]
+        if op == "set":
+            request = UpdateOne(
+                {**target, "id": write["id"]}, {"$set": dict(write["fields"])}
+            )
+        elif op == "add":
+            request = UpdateOne(
+                {**target, "id": write["id"]},
+                {"$addToSet": {write["field"]: write["value"]}},
+            )
+        elif op == "put":
+            document = {**write["document"], **target}
+            request = ReplaceOne(
+                {**target, "id": document["id"]}, document, upsert=True
+            )
+        elif op == "delete":
+            request = DeleteMany({**target, "id": {"$in": write["ids"]}})
+        else:
+            request = DeleteMany({**target, "id": {"$nin": write["ids"]}})
+        requests.setdefault(collection, []).append(request)
+    return requests
+
+
+async def apply(guild_id: int, tournament_id: int, writes: list) -> bool:
+    """Applies writes to the tournament collections.
+
+    Returns:
+        bool: True if every write was applied. Otherwise, False.
+    """
+    for collection, requests in build_requests(guild_id, tournament_id, writes).items():
+        if await mdb.bulk_write(requests, collection) is None:
+            return False
+    return True
+
+
+#########
+## LOG ##
+#########
+
+
+async def log(
+    guild_id: int,
+    tournament_id: int,
+    event_type: str,
+    writes: list,
+    data: dict = None,
+) -> bool:
+    """Appends an event to the log of a tournament and applies its writes.
+
+    Args:
+        guild_id (int): The id of the guild the tournament belongs to.
+        tournament_id (int): The id of the tournament.
+        event_type (str): The type of the event (ex. "vote_cast").
+        writes (list): The writes of the event (see set_fields, put, ...).
+        data (dict, optional): The facts of the event. Defaults to None.
+
+    Returns:
+        bool: True if the event was logged. Otherwise, False. Writes that fail to apply are
+        applied again with the next event of the tournament, or on startup.
+    """
+    if not writes:
+        return True
+    event = {
+        "guild_id": guild_id,
+        "tournament_id": tournament_id,
+        "type": event_type,
+        "data": data or {},
+        "writes": writes,
+        "created_at": datetime.now(tz=timezone.utc),
+    }
+    async with event_locks[tournament_id]:
+        event_id = await mdb.add_document(event, EVENTS)
+        if not event_id:
+            printlog(
+                f"Failed to log event ['type'='{event_type}'] of tournament ['id'={tournament_id}]."
+            )
+            return False
+        # Earlier events that were not fully applied go first, so writes stay in order
+        first_unapplied = unapplied_events.setdefault(tournament_id, event_id)
+        if first_unapplied == event_id:
+            applied = await apply(guild_id, tournament_id, writes)
+        else:
+            applied = await apply_since(guild_id, tournament_id, first_unapplied)
+        if not applied:
+            printlog(
+                f"Failed to apply event ['type'='{event_type}'] of tournament ['id'={tournament_id}]; it will be applied again."
+            )
+            return True
+        del unapplied_events[tournament_id]
+        await count_event(guild_id, tournament_id, event_id)
+    return True
+
+
+async def apply_since(guild_id: int, tournament_id: int, event_id) -> bool:
+    """Applies the writes of a tournament's events again, from the given event on.
+    Must be called while holding the tournament's event lock.
+
+    Returns:
+        bool: True if every write was applied. Otherwise, False.
+    """
+    events = await mdb.find_documents(
+        {"tournament_id": tournament_id, "_id": {"$gte": event_id}},
+        EVENTS,
+        sort=schema.INSERTION_ORDER,
+    )
+    if events is None:
+        return False
+    writes = [write for event in events for write in event["writes"]]
+    return not writes or await apply(guild_id, tournament_id, writes)
+
+
+async def count_event(guild_id: int, tournament_id: int, event_id):
+    """Counts a logged event, and saves a snapshot every EVENT_SNAPSHOT_INTERVAL events.
+    Must be called while holding the tournament's event lock.
+    """
+    if tournament_id in events_since_snapshot:
+        events_since_snapshot[tournament_id] += 1
+    else:
+        snapshot = await find_snapshot(tournament_id)
+        target = {"tournament_id": tournament_id}
+        # A snapshot saved before any event was logged has no event id
+        if snapshot and snapshot["event_id"]:
+            target["_id"] = {"$gt": snapshot["event_id"]}
+        events = await mdb.find_documents(target, EVENTS, projection={"_id": 1})
+        events_since_snapshot[tournament_id] = len(events or [])
+    if events_since_snapshot[tournament_id] >= EVENT_SNAPSHOT_INTERVAL:
+        if await save_snapshot(guild_id, tournament_id, event_id, PERIODIC):
+            events_since_snapshot[tournament_id] = 0
+
+
+###############
+## SNAPSHOTS ##
+###############
+
+
+async def find_snapshot(tournament_id: int, kind: str = None):
+    """Returns the latest snapshot of a tournament, optionally of one kind.
+
+    Returns:
+        The snapshot document if found. Otherwise, None.
+    """
+    target = {"tournament_id": tournament_id}
+    if kind:
+        target["kind"] = kind
+    return await mdb.find_most_recent_document(target, SNAPSHOTS)
+
+
+async def save_snapshot(guild_id: int, tournament_id: int, event_id, kind: str):
+    """Saves the current state of a tournament, and removes the previous snapshot of the
+    same kind. Must be called while holding the tournament's event lock.
+
+    Args:
+        guild_id (int): The id of the guild the tournament belongs to.
+        tournament_id (int): The id of the tournament.
+        event_id (ObjectId): The id of the latest event included in the state.
+        kind (str): The kind of snapshot (PERIODIC or START).
+
+    Returns:
+        The id of the snapshot if successful. Otherwise, None.
+    """
+    # Never snapshot a partial read, since resets and replays delete whatever it leaves out
+    tournaments = await schema.find_tournaments(
+        {"guild_id": guild_id, "id": tournament_id}, strict=True
+    )
+    if not tournaments:
+        printlog(
+            f"Failed to read tournament [id={tournament_id}] for a {kind} snapshot."
+        )
+        return None
+    state = dict(tournaments[0])
+    for array in schema.TOURNAMENT_ARRAYS:
+        state[array] = list(state[array])
+    snapshot_id = await mdb.add_document(
+        {
+            "guild_id": guild_id,
+            "tournament_id": tournament_id,
+            "kind": kind,
+            "event_id": event_id,
+            "state": state,
+            "created_at": datetime.now(tz=timezone.utc),
+        },
+        SNAPSHOTS,
+    )
+    if snapshot_id:
+        await mdb.delete_documents(
+            {"tournament_id": tournament_id, "kind": kind, "_id": {"$lt": snapshot_id}},
+            SNAPSHOTS,
+        )
+    return snapshot_id
+
+
+async def mark_start(guild_id: int, tournament_id: int) -> bool:
+    """Saves the state of a tournament before it starts, for reset_to_start.
+
+    Returns:
+        bool: True if successful. Otherwise, False.
+    """
+    async with event_locks[tournament_id]:
+        # The snapshot must not miss writes that are still to be applied
+        first_unapplied = unapplied_events.get(tournament_id)
+        if first_unapplied:
+            if not await apply_since(guild_id, tournament_id, first_unapplied):
+                return False
+            del unapplied_events[tournament_id]
+        latest = await mdb.find_most_recent_document(
+            {"tournament_id": tournament_id}, EVENTS
+        )
+        snapshot_id = await save_snapshot(
+            guild_id, tournament_id, latest["_id"] if latest else None, START
+        )
+    return snapshot_id is not None
+
+
+async def reset_to_start(
+    guild_id: int, tournament_id: int, fields: dict = None, data: dict = None
+) -> bool:
+    """Returns a tournament to the state it was in before it started, and truncates its log.
+    The reset is logged as a single event, so an interrupted reset is completed on startup.
+
+    Args:
+        guild_id (int): The id of the guild the tournament belongs to.
+        tournament_id (int): The id of the tournament.
+        fields (dict, optional): Tournament fields to set on top of the saved state. Defaults to None.
+        data (dict, optional): The facts of the reset event. Defaults to None.
+
+    Returns:
+        bool: True if successful. False if the tournament has no start snapshot, or on error.
+    """
+    snapshot = await find_snapshot(tournament_id, START)
+    if not snapshot:
+        return False
+    state = snapshot["state"]
+    tournament_fields = {
+        key: value
+        for key, value in state.items()
+        if key not in schema.TOURNAMENT_ARRAYS and key != "_id"
+    }
+    writes = [
+        set_fields(TOURNAMENTS, tournament_id, {**tournament_fields, **(fields or {})})
+    ]
+    for collection in schema.TOURNAMENT_ARRAYS:
+        writes += [put(collection, document) for document in state[collection]]
+        writes.append(
+            retain(collection, [document["id"] for document in state[collection]])
+        )
+    if not await log(guild_id, tournament_id, "tournament_reset", writes, data):
+        return False
+
+    # Truncate the events and snapshots logged since the start
+    async with event_locks[tournament_id]:
+        reset_event = await mdb.find_most_recent_document(
+            {"tournament_id": tournament_id, "type": "tournament_reset"}, EVENTS
+        )
+        target = {"tournament_id": tournament_id, "_id": {"$lt": reset_event["_id"]}}
+        if snapshot["event_id"]:
+            target["_id"]["$gt"] = snapshot["event_id"]
+        await mdb.delete_documents(target, EVENTS)
+        await mdb.delete_documents(
+            {"tournament_id": tournament_id, "_id": {"$gt": snapshot["_id"]}}, SNAPSHOTS
+        )
+        events_since_snapshot.pop(tournament_id, None)
+    return True
+
+
+##############
+## RECOVERY ##
+##############
+
+
+async def replay(guild_id: int, tournament_id: int) -> int:
+    """Applies the events logged after the latest snapshot of a tournament again.
+
+    Returns:
+        int: The number of events applied if successful. Otherwise, -1.
+    """
+    async with event_locks[tournament_id]:
+        snapshot = await find_snapshot(tournament_id)
+        target = {"tournament_id": tournament_id}
+        if snapshot and snapshot["event_id"]:
+            target["_id"] = {"$gt": snapshot["event_id"]}
+        events = await mdb.find_documents(target, EVENTS, sort=schema.INSERTION_ORDER)
+        if events is None:
+            return -1
+        writes = [write for event in events for write in event["writes"]]
+        if writes and not await apply(guild_id, tournament_id, writes):
+            return -1
+        unapplied_events.pop(tournament_id, None)
+        events_since_snapshot[tournament_id] = len(events)
+    return len(events)
+
+
+async def recover():
+    """Completes the changes that were logged but not applied before the bot stopped, by
+    replaying the log of every incomplete tournament since its latest snapshot."""
+    tournaments = await mdb.find_documents(
+        {"completed": False}, TOURNAMENTS, projection={"guild_id": 1, "id": 1}
+    )
+    replayed = 0
+    for tournament in tournaments or []:
+        count = await replay(tournament["guild_id"], tournament["id"])
+        if count < 0:
+            printlog(
+                f"Failed to replay the event log of tournament ['id'={tournament['id']}]."
+            )
+        replayed += max(count, 0)
+    if replayed:
+        printlog(f"Replayed {replayed} tournament events.")
@@ -1,10 +1,14 @@
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pprint import pprint
 
 from discord import Message
 from dotenv import load_dotenv
-from pymongo import DESCENDING, MongoClient, ReturnDocument
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
 
+from db import cache, client
 from utils.log import printlog
 
 # mdb.py
@@ -12,10 +16,29 @@ from utils.log import printlog
 
 load_dotenv()
 
-MONGO_ADDR = os.getenv("MONGO")
+MONGO_WORKERS = int(os.getenv("MONGO_WORKERS", 10))
 
-db_client = MongoClient(MONGO_ADDR)
-db = db_client["beta-bot"]
+# The shared client (see db/client.py); no connection is opened until the first query
+db = client.get_database()
+
+# PyMongo is blocking; every call is run on a bounded pool of worker threads so that
+# the discord.py event loop keeps serving other interactions during the round-trip.
+db_executor = ThreadPoolExecutor(max_workers=MONGO_WORKERS, thread_name_prefix="mdb")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Runs a blocking database call on the database executor and awaits the result.
+
+    Args:
+        func (Callable): The blocking function to call.
+        *args: Positional arguments passed to the function.
+        **kwargs: Keyword arguments passed to the function.
+
+    Returns:
+        The return value of the function.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(func, *args, **kwargs))
 
 
 async def find_all(collection: str, message: Message = None, response_text: str = None):
@@ -30,7 +53,7 @@ async def find_all(collection: str, message: Message = None, response_text: str
         A list of the resulting documents if successful. Otherwise, returns None.
     """
     try:
-        document_list = db[collection].find({})
+        document_list = await run_blocking(lambda: list(db[collection].find({})))
     except Exception as e:
         printlog(f"DB_ERROR: Failed to fetch collection documents [{collection}]:", e)
         return None
@@ -40,13 +63,18 @@ async def find_all(collection: str, message: Message = None, response_text: str
 
 
 async def find_document(
-    target: dict, collection: str, message: Message = None, response_text: str = None
+    target: dict,
+    collection: str,
+    projection: dict = None,
+    message: Message = None,
+    response_text: str = None,
 ):
     """Finds a single document in the specifed collection.
 
     Args:
         target (dict): The target document query.
         collection (str): The target database collection.
+        projection (dict, optional): The fields to include or exclude, including $elemMatch/$slice operators. Defaults to all fields.
         message (Message, optional): A discord message to respond to. Defaults to None.
         response_text (str, optional): The response message text. Defaults to None.
 
@@ -54,7 +82,9 @@ async def find_document(
         The result document if successful. Otherwise, returns None.
     """
     try:
-        document = db[collection].find_one(target)
+        document = await run_blocking(
+            db[collection].find_one, target, projection=projection
+        )
     except Exception as e:
         printlog(
             f"DB_ERROR: Failed to find document in [{collection}]:\ntarget=[{target}]",
@@ -66,6 +96,47 @@ async def find_document(
     return document
 
 
+async def find_documents(
+    target: dict,
+    collection: str,
+    sort: list = None,
+    projection: dict = None,
+    message: Message = None,
+    response_text: str = None,
+    limit: int = 0,
+):
+    """Finds all documents matching a query in the specified collection.
+
+    Args:
+        target (dict): The target document query.
+        collection (str): The target database collection.
+        sort (list, optional): A list of (key, direction) pairs to sort by. Defaults to insertion order.
+        projection (dict, optional): The fields to include or exclude, including $elemMatch/$slice operators. Defaults to all fields.
+        message (Message, optional): A discord message to respond to. Defaults to None.
+        response_text (str, optional): The response message text. Defaults to None.
+        limit (int, optional): The largest number of documents to return. Defaults to no limit.
+
+    Returns:
+        A list of the resulting documents if successful. Otherwise, returns None.
+    """
+    sort = sort or [("_id", ASCENDING)]
+    try:
+        document_list = await run_blocking(
+            lambda: list(
+                db[collection].find(target, projection, sort=sort, limit=limit)
+            )
+        )
+    except Exception as e:
+        printlog(
+            f"DB_ERROR: Failed to find documents in [{collection}]:\ntarget=[{target}]",
+            e,
+        )
+        return None
+    if message and response_text:
+        await message.channel.send(response_text)
+    return document_list
+
+
 async def find_subdocument(
     target_array: str,
     target_field: str,
@@ -88,11 +159,12 @@ async def find_subdocument(
         The result document if successful. Otherwise, returns None.
     """
     try:
-        document = db[collection].aggregate(
+        pipeline = [
             {"$match": {f"{target_array}.{target_field}": target_value}},
-            {"$unwind": target_array},
+            {"$unwind": f"${target_array}"},
             {"$match": {f"{target_array}.{target_field}": target_value}},
-        )
+        ]
+        document = await run_blocking(lambda: list(db[collection].aggregate(pipeline)))
     except Exception as e:
         printlog(
             f"DB_ERROR: Failed to find document in [{collection}]:\ntarget=[{target_array}.{target_field}: {target_value}]",
@@ -119,7 +191,9 @@ async def find_most_recent_document(
         The result document if successful. Otherwise, returns None.
     """
     try:
-        document = db[collection].find_one(target, sort=[("_id", DESCENDING)])
+        document = await run_blocking(
+            db[collection].find_one, target, sort=[("_id", DESCENDING)]
+        )
     except Exception as e:
         printlog(
             f"DB_ERROR: Failed to retrieve most recent document in [{collection}]:\ntarget=[{target}]",
@@ -146,10 +220,13 @@ async def add_document(
         The id of the inserted document if successful. Otherwise, returns None.
     """
     try:
-        inserted_id = db[collection].insert_one(document).inserted_id
+        result = await run_blocking(db[collection].insert_one, document)
+        inserted_id = result.inserted_id
     except Exception as e:
         printlog(f"DB_ERROR: Failed to add document to [{collection}]:", e)
         return None
+    finally:
+        cache.invalidate_write(collection, [document])
     if inserted_id:
         printlog(f"Successfully added document to [{collection}]:")
         if message and response_text:
@@ -175,13 +252,15 @@ async def delete_document(
         The result object if successful. Otherwise, returns None.
     """
     try:
-        result = db[collection].delete_one(target)
+        result = await run_blocking(db[collection].delete_one, target)
     except Exception as e:
         printlog(
             f"DB_ERROR: Failed to remove document from [{collection}]:\ntarget=[{target}]",
             e,
         )
         return None
+    finally:
+        cache.invalidate_write(collection, [target])
     if result.deleted_count > 0:
         printlog(
             f"Successfully removed document from [{collection}]:\ntarget=[{target}]"
@@ -212,8 +291,11 @@ async def update_single_document(
         The updated document if successful. Otherwise, returns None.
     """
     try:
-        document = db[collection].find_one_and_update(
-            target, update_obj, return_document=ReturnDocument.AFTER
+        document = await run_blocking(
+            db[collection].find_one_and_update,
+            target,
+            update_obj,
+            return_document=ReturnDocument.AFTER,
         )
     except Exception as e:
         printlog(
@@ -221,6 +303,8 @@ async def update_single_document(
             e,
         )
         return None
+    finally:
+        cache.invalidate_write(collection, [target])
     if document:
         printlog(f"Successfully updated document in [{collection}]:")
         if message and response_text:
@@ -231,3 +315,156 @@ async def update_single_document(
             f"Could not find/update document in [{collection}]:\ntarget=[{target}]"
         )
     return None
+
+
+async def add_documents(
+    documents: list, collection: str, message: Message = None, response_text: str = None
+):
+    """Adds a list of documents to the specified collection.
+
+    Args:
+        documents (list): The documents to add to the database.
+        collection (str): The target database collection.
+        message (Message, optional): A discord message to respond to. Defaults to None.
+        response_text (str, optional): The response message text. Defaults to None.
+
+    Returns:
+        The list of inserted ids if successful. Otherwise, returns None.
+    """
+    if not documents:
+        return []
+    try:
+        result = await run_blocking(db[collection].insert_many, documents)
+    except Exception as e:
+        printlog(f"DB_ERROR: Failed to add documents to [{collection}]:", e)
+        return None
+    finally:
+        cache.invalidate_write(collection, documents)
+    printlog(
+        f"Successfully added {len(result.inserted_ids)} documents to [{collection}]:"
+    )
+    if message and response_text:
+        await message.channel.send(response_text)
+    return result.inserted_ids
+
+
+async def delete_documents(
+    target: dict, collection: str, message: Message = None, response_text: str = None
+):
+    """Deletes all documents matching a query from the specified collection.
+
+    Args:
+        target (dict): The target document query.
+        collection (str): The target database collection.
+        message (Message, optional): A discord message to respond to. Defaults to None.
+        response_text (str, optional): The response message text. Defaults to None.
+
+    Returns:
+        The result object if successful. Otherwise, returns None.
+    """
+    try:
+        result = await run_blocking(db[collection].delete_many, target)
+    except Exception as e:
+        printlog(
+            f"DB_ERROR: Failed to remove documents from [{collection}]:\ntarget=[{target}]",
+            e,
+        )
+        return None
+    finally:
+        cache.invalidate_write(collection, [target])
+    if message and response_text:
+        await message.channel.send(response_text)
+    return result
+
+
+async def bulk_write(
+    requests: list,
+    collection: str,
+    ordered: bool = True,
+    message: Message = None,
+    response_text: str = None,
+):
+    """Sends a batch of write operations to the specified collection in a single request.
+
+    Args:
+        requests (list): A list of PyMongo write operations (e.g. UpdateOne, ReplaceOne, DeleteMany).
+        collection (str): The target database collection.
+        ordered (bool, optional): Whether the operations must be applied in order. Defaults to True.
+        message (Message, optional): A discord message to respond to. Defaults to None.
+        response_text (str, optional): The response message text. Defaults to None.
+
+    Returns:
+        The bulk write result object if successful. Otherwise, returns None.
+    """
+    if not requests:
+        return None
+    try:
+        result = await run_blocking(
+            db[collection].bulk_write, requests, ordered=ordered
+        )
+    except Exception as e:
+        printlog(f"DB_ERROR: Failed to bulk write to [{collection}]:", e)
+        return None
+    finally:
+        # PyMongo write operations keep their query filter in _filter
+        cache.invalidate_write(
+            collection, [getattr(request, "_filter", None) for request in requests]
+        )
+    if message and response_text:
+        await message.channel.send(response_text)
+    return result
+
+
+async def create_index(keys: list, collection: str, unique: bool = False):
+    """Creates an index on the specified collection if it does not already exist.
+
+    Args:
+        keys (list): A list of (key, direction) pairs.
+        collection (str): The target database collection.
+        unique (bool, optional): Whether the index should enforce uniqueness. Defaults to False.
+
+    Returns:
+        The name of the index if successful. Otherwise, returns None.
+    """
+    try:
+        return await run_blocking(db[collection].create_index, keys, unique=unique)
+    except Exception as e:
+        printlog(f"DB_ERROR: Failed to create index {keys} on [{collection}]:", e)
+        return None
+
+
+async def ping():
+    """Checks that the database server can be reached.
+
+    Returns:
+        True if the server responded. Otherwise, returns False.
+    """
+    try:
+        await run_blocking(db.command, "ping")
+    except Exception as e:
+        printlog(f"DB_ERROR: Failed to reach the database [{client.MONGO_ADDR}]:", e)
+        return False
+    return True
+
+
+async def explain(target: dict, collection: str, sort: list = None):
+    """Explains the query plan of a find in the specified collection.
+
+    Args:
+        target (dict): The target document query.
+        collection (str): The target database collection.
+        sort (list, optional): A list of (key, direction) pairs to sort by. Defaults to no sort.
+
+    Returns:
+        The explain output if successful. Otherwise, returns None.
+    """
+    try:
+        return await run_blocking(
+            lambda: db[collection].find(target, sort=sort).explain()
+        )
+    except Exception as e:
+        printlog(
+            f"DB_ERROR: Failed to explain query in [{collection}]:\ntarget=[{target}]",
+            e,
+        )
+        return None
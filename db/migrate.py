@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+
+from pymongo import ReplaceOne, UpdateOne
+
+from db import mdb, schema
+from utils.constants import (
+    CHALLENGES,
+    GUILDS,
+    HISTORY,
+    LEADERBOARD,
+    MATCHES,
+    PARTICIPANTS,
+    TOURNAMENTS,
+)
+from utils.log import printlog
+
+# migrate.py
+# Moves tournaments, challenges and leaderboard users out of existing guild documents
+# and into their own collections.
+# Usage: python -m db.migrate [--dry-run]
+#
+# Documents are upserted by id, so the migration can safely be re-run if interrupted.
+# The embedded arrays are only removed from a guild once all of its documents are copied.
+# Leaderboard users that still list their challenge ids get that history moved into the
+# history collection.
+
+
+def migrate_guild(db_guild: dict, dry_run: bool = False) -> dict:
+    """Copies the embedded arrays of a single guild document into the normalized collections.
+
+    Args:
+        db_guild (dict): The legacy guild document.
+        dry_run (bool, optional): Flag to only count the documents without writing. Defaults to False.
+
+    Returns:
+        dict: The number of documents migrated per collection.
+    """
+    guild_id = db_guild["guild_id"]
+    requests = {collection: [] for collection in schema.GUILD_ARRAYS}
+    requests.update({collection: [] for collection in schema.TOURNAMENT_ARRAYS})
+
+    for db_tournament in db_guild.get(TOURNAMENTS, []):
+        tournament_doc, participant_docs, match_docs = schema.split_tournament(
+            guild_id, db_tournament
+        )
+        requests[TOURNAMENTS].append(
+            ReplaceOne({"id": tournament_doc["id"]}, tournament_doc, upsert=True)
+        )
+        for collection, documents in (
+            (PARTICIPANTS, participant_docs),
+            (MATCHES, match_docs),
+        ):
+            requests[collection] += [
+                ReplaceOne(
+                    {"tournament_id": document["tournament_id"], "id": document["id"]},
+                    document,
+                    upsert=True,
+                )
+                for document in documents
+            ]
+    for collection in (CHALLENGES, LEADERBOARD):
+        requests[collection] += [
+            ReplaceOne(
+                {"guild_id": guild_id, "id": document["id"]},
+                {**schema.strip_document(document), "guild_id": guild_id},
+                upsert=True,
+            )
+            for document in db_guild.get(collection, [])
+        ]
+
+    counts = {collection: len(ops) for collection, ops in requests.items()}
+    if dry_run:
+        return counts
+    for collection, ops in requests.items():
+        if ops:
+            mdb.db[collection].bulk_write(ops, ordered=False)
+    mdb.db[GUILDS].update_one(
+        {"_id": db_guild["_id"]},
+        {"$unset": {array: "" for array in schema.GUILD_ARRAYS}},
+    )
+    return counts
+
+
+def migrate_leaderboard_history(guild_id: int, dry_run: bool = False) -> int:
+    """Moves the challenge ids stored on a guild's leaderboard users into the history
+    collection, replacing them with counters.
+
+    Args:
+        guild_id (int): The target guild id.
+        dry_run (bool, optional): Flag to only count the users without writing. Defaults to False.
+
+    Returns:
+        int: The number of users migrated.
+    """
+    from modules.leaderboard import history_entry, summarize_history
+
+    users = list(
+        mdb.db[LEADERBOARD].find({"guild_id": guild_id, "matches": {"$exists": True}})
+    )
+    if dry_run or not users:
+        return len(users)
+    challenge_ids = {challenge_id for user in users for challenge_id in user["matches"]}
+    challenges = {
+        db_challenge["id"]: db_challenge
+        for db_challenge in mdb.db[CHALLENGES].find(
+            {"guild_id": guild_id, "id": {"$in": list(challenge_ids)}}
+        )
+    }
+    history_requests, user_requests = [], []
+    for user in users:
+        history = []
+        for challenge_id in user["matches"]:
+            db_challenge = challenges.get(challenge_id)
+            if not db_challenge or not db_challenge.get("completed"):
+                continue
+            if db_challenge["player1"]["id"] == user["id"]:
+                slot = "player1"
+            elif db_challenge["player2"]["id"] == user["id"]:
+                slot = "player2"
+            else:
+                # Not the user's challenge, so there is no result of theirs to record
+                continue
+            win = db_challenge["winner_emote"] == (
+                "1️⃣" if slot == "player1" else "2️⃣"
+            )
+            history.append(history_entry(guild_id, db_challenge, user, win))
+        history.sort(key=lambda entry: entry["reported_at"])
+        history_requests += [
+            ReplaceOne(
+                {
+                    "guild_id": guild_id,
+                    "user_id": entry["user_id"],
+                    "challenge_id": entry["challenge_id"],
+                },
+                entry,
+                upsert=True,
+            )
+            for entry in history
+        ]
+        user_requests.append(
+            UpdateOne(
+                {"_id": user["_id"]},
+                {
+                    "$set": {
+                        "total": len(history),
+                        **summarize_history(history),
+                    },
+                    "$unset": {"matches": ""},
+                },
+            )
+        )
+    if history_requests:
+        mdb.db[HISTORY].bulk_write(history_requests, ordered=False)
+    mdb.db[LEADERBOARD].bulk_write(user_requests, ordered=False)
+    return len(users)
+
+
+def main(dry_run: bool = False):
+    if not dry_run:
+        asyncio.run(schema.ensure_indexes())
+    legacy_query = {
+        "$or": [{array: {"$exists": True}} for array in schema.GUILD_ARRAYS]
+    }
+    total = 0
+    for db_guild in mdb.db[GUILDS].find(legacy_query):
+        counts = migrate_guild(db_guild, dry_run)
+        total += 1
+        printlog(
+            f"{'[DRY RUN] ' if dry_run else ''}Migrated guild ['guild_id'='{db_guild['guild_id']}']: {counts}"
+        )
+    printlog(f"Finished migrating {total} guild(s).")
+    # Leaderboard users created before the history collection
+    for guild_id in mdb.db[LEADERBOARD].distinct(
+        "guild_id", {"matches": {"$exists": True}}
+    ):
+        count = migrate_leaderboard_history(guild_id, dry_run)
+        printlog(
+            f"{'[DRY RUN] ' if dry_run else ''}Moved the challenge history of {count} leaderboard user(s) ['guild_id'='{guild_id}']."
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Migrate embedded guild arrays into normalized collections."
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report what would be migrated.",
+    )
+    args = parser.parse_args()
+    main(args.dry_run)
@@ -0,0 +1,481 @@
+import asyncio
+
+from pymongo import ASCENDING, DESCENDING
+
+from db import mdb
+from utils.index import DocumentIndex
+from utils.constants import (
+    CHALLENGES,
+    EVENTS,
+    GUILDS,
+    HISTORY,
+    LEADERBOARD,
+    MATCHES,
+    OUTBOX,
+    PARTICIPANTS,
+    SNAPSHOTS,
+    TOURNAMENTS,
+)
+from utils.log import printlog
+
+# schema.py
+# Normalized database collections.
+#
+# Tournaments, challenges and leaderboard users used to be embedded as arrays inside the
+# guild document. Each of them now lives in its own collection, keyed by "guild_id".
+# Tournament participants and matches are further split out and keyed by "tournament_id".
+# The functions below translate between guild-shaped documents and the collections so
+# that callers can keep working with db_guild["tournaments"], db_tournament["matches"], ...
+
+# Arrays that were previously embedded in the guild document
+GUILD_ARRAYS = (TOURNAMENTS, CHALLENGES, LEADERBOARD)
+# Arrays that were previously embedded in each tournament document
+TOURNAMENT_ARRAYS = (PARTICIPANTS, MATCHES)
+# The event log of each tournament (see db/eventlog.py)
+TOURNAMENT_LOGS = (EVENTS, SNAPSHOTS)
+
+INSERTION_ORDER = [("_id", ASCENDING)]
+
+# Keys that loaded arrays are indexed by (see utils/index.py)
+INDEX_KEYS = {
+    TOURNAMENTS: ("id", "title"),
+    CHALLENGES: ("id",),
+    LEADERBOARD: ("id",),
+    PARTICIPANTS: ("id", "challonge_id"),
+    MATCHES: ("id", "challonge_id"),
+}
+
+# Common filters for loading part of a guild (see attach_guild_arrays)
+ACTIVE_TOURNAMENT = {"in_progress": True, "completed": False}
+REGISTRATION_TOURNAMENTS = {"in_progress": False, "completed": False}
+OPEN_CHALLENGES = {"completed": False}
+RATED_USERS = {"rating": {"$exists": True}}
+# Leaderboard users from highest to lowest rating; the id breaks ties
+LEADERBOARD_ORDER = [("rating", DESCENDING), ("id", ASCENDING)]
+# A user's challenge history, oldest first
+HISTORY_ORDER = [("reported_at", ASCENDING), ("_id", ASCENDING)]
+
+# Indexes for every normalized collection: (collection, keys, unique).
+# Queries sorted by INSERTION_ORDER need an index ending in "_id" after their filter keys;
+# otherwise the planner may prefer walking the whole _id index to an in-memory sort.
+INDEXES = [
+    (GUILDS, [("guild_id", ASCENDING)], True),
+    (TOURNAMENTS, [("id", ASCENDING)], True),
+    (TOURNAMENTS, [("guild_id", ASCENDING), ("_id", ASCENDING)], False),
+    (TOURNAMENTS, [("guild_id", ASCENDING), ("title", ASCENDING)], False),
+    (TOURNAMENTS, [("completed", ASCENDING), ("in_progress", ASCENDING)], False),
+    (PARTICIPANTS, [("tournament_id", ASCENDING), ("id", ASCENDING)], True),
+    (PARTICIPANTS, [("tournament_id", ASCENDING), ("_id", ASCENDING)], False),
+    (PARTICIPANTS, [("guild_id", ASCENDING)], False),
+    (MATCHES, [("id", ASCENDING)], True),
+    (MATCHES, [("tournament_id", ASCENDING), ("challonge_id", ASCENDING)], False),
+    (MATCHES, [("tournament_id", ASCENDING), ("_id", ASCENDING)], False),
+    (MATCHES, [("guild_id", ASCENDING)], False),
+    (CHALLENGES, [("id", ASCENDING)], True),
+    (CHALLENGES, [("guild_id", ASCENDING), ("_id", ASCENDING)], False),
+    (LEADERBOARD, [("guild_id", ASCENDING), ("id", ASCENDING)], True),
+    (LEADERBOARD, [("guild_id", ASCENDING), ("_id", ASCENDING)], False),
+    (
+        LEADERBOARD,
+        [("guild_id", ASCENDING), ("rating", DESCENDING), ("id", ASCENDING)],
+        False,
+    ),
+    (
+        HISTORY,
+        [("guild_id", ASCENDING), ("user_id", ASCENDING), ("reported_at", ASCENDING)],
+        False,
+    ),
+    (HISTORY, [("guild_id", ASCENDING), ("challenge_id", ASCENDING)], False),
+    (OUTBOX, [("key", ASCENDING)], True),
+    (OUTBOX, [("challonge_id", ASCENDING), ("_id", ASCENDING)], False),
+    (EVENTS, [("tournament_id", ASCENDING), ("_id", ASCENDING)], False),
+    (SNAPSHOTS, [("tournament_id", ASCENDING), ("_id", ASCENDING)], False),
+]
+
+
+# The queries that run on every interaction, with placeholder values: (collection, query, sort).
+# verify_indexes checks that each of them is planned on an index (see INDEXES).
+HOT_QUERIES = [
+    (GUILDS, {"guild_id": 0}, None),
+    (TOURNAMENTS, {**ACTIVE_TOURNAMENT, "guild_id": 0}, INSERTION_ORDER),
+    (TOURNAMENTS, {"guild_id": 0, "title": ""}, None),
+    (TOURNAMENTS, {"completed": False}, None),
+    (PARTICIPANTS, {"tournament_id": {"$in": [0]}}, INSERTION_ORDER),
+    (MATCHES, {"tournament_id": {"$in": [0]}}, INSERTION_ORDER),
+    (MATCHES, {"tournament_id": {"$in": [0]}, "completed": False}, None),
+    (MATCHES, {"guild_id": 0, "tournament_id": 0, "id": {"$in": [0]}}, None),
+    (MATCHES, {"guild_id": 0, "id": 0}, None),
+    (CHALLENGES, {**OPEN_CHALLENGES, "guild_id": 0}, INSERTION_ORDER),
+    (CHALLENGES, {"guild_id": 0, "id": 0}, INSERTION_ORDER),
+    (LEADERBOARD, {"guild_id": 0}, INSERTION_ORDER),
+    (LEADERBOARD, {"guild_id": 0, "id": 0}, INSERTION_ORDER),
+    (LEADERBOARD, {**RATED_USERS, "guild_id": 0}, LEADERBOARD_ORDER),
+    (OUTBOX, {"challonge_id": 0}, INSERTION_ORDER),
+]
+
+
+async def ensure_indexes():
+    """Creates the indexes for all normalized collections. Safe to call more than once."""
+    for collection, keys, unique in INDEXES:
+        await mdb.create_index(keys, collection, unique=unique)
+
+
+def plan_nodes(plan: dict) -> list:
+    """Returns the stages of a query plan, from the root down.
+
+    Args:
+        plan (dict): A winning plan from the explain output.
+
+    Returns:
+        list: The stage documents.
+    """
+    # Plans run by the slot based engine keep the classic plan under "queryPlan"
+    plan = plan.get("queryPlan", plan)
+    nodes = [plan] if "stage" in plan else []
+    children = plan.get("inputStages", [])
+    if "inputStage" in plan:
+        children = [plan["inputStage"], *children]
+    for child in children:
+        nodes += plan_nodes(child)
+    return nodes
+
+
+def plan_stages(plan: dict) -> list:
+    """Returns the stage names of a query plan, from the root down.
+
+    Args:
+        plan (dict): A winning plan from the explain output.
+
+    Returns:
+        list: The stage names.
+    """
+    return [node["stage"] for node in plan_nodes(plan)]
+
+
+def scans_collection(plan: dict) -> bool:
+    """Returns whether a query plan reads a whole collection, either directly or by walking
+    an index from end to end (e.g. the _id index picked only to sort by INSERTION_ORDER).
+
+    Args:
+        plan (dict): A winning plan from the explain output.
+
+    Returns:
+        bool: True if any stage is a collection scan or an unbounded index scan.
+    """
+    for node in plan_nodes(plan):
+        if node["stage"] == "COLLSCAN":
+            return True
+        bounds = node.get("indexBounds")
+        if (
+            node["stage"] == "IXSCAN"
+            and bounds
+            and all(
+                ranges in (["[MinKey, MaxKey]"], ["[MaxKey, MinKey]"])
+                for ranges in bounds.values()
+            )
+        ):
+            return True
+    return False
+
+
+async def verify_indexes(strict: bool = True):
+    """Explains every query in HOT_QUERIES and reports those that scan a whole collection.
+
+    Args:
+        strict (bool, optional): Flag to raise an error if any query scans a collection or cannot be explained. Defaults to True.
+
+    Raises:
+        RuntimeError: If strict and a query is not planned on an index, or could not be explained.
+
+    Returns:
+        A list of the (collection, query) pairs that scan a collection.
+    """
+    unindexed, unexplained = [], []
+    for collection, target, sort in HOT_QUERIES:
+        explanation = await mdb.explain(target, collection, sort)
+        if explanation is None:
+            printlog(
+                f"DB_ERROR: Could not verify that query in [{collection}] uses an index:\ntarget=[{target}] sort=[{sort}]"
+            )
+            unexplained.append((collection, target))
+            continue
+        plan = explanation["queryPlanner"]["winningPlan"]
+        if scans_collection(plan):
+            printlog(
+                f"DB_ERROR: Query in [{collection}] does not use an index:\ntarget=[{target}] sort=[{sort}] plan={plan_stages(plan)}"
+            )
+            unindexed.append((collection, target))
+    if strict and (unindexed or unexplained):
+        raise RuntimeError(
+            f"{len(unindexed)} hot queries do not use an index and {len(unexplained)} could not be explained; see the log for details."
+        )
+    return unindexed
+
+
+def strip_document(document: dict) -> dict:
+    """Returns a copy of a collection document without its database id.
+
+    Args:
+        document (dict): The collection document.
+
+    Returns:
+        dict: The stripped document.
+    """
+    return {key: value for key, value in document.items() if key != "_id"}
+
+
+def split_tournament(guild_id: int, db_tournament: dict):
+    """Splits a tournament document into its collection documents.
+
+    Args:
+        guild_id (int): The id of the guild the tournament belongs to.
+        db_tournament (dict): The tournament document, including participants and matches.
+
+    Returns:
+        A tuple of the tournament document, the list of participant documents, and the list of match documents.
+    """
+    tournament_id = db_tournament["id"]
+    tournament_doc = {
+        key: value
+        for key, value in db_tournament.items()
+        if key not in TOURNAMENT_ARRAYS and key != "_id"
+    }
+    tournament_doc["guild_id"] = guild_id
+    participant_docs, match_docs = [
+        [
+            {
+                **strip_document(subdocument),
+                "guild_id": guild_id,
+                "tournament_id": tournament_id,
+            }
+            for subdocument in db_tournament.get(field, [])
+        ]
+        for field in TOURNAMENT_ARRAYS
+    ]
+    return tournament_doc, participant_docs, match_docs
+
+
+def index_documents(array: str, documents: list) -> DocumentIndex:
+    """Wraps the loaded documents of an array in an index over its lookup keys.
+
+    Args:
+        array (str): The name of the array (and collection).
+        documents (list): The documents.
+
+    Returns:
+        DocumentIndex: The indexed documents.
+    """
+    return DocumentIndex(documents, INDEX_KEYS[array])
+
+
+async def find_tournaments(
+    target: dict, projection: dict = None, strict: bool = False
+):
+    """Finds tournaments and attaches their participants and matches.
+
+    Args:
+        target (dict): The tournament query.
+        projection (dict, optional): The tournament fields to load. Must include "id". Defaults to all fields.
+        strict (bool, optional): Whether to fail instead of attaching empty arrays when a read fails. Defaults to False.
+
+    Returns:
+        A list of tournament documents in the embedded format. On error, returns an empty list,
+        or None if strict.
+    """
+    tournaments = await mdb.find_documents(
+        target, TOURNAMENTS, sort=INSERTION_ORDER, projection=projection
+    )
+    if tournaments is None and strict:
+        return None
+    if not tournaments:
+        return index_documents(TOURNAMENTS, [])
+    tournament_ids = [tournament["id"] for tournament in tournaments]
+    participants, matches = await asyncio.gather(
+        mdb.find_documents(
+            {"tournament_id": {"$in": tournament_ids}},
+            PARTICIPANTS,
+            sort=INSERTION_ORDER,
+        ),
+        mdb.find_documents(
+            {"tournament_id": {"$in": tournament_ids}}, MATCHES, sort=INSERTION_ORDER
+        ),
+    )
+    if strict and (participants is None or matches is None):
+        return None
+    subdocuments = {tournament_id: ([], []) for tournament_id in tournament_ids}
+    for i, documents in enumerate((participants or [], matches or [])):
+        for document in documents:
+            subdocuments[document["tournament_id"]][i].append(strip_document(document))
+    result = []
+    for tournament in tournaments:
+        db_tournament = strip_document(tournament)
+        for array, documents in zip(TOURNAMENT_ARRAYS, subdocuments[tournament["id"]]):
+            db_tournament[array] = index_documents(array, documents)
+        result.append(db_tournament)
+    return index_documents(TOURNAMENTS, result)
+
+
+async def attach_guild_arrays(
+    db_guild: dict, arrays: dict = None, projections: dict = None
+):
+    """Attaches the tournaments, challenges and leaderboard of a guild to its document.
+    Only the documents matching the filters in arrays are loaded. Arrays that are not
+    listed are attached as empty lists.
+
+    Args:
+        db_guild (dict): The guild document as stored in the guilds collection.
+        arrays (dict, optional): A query filter per array name (ex. {TOURNAMENTS: ACTIVE_TOURNAMENT}). Defaults to loading every array in full.
+        projections (dict, optional): A projection per array name. Defaults to all fields.
+
+    Returns:
+        The guild document in the embedded format.
+    """
+    guild_id = db_guild["guild_id"]
+    if arrays is None:
+        arrays = {array: {} for array in GUILD_ARRAYS}
+    projections = projections or {}
+
+    async def load(array: str):
+        if array not in arrays:
+            return index_documents(array, [])
+        target = {**arrays[array], "guild_id": guild_id}
+        if array == TOURNAMENTS:
+            return await find_tournaments(target, projections.get(array))
+        documents = await mdb.find_documents(
+            target, array, sort=INSERTION_ORDER, projection=projections.get(array)
+        )
+        return index_documents(
+            array, [strip_document(document) for document in documents or []]
+        )
+
+    results = await asyncio.gather(*[load(array) for array in GUILD_ARRAYS])
+    db_guild.update(zip(GUILD_ARRAYS, results))
+    return db_guild
+
+
+async def find_persistent_views():
+    """Finds the messages that need a persistent view when the bot starts.
+    Only incomplete tournaments and their open matches are read, with just the fields the
+    views need, so the cost scales with open work rather than with tournament history.
+
+    Returns:
+        A tuple of the ids of tournaments open for registration, and a list of
+        (match, player1, player2) tuples for the open matches of active tournaments.
+    """
+    tournaments = await mdb.find_documents(
+        {"completed": False}, TOURNAMENTS, projection={"id": 1, "in_progress": 1}
+    )
+    registration_ids = [t["id"] for t in tournaments or [] if not t["in_progress"]]
+    active_ids = [t["id"] for t in tournaments or [] if t["in_progress"]]
+    if not active_ids:
+        return registration_ids, []
+    matches = await mdb.find_documents(
+        {"tournament_id": {"$in": active_ids}, "completed": False},
+        MATCHES,
+        projection={
+            "id": 1,
+            "challonge_id": 1,
+            "tournament_id": 1,
+            "player1.id": 1,
+            "player2.id": 1,
+        },
+    )
+    player_ids = {
+        db_match[player]["id"]
+        for db_match in matches or []
+        for player in ("player1", "player2")
+    }
+    participants = await mdb.find_documents(
+        {"tournament_id": {"$in": active_ids}, "id": {"$in": list(player_ids)}},
+        PARTICIPANTS,
+        projection={"id": 1, "tournament_id": 1, "name": 1},
+    )
+    names = {
+        (participant["tournament_id"], participant["id"]): participant
+        for participant in participants or []
+    }
+    voting = []
+    for db_match in matches or []:
+        player1, player2 = [
+            names.get((db_match["tournament_id"], db_match[player]["id"]))
+            for player in ("player1", "player2")
+        ]
+        if player1 and player2:
+            voting.append((db_match, player1, player2))
+    return registration_ids, voting
+
+
+def guild_header(db_guild: dict) -> dict:
+    """Returns the fields of a guild document that are stored in the guilds collection.
+
+    Args:
+        db_guild (dict): The guild document in the embedded format.
+
+    Returns:
+        dict: The guild document without its embedded arrays.
+    """
+    return {
+        key: value
+        for key, value in db_guild.items()
+        if key not in GUILD_ARRAYS and key != "_id"
+    }
+
+
+async def insert_subdocument(guild_id: int, target_array: str, document: dict):
+    """Inserts a former guild subdocument into its collection.
+
+    Args:
+        guild_id (int): The id of the guild the document belongs to.
+        target_array (str): The name of the former guild array (and collection).
+        document (dict): The document to insert.
+
+    Returns:
+        The inserted id of the document if successful. Otherwise, None.
+    """
+    if target_array != TOURNAMENTS:
+        return await mdb.add_document(
+            {**strip_document(document), "guild_id": guild_id}, target_array
+        )
+    tournament_doc, participant_docs, match_docs = split_tournament(guild_id, document)
+    inserted_id = await mdb.add_document(tournament_doc, TOURNAMENTS)
+    if inserted_id:
+        await mdb.add_documents(participant_docs, PARTICIPANTS)
+        await mdb.add_documents(match_docs, MATCHES)
+    return inserted_id
+
+
+async def delete_subdocument(guild_id: int, target_array: str, document_id: int):
+    """Deletes a former guild subdocument from its collection.
+    Deleting a tournament also deletes its participants, matches and event log.
+
+    Args:
+        guild_id (int): The id of the guild the document belongs to.
+        target_array (str): The name of the former guild array (and collection).
+        document_id (int): The id of the document to delete.
+
+    Returns:
+        The result object if successful. Otherwise, None.
+    """
+    result = await mdb.delete_document(
+        {"guild_id": guild_id, "id": document_id}, target_array
+    )
+    if result and target_array == TOURNAMENTS:
+        for collection in TOURNAMENT_ARRAYS + TOURNAMENT_LOGS:
+            await mdb.delete_documents(
+                {"guild_id": guild_id, "tournament_id": document_id}, collection
+            )
+    return result
+
+
+async def delete_guild_documents(guild_id: int):
+    """Deletes every document that belongs to a guild from the normalized collections,
+    including its queued Challonge writes.
+
+    Args:
+        guild_id (int): The target guild id.
+    """
+    for collection in (
+        GUILD_ARRAYS + TOURNAMENT_ARRAYS + TOURNAMENT_LOGS + (HISTORY, OUTBOX)
+    ):
+        await mdb.delete_documents({"guild_id": guild_id}, collection)
+
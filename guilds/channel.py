@@ -1,7 +1,6 @@
 import re
 from pprint import pprint
 
-import challonge
 import discord
 from discord import (CategoryChannel, Embed, ForumChannel, Guild, Interaction,
                      Member, Message, TextChannel, Thread)
@@ -235,15 +234,10 @@ async def delete_tournament_channel(interaction: Interaction, channel_mention: s
                 )
             except:
                 print(f"Failed to delete tournament ['name'={db_tournament['title']}].")
-            try:
-                challonge.tournaments.destroy(
-                    db_tournament["challonge"]["id"]
-                )  # delete tournament from challonge
-            except Exception as e:
-                printlog(
-                    f"Failed to delete tournament [id='{db_tournament['id']}] from challonge [id='{db_tournament['challonge']['id']}].",
-                    e,
-                )
+            # Delete tournament from challonge
+            await _tournament.queue_destroy_tournament(
+                guild.id, db_tournament["challonge"]["id"]
+            )
     # Delete from database
     await delete_tournament_channel_db(db_guild, tournament_channel.id)
     print(
@@ -301,12 +295,12 @@ async def remove_as_tournament_channel(interaction: Interaction, channel_mention
         )
         return False
     # Check if the channel has an active tournament
-    active_tournament = _tournament.find_active_tournament(db_guild)
-    if active_tournament is not None and active_tournament["channel_id"] == channel.id:
-        await interaction.follow.send(
-            f"Unable to remove tournament channel. This channel has an active tournament '***{active_tournament['title']}***'."
-        )
-        return False
+    for active_tournament in _tournament.find_active_tournaments(db_guild):
+        if active_tournament["channel_id"] == channel.id:
+            await interaction.followup.send(
+                f"Unable to remove tournament channel. This channel has an active tournament '***{active_tournament['title']}***'."
+            )
+            return False
     # Delete incomplete tournaments
     incomplete_tournaments = _tournament.find_incomplete_tournaments(db_guild)
     for db_tournament in incomplete_tournaments:
@@ -3,12 +3,12 @@ from pprint import pprint
 from discord import Guild, Interaction
 
 import db.mdb as mdb
+from db import cache, schema
+from utils.constants import GUILDS, TOURNAMENTS
 
 # guild.py
 # Discord guilds used by the bot
 
-GUILDS = "guilds"
-
 
 async def get_all_guilds():
     """Returns all guilds in the database.
@@ -16,32 +16,56 @@ async def get_all_guilds():
     Returns:
         A list of all guild documents in the database.
     """
-    return await mdb.find_all(GUILDS)
+    guilds = await mdb.find_all(GUILDS) or []
+    return [await schema.attach_guild_arrays(db_guild) for db_guild in guilds]
 
 
-async def find_guild(guild_id: int):
+async def find_guild(guild_id: int, arrays: dict = None, projections: dict = None):
     """Finds a guild in the database.
+    Tournaments, challenges and leaderboard users are stored in their own collections;
+    they are attached to the returned document under the same keys as before.
+    Handlers that only need part of the guild should pass filters for the arrays they use,
+    ex. find_guild(guild_id, {TOURNAMENTS: schema.ACTIVE_TOURNAMENT}).
+    Reads are served from the guild cache (see db/cache.py) until the guild is written to.
 
     Args:
         guild_id (int): The target guild id.
+        arrays (dict, optional): A query filter per array to load. Arrays that are not listed are left empty. Defaults to loading everything.
+        projections (dict, optional): A projection per array. Defaults to all fields.
 
     Returns:
         The guild document if found. None otherwise.
     """
-    return await mdb.find_document({"guild_id": guild_id}, GUILDS)
+    key = cache.make_key(guild_id, arrays, projections)
+    db_guild = cache.get(key)
+    if db_guild:
+        return db_guild
+    guild_stamp = cache.stamp(guild_id)
+    db_guild = await mdb.find_document({"guild_id": guild_id}, GUILDS)
+    if not db_guild:
+        return None
+    db_guild = await schema.attach_guild_arrays(db_guild, arrays, projections)
+    # One query for the guild, one per loaded array, and two for the tournaments' arrays
+    reads = 1 + len(schema.GUILD_ARRAYS if arrays is None else arrays)
+    if db_guild[TOURNAMENTS]:
+        reads += len(schema.TOURNAMENT_ARRAYS)
+    cache.put(key, db_guild, guild_stamp, reads)
+    return db_guild
 
 
-async def find_add_guild(guild: Guild):
+async def find_add_guild(guild: Guild, arrays: dict = None, projections: dict = None):
     """Finds a guild in the database or adds it if it does not exist.
 
     Args:
         guild (Guild): The target discord guild.
+        arrays (dict, optional): A query filter per array to load. Defaults to loading everything.
+        projections (dict, optional): A projection per array. Defaults to all fields.
 
     Returns:
         The guild document if found. If not found, returns the new guild document. On error, returns None.
     """
     guild_id = guild.id
-    db_guild = await find_guild(guild_id)
+    db_guild = await find_guild(guild_id, arrays, projections)
     if db_guild:
         return db_guild
     else:
@@ -90,7 +114,7 @@ async def add_guild(guild: Guild):
     }
 
     # Add to database
-    document_id = await mdb.add_document(new_guild, GUILDS)
+    document_id = await mdb.add_document(schema.guild_header(new_guild), GUILDS)
     if document_id:
         print(f"Successfully added guild ['name'='{guild.name}'] to database.")
         return new_guild
@@ -112,7 +136,7 @@ async def update_guild(guild: Guild):
     )
     if db_guild:
         print(f"Successfully updated guild ['name'='{guild.name}'] in database.")
-        return db_guild
+        return await schema.attach_guild_arrays(db_guild)
     print(f"Failed to update guild ['name'='{guild.name}'] in database.")
     return None
 
@@ -128,11 +152,11 @@ async def set_guild(guild_id: int, new_guild: dict):
         The new guild document if successful. Otherwise, None.
     """
     db_guild = await mdb.update_single_document(
-        {"guild_id": guild_id}, {"$set": new_guild}, GUILDS
+        {"guild_id": guild_id}, {"$set": schema.guild_header(new_guild)}, GUILDS
     )
     if db_guild:
         print(f"Successfully set guild ['id'='{guild_id}'] in database.")
-        return db_guild
+        return await schema.attach_guild_arrays(db_guild)
     print(f"Failed to set guild ['id'='{guild_id}'] in database.")
     return None
 
@@ -148,6 +172,7 @@ async def delete_guild(guild: Guild):
     """
     delete_result = await mdb.delete_document({"guild_id": guild.id}, GUILDS)
     if delete_result:
+        await schema.delete_guild_documents(guild.id)
         print(f"Successfully deleted guild ['name'='{guild.name}'] from database.")
         return delete_result
     print(f"Failed to delete guild ['name'='{guild.name}'] in database.")
@@ -156,6 +181,7 @@ async def delete_guild(guild: Guild):
 
 async def push_to_guild(guild: Guild, target_array: str, document: dict):
     """Adds a new subdocument to a guild.
+    The subdocument is stored in the collection with the same name as the target array.
 
     Args:
         guild (Guild): The target guild to update.
@@ -167,13 +193,11 @@ async def push_to_guild(guild: Guild, target_array: str, document: dict):
     """
     guild_id = guild.id
     document_id = document["id"]
-    db_guild = await find_add_guild(guild)
+    db_guild = await find_add_guild(guild, arrays={})
     if not db_guild:
         return None
-    db_guild = await mdb.update_single_document(
-        {"guild_id": guild_id}, {"$push": {target_array: document}}, GUILDS
-    )
-    if db_guild:
+    inserted_id = await schema.insert_subdocument(guild_id, target_array, document)
+    if inserted_id:
         print(
             f"Successfully pushed subdocument ['id'={document_id}] to field '{target_array}' in guild ['name'='{guild.name}']."
         )
@@ -186,6 +210,7 @@ async def push_to_guild(guild: Guild, target_array: str, document: dict):
 
 async def pull_from_guild(guild: Guild, target_array: str, document: dict):
     """Removes a subdocument from a guild.
+    The subdocument is removed from the collection with the same name as the target array.
 
     Args:
         guild (Guild): The target gulid to update.
@@ -193,16 +218,15 @@ async def pull_from_guild(guild: Guild, target_array: str, document: dict):
         document (dict): The document to remove.
 
     Returns:
-        The removed document if successful. Otherwise, None.
+        The updated guild document if successful. Otherwise, None.
     """
     guild_id = guild.id
     document_id = document["id"]
-    db_guild = await find_add_guild(guild)
+    db_guild = await find_add_guild(guild, arrays={})
     if not db_guild:
         return None
-    updated_guild = await mdb.update_single_document(
-        {"guild_id": guild_id}, {"$pull": {target_array: {"id": document_id}}}, GUILDS
-    )
+    delete_result = await schema.delete_subdocument(guild_id, target_array, document_id)
+    updated_guild = await find_guild(guild_id) if delete_result else None
     if updated_guild:
         print(
             f"Successfully pulled subdocument ['id'={document_id}] from field '{target_array}' in guild ['name'='{guild.name}']."
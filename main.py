@@ -1,24 +1,28 @@
 import logging
 import os
 
-import challonge
 import discord
 from colorama import Back, Fore, Style
 from discord import Guild, app_commands
-from pymongo import MongoClient
+from discord.ext import tasks
 
 import guilds.guild as _guild
-from app_commands import match_group, tournament_group
+from api import challonge
+from app_commands import leaderboard_group, match_group, tournament_group
+from db import cache, client, eventlog, mdb, schema
 from guilds import channel as _channel
 import modules.tournament as _tournament
+import modules.match as _match
+import modules.outbox as _outbox
 import modules.participant as _participant
+import modules.render as _render
+import modules.editor as _editor
 from utils import log
 from utils.constants import (
     CHALLONGE_KEY,
     CHALLONGE_USER,
     DISCORD_TOKEN,
     MAX_ENTRANTS,
-    MONGO_ADDR,
 )
 from views.registration_view import RegistrationView
 from views.voting_view import VotingView
@@ -27,43 +31,13 @@ from views.voting_view import VotingView
 # beta-bot tournament bot
 
 TEST_GUILD = discord.Object(id=133296587047829505)
+# Minutes between reconciling called matches with Challonge
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", 5))
+# What to do when a hot query does not use an index: strict (stop), warn (log only) or off
+INDEX_CHECK = os.getenv("INDEX_CHECK", "strict")
 
 challonge.set_credentials(CHALLONGE_USER, CHALLONGE_KEY)
 
-print(Fore.CYAN + "Starting beta-bot..." + Style.RESET_ALL)
-print(Fore.MAGENTA + "============================================" + Style.RESET_ALL)
-
-# Create logs directory if it doesn't exist
-log_dir = "logs"
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-# Add logs to discord.log
-discord_logger = logging.getLogger("discord")
-discord_logger.setLevel(logging.DEBUG)
-file_handler = logging.FileHandler(
-    filename="logs/discord.log", encoding="utf-8", mode="w"
-)
-file_handler_formatter = logging.Formatter(
-    "[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", style="{"
-)
-file_handler.setFormatter(file_handler_formatter)
-discord_logger.addHandler(file_handler)
-
-# Connect to MongoDB
-db_client = MongoClient(MONGO_ADDR)
-db = db_client["beta-bot"]
-# Debugging: serverStatus
-serverStatusResult = db.command("serverStatus")
-if serverStatusResult:
-    print(
-        "Connected to MongoDB database at "
-        + Fore.YELLOW
-        + f"{MONGO_ADDR}"
-        + Style.RESET_ALL
-        + "\n---"
-    )
-
 
 class MyBot(discord.Client):
     def __init__(self, *args, **kwargs):
@@ -75,32 +49,63 @@ class MyBot(discord.Client):
         """
         Register views for persistent functionality
         """
-        # Get guild tournaments from database
-        guilds = await _guild.get_all_guilds()
-
-        for db_guild in guilds:
-            # Find all incomplete tournaments not in progress
-            reg_tournaments = _tournament.find_registration_tournaments(db_guild)
-            for tournament in reg_tournaments:
-                self.add_view(RegistrationView(), message_id=tournament["id"])
-
-            # Find all in-progress tournaments
-            active_tournament = _tournament.find_active_tournament(db_guild)
-            if active_tournament:
-                for match in active_tournament["matches"]:
-                    if not match["completed"]:
-                        player1 = _participant.find_participant(
-                            active_tournament, match["player1"]["id"]
-                        )
-                        player2 = _participant.find_participant(
-                            active_tournament, match["player2"]["id"]
-                        )
-                        voting_buttons_view = VotingView(match, player1, player2)
-                        self.add_view(voting_buttons_view, message_id=match["id"])
+        # Connect to MongoDB; the shared client does not connect until its first query
+        if await mdb.ping():
+            print(
+                "Connected to MongoDB database at "
+                + Fore.YELLOW
+                + f"{client.MONGO_ADDR}"
+                + Style.RESET_ALL
+                + "\n---"
+            )
+        # Make sure the normalized collections are indexed
+        await schema.ensure_indexes()
+        if INDEX_CHECK != "off":
+            await schema.verify_indexes(strict=INDEX_CHECK == "strict")
+        # Drop cached guilds on writes from other bot processes (if enabled)
+        cache.start_change_stream(mdb.db)
+        # Complete the tournament changes that were logged but not applied before a crash
+        await eventlog.recover()
+        # Apply the challonge writes left queued by the previous run
+        await _outbox.resume()
+
+        # Find the registration and match messages that need their views back
+        registration_ids, open_matches = await schema.find_persistent_views()
+        for tournament_id in registration_ids:
+            self.add_view(RegistrationView(), message_id=tournament_id)
+        for match, player1, player2 in open_matches:
+            voting_buttons_view = VotingView(match, player1, player2)
+            self.add_view(voting_buttons_view, message_id=match["id"])
 
         # self.add_view(challenge.accept_view())
         # self.add_view(challenge.voting_buttons_view())
 
+        # Periodically call any open matches the local bracket missed
+        self.reconcile_matches.start()
+
+    @tasks.loop(minutes=RECONCILE_INTERVAL)
+    async def reconcile_matches(self):
+        await _match.reconcile_active_tournaments(self)
+
+    @reconcile_matches.before_loop
+    async def before_reconcile_matches(self):
+        await self.wait_until_ready()
+
+    async def close(self):
+        # Close the HTTP connection pools and render workers before the event loop shuts down
+        self.reconcile_matches.cancel()
+        cache.stop_change_stream()
+        log.printlog(f"Guild cache: {cache.cache_info()}")
+        log.printlog(f"Render cache: {_render.render_cache_info()}")
+        await _outbox.close()
+        log.printlog(f"Challonge outbox: {_outbox.outbox_stats}")
+        log.printlog(f"MongoDB pool: {client.pool_stats()}")
+        await challonge.close()
+        await _render.close()
+        await _editor.close()
+        await super().close()
+        client.close_client()
+
     async def on_ready(self):  # Event called when bot is ready
         # Sync commands
         await self.wait_until_ready()
@@ -116,11 +121,14 @@ class MyBot(discord.Client):
         )
         log.printlog("SESSION START")
 
+    async def on_interaction(self, interaction: discord.Interaction):
+        cache.record_interaction()
+
     async def on_guild_join(self, guild: Guild):
-        await _guild.find_update_add_guild(db, guild)
+        await _guild.find_update_add_guild(guild)
 
     async def on_guild_remove(self, guild: Guild):
-        await _guild.delete_guild(db, guild)
+        await _guild.delete_guild(guild)
 
     async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
         # Check if tournament channel; If it is, update the guild.
@@ -138,6 +146,29 @@ bot_client = MyBot(intents=intents)
 tree = app_commands.CommandTree(bot_client)
 tree.add_command(tournament_group.TournamentGroup)
 tree.add_command(match_group.MatchGroup)
+tree.add_command(leaderboard_group.LeaderboardGroup)
+
 
+# Render workers import this module again, so the bot only starts when it is run directly
+if __name__ == "__main__":
+    print(Fore.CYAN + "Starting beta-bot..." + Style.RESET_ALL)
+    print(Fore.MAGENTA + "============================================" + Style.RESET_ALL)
+
+    # Create logs directory if it doesn't exist
+    log_dir = "logs"
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    # Add logs to discord.log
+    discord_logger = logging.getLogger("discord")
+    discord_logger.setLevel(logging.DEBUG)
+    file_handler = logging.FileHandler(
+        filename="logs/discord.log", encoding="utf-8", mode="w"
+    )
+    file_handler_formatter = logging.Formatter(
+        "[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", style="{"
+    )
+    file_handler.setFormatter(file_handler_formatter)
+    discord_logger.addHandler(file_handler)
 
-bot_client.run(DISCORD_TOKEN)
+    bot_client.run(DISCORD_TOKEN)
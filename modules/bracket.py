@@ -0,0 +1,235 @@
+from utils import index as _index
+
+# bracket.py
+# Tournament bracket structure
+#
+# The structure of a bracket (match ids, rounds and how players advance between matches)
+# is fixed once a tournament has started. It is fetched from Challonge once in
+# start_tournament and stored with the tournament as db_tournament["bracket"].
+
+# Fields kept for each Challonge match
+BRACKET_MATCH_FIELDS = (
+    "id",
+    "round",
+    "player1_id",
+    "player2_id",
+    "player1_prereq_match_id",
+    "player2_prereq_match_id",
+    "player1_is_prereq_match_loser",
+    "player2_is_prereq_match_loser",
+)
+
+
+def create_bracket(challonge_matches: list, tournament_type: str) -> dict:
+    """Creates the bracket structure of a tournament from its Challonge matches.
+
+    Args:
+        challonge_matches (list): All matches of the started Challonge tournament.
+        tournament_type (str): The tournament type (ex. "double elimination").
+
+    Returns:
+        dict: The bracket structure.
+    """
+    matches = [
+        {field: match.get(field) for field in BRACKET_MATCH_FIELDS}
+        for match in sorted(challonge_matches, key=lambda match: match["id"])
+    ]
+    num_rounds = max((match["round"] for match in matches), default=0)
+    # The grand finals reset is the last match created by Challonge
+    grand_finals_reset_id = (
+        matches[-1]["id"]
+        if tournament_type == "double elimination" and matches
+        else None
+    )
+    return {
+        "num_rounds": num_rounds,
+        "grand_finals_reset_id": grand_finals_reset_id,
+        "matches": matches,
+    }
+
+
+def is_grand_finals_reset(db_tournament: dict, challonge_id: int):
+    """Checks if a match is the grand finals reset of a double elimination tournament.
+
+    Args:
+        db_tournament (dict): The tournament database document.
+        challonge_id (int): The challonge id of the target match.
+
+    Returns:
+        True or False if the bracket is known. Otherwise, None.
+    """
+    bracket = db_tournament.get("bracket")
+    if not bracket:
+        return None
+    return challonge_id == bracket["grand_finals_reset_id"]
+
+
+#########################
+## BRACKET PROGRESSION ##
+#########################
+
+
+def find_bracket_match(bracket: dict, challonge_id: int):
+    """Returns a match from the bracket structure (if it exists).
+
+    Args:
+        bracket (dict): The bracket structure.
+        challonge_id (int): The challonge id of the target match.
+
+    Returns:
+        The bracket match if found. Otherwise, None.
+    """
+    for bracket_match in bracket["matches"]:
+        if bracket_match["id"] == challonge_id:
+            return bracket_match
+    return None
+
+
+def find_grand_finals(bracket: dict):
+    """Returns the first grand finals match of a double elimination bracket.
+
+    Args:
+        bracket (dict): The bracket structure.
+
+    Returns:
+        The grand finals bracket match if found. Otherwise, None.
+    """
+    reset_id = bracket["grand_finals_reset_id"]
+    if reset_id is None:
+        return None
+    finals = [
+        bracket_match
+        for bracket_match in bracket["matches"]
+        if bracket_match["round"] == bracket["num_rounds"]
+        and bracket_match["id"] != reset_id
+    ]
+    return finals[-1] if finals else None
+
+
+def get_match_result(db_tournament: dict, db_matches: dict, challonge_id: int):
+    """Returns the winner and loser of a completed match.
+
+    Args:
+        db_tournament (dict): The tournament database document.
+        db_matches (dict): The called match documents by challonge id.
+        challonge_id (int): The challonge id of the target match.
+
+    Returns:
+        A tuple of the winner and loser participant challonge ids if the match is completed. Otherwise, None.
+    """
+    db_match = db_matches.get(challonge_id)
+    if not db_match or not db_match["completed"] or not db_match["winner_emote"]:
+        return None
+    player1, player2 = [
+        (
+            _index.find(db_tournament["participants"], "id", db_match[slot]["id"])
+            or {}
+        ).get("challonge_id")
+        for slot in ("player1", "player2")
+    ]
+    if db_match["winner_emote"] == "1️⃣":
+        return player1, player2
+    return player2, player1
+
+
+def resolve_player(
+    db_tournament: dict, db_matches: dict, bracket_match: dict, slot: str
+):
+    """Returns the participant in one slot of a bracket match, if it is known yet.
+
+    Args:
+        db_tournament (dict): The tournament database document.
+        db_matches (dict): The called match documents by challonge id.
+        bracket_match (dict): The target bracket match.
+        slot (str): Either "player1" or "player2".
+
+    Returns:
+        The participant challonge id if known. Otherwise, None.
+    """
+    if bracket_match[f"{slot}_id"]:
+        return bracket_match[f"{slot}_id"]
+    prereq_id = bracket_match[f"{slot}_prereq_match_id"]
+    if not prereq_id:
+        return None
+    result = get_match_result(db_tournament, db_matches, prereq_id)
+    if not result:
+        return None
+    winner, loser = result
+    return loser if bracket_match[f"{slot}_is_prereq_match_loser"] else winner
+
+
+def find_opened_matches(db_tournament: dict, reported_challonge_id: int):
+    """Finds the matches that a reported result opens, without querying Challonge.
+    A match opens once the results of its prerequisite matches decide both of its players.
+    The grand finals reset only opens if the player from the losers bracket wins the
+    first grand finals set.
+
+    Args:
+        db_tournament (dict): The tournament database document, including its matches.
+        reported_challonge_id (int): The challonge id of the reported match.
+
+    Returns:
+        A list of opened matches in the Challonge match format, or None if the tournament has no stored bracket.
+    """
+    bracket = db_tournament.get("bracket")
+    if not bracket:
+        return None
+    db_matches = {
+        db_match["challonge_id"]: db_match for db_match in db_tournament["matches"]
+    }
+    reset_id = bracket["grand_finals_reset_id"]
+    grand_finals = find_grand_finals(bracket)
+    opened = []
+    for bracket_match in bracket["matches"]:
+        if bracket_match["id"] in db_matches:
+            continue
+        prereqs = {}
+        if bracket_match["id"] == reset_id:
+            if not grand_finals or grand_finals["id"] != reported_challonge_id:
+                continue
+            result = get_match_result(db_tournament, db_matches, reported_challonge_id)
+            # The losers bracket finalist is the player whose prerequisite is a losers match
+            losers_slot = (
+                "player1"
+                if (
+                    find_bracket_match(bracket, grand_finals["player1_prereq_match_id"])
+                    or {"round": 0}
+                )["round"]
+                < 0
+                else "player2"
+            )
+            losers_finalist = resolve_player(
+                db_tournament, db_matches, grand_finals, losers_slot
+            )
+            if not result or result[0] != losers_finalist:
+                continue
+            player1, player2 = [
+                resolve_player(db_tournament, db_matches, grand_finals, slot)
+                for slot in ("player1", "player2")
+            ]
+            # Both players of the reset come from the first grand finals set
+            prereqs = {
+                "player1_prereq_match_id": grand_finals["id"],
+                "player2_prereq_match_id": grand_finals["id"],
+            }
+        else:
+            if reported_challonge_id not in (
+                bracket_match["player1_prereq_match_id"],
+                bracket_match["player2_prereq_match_id"],
+            ):
+                continue
+            player1, player2 = [
+                resolve_player(db_tournament, db_matches, bracket_match, slot)
+                for slot in ("player1", "player2")
+            ]
+        if player1 and player2:
+            opened.append(
+                {
+                    **bracket_match,
+                    **prereqs,
+                    "player1_id": player1,
+                    "player2_id": player2,
+                    "state": "open",
+                }
+            )
+    return opened
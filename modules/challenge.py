@@ -15,12 +15,13 @@ from discord import (
     User,
 )
 
-from db import mdb
+from db import mdb, schema
 from guilds import guild as _guild
 from modules import leaderboard as _leaderboard
 from modules import match as _match
+from modules import rating as _rating
 from utils.color import GREEN, RED, WOOP_BLUE
-from utils.constants import CHALLENGES, GUILDS, ICON
+from utils.constants import CHALLENGES, ICON
 from utils.log import printlog
 
 # challenge.py
@@ -89,7 +90,9 @@ async def create_challenge(
     channel: TextChannel = interaction.channel
     guild: Guild = interaction.guild
     player1: Member = interaction.user
-    db_guild = await _guild.find_guild(guild.id)
+    db_guild = await _guild.find_guild(
+        guild.id, {CHALLENGES: {**schema.OPEN_CHALLENGES, "player1.id": player1.id}}
+    )
     # Check if already has active challenge
     active_challenge = find_active_challenge_by_user(db_guild, player1.id)
     if active_challenge:
@@ -257,38 +260,8 @@ async def cancel_challenge(
 
     # Update leaderboard if deleting a completed match
     if delete and db_challenge["completed"]:
-        # Find the winner
-        if db_challenge["winner_emote"] == "1️⃣":
-            db_winner: dict = _leaderboard.find_leaderboard_user(
-                db_guild, db_challenge["player1"]["name"]
-            )
-            db_loser: dict = _leaderboard.find_leaderboard_user(
-                db_guild, db_challenge["player2"]["name"]
-            )
-        else:
-            db_winner = _leaderboard.find_leaderboard_user(
-                db_guild, db_challenge["player2"]["name"]
-            )
-            db_loser = _leaderboard.find_leaderboard_user(
-                db_guild, db_challenge["player1"]["name"]
-            )
-        # Update records
-        db_winner["matches"] = list(
-            filter(
-                lambda match_id: match_id != db_challenge["id"], db_winner["matches"]
-            )
-        )
-        db_winner.update({"wins": db_winner["wins"] - 1})
-        db_loser["matches"] = list(
-            filter(
-                lambda match_id: match_id != db_challenge["id"], db_winner["matches"]
-            )
-        )
-        db_loser.update({"losses": db_loser["losses"] - 1})
-        await _leaderboard.set_leaderboard_user(guild.id, db_winner["id"], db_winner)
-        print(f"Removed win from leaderboard user ['name'='{db_winner['name']}'].")
-        await _leaderboard.set_leaderboard_user(guild.id, db_loser["id"], db_loser)
-        print(f"Removed loss from leaderboard user ['name'='{db_loser['name']}'].")
+        await _leaderboard.remove_leaderboard_result(guild.id, db_challenge)
+        await _rating.recompute_ratings(guild.id)
     return True
 
 
@@ -306,7 +279,7 @@ async def accept_challenge(interaction: Interaction):
     message: Message = interaction.message
     message_id = message.id
     user: Member = interaction.user
-    db_guild = await _guild.find_guild(guild.id)
+    db_guild = await _guild.find_guild(guild.id, {CHALLENGES: {"id": message_id}})
     challenge_message: Message = await channel.fetch_message(message_id)
 
     # Check if reaction was on a challenge message
@@ -391,7 +364,7 @@ async def vote_challenge_button(interaction: Interaction, button: Button):
     guild: Guild = interaction.guild
     message: Message = interaction.message
     message_id = message.id
-    db_guild = await _guild.find_guild(guild.id)
+    db_guild = await _guild.find_guild(guild.id, {CHALLENGES: {"id": message_id}})
     challenge_message: Message = await channel.fetch_message(message_id)
 
     # Check if reaction was on a challenge message
@@ -466,39 +439,15 @@ async def report_challenge(
     )
 
     # Update leaderboard
-    # Check if user(s) are already in leaderboard
-    user1 = _leaderboard.find_leaderboard_user_by_id(
-        db_guild, db_challenge["player1"]["id"]
+    loser: dict = (
+        db_challenge["player2"] if winner_emote == "1️⃣" else db_challenge["player1"]
     )
-    if not user1:
-        # Create new leaderboard user
-        await _leaderboard.create_leaderboard_user(
-            challenge_message.guild,
-            db_challenge,
-            db_challenge["player1"],
-            winner_emote == "1️⃣",
-        )
-    else:
-        # Update existing leaderboard user
-        await _leaderboard.update_leaderboard_user_score(
-            challenge_message.guild.id, db_challenge, user1, winner_emote == "1️⃣"
-        )
-
-    user2 = _leaderboard.find_leaderboard_user_by_id(
-        db_guild, db_challenge["player2"]["id"]
+    await _leaderboard.record_challenge_result(
+        challenge_message.guild.id, db_challenge, winner, loser
     )
-    if not user2:
-        await _leaderboard.create_leaderboard_user(
-            challenge_message.guild,
-            db_challenge,
-            db_challenge["player2"],
-            winner_emote == "2️⃣",
-        )
-    else:
-        # Update existing leaderboard user
-        await _leaderboard.update_leaderboard_user_score(
-            challenge_message.guild.id, db_challenge, user2, winner_emote == "2️⃣"
-        )
+
+    # Update the ratings of both players
+    await _rating.record_result(challenge_message.guild.id, winner, loser)
     return True
 
 
@@ -576,6 +525,10 @@ async def override_challenge_result(
             "Challenge report failed; Winner is the same.", ephemeral=True
         )
         return False
+    previous_winner_emote = db_challenge["winner_emote"]
+    # The previous result is taken out of the leaderboard before the new one is counted
+    if previous_winner_emote:
+        await _leaderboard.remove_leaderboard_result(guild.id, db_challenge)
     # Report match
     challenge_message = await interaction.channel.fetch_message(db_challenge["id"])
     try:
@@ -586,6 +539,9 @@ async def override_challenge_result(
     printlog(
         f"User ['name'='{user.name}'] overwrote result for challenge ['id'='{db_challenge['id']}']. Winner: {winner['name']} {winner_emote}."
     )
+    # The previous result was already rated, so the guild's ratings are replayed
+    if previous_winner_emote:
+        await _rating.recompute_ratings(guild.id)
     await interaction.followup.send(
         content=f"Challenge report successful. Winner: {winner['name']} {winner_emote}"
     )
@@ -815,9 +771,9 @@ async def set_challenge(guild_id: int, challenge_id: int, new_challenge: dict):
         The new challenge document if successful. Otherwise, None.
     """
     return await mdb.update_single_document(
-        {"guild_id": guild_id, "challenges.id": challenge_id},
-        {"$set": {f"challenges.$": new_challenge}},
-        GUILDS,
+        {"guild_id": guild_id, "id": challenge_id},
+        {"$set": schema.strip_document(new_challenge)},
+        CHALLENGES,
     )
 
 
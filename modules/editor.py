@@ -0,0 +1,206 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from discord import Embed, HTTPException, Message, NotFound
+from discord.abc import Messageable
+
+from utils.log import printlog
+
+# editor.py
+# Coalesced edits of bot messages
+#
+# Tournament embeds are edited on every join, leave, report and bracket render. Edits to a
+# message are queued here instead of being sent right away: everything requested while an
+# edit is waiting is merged into one Message.edit call, at most one edit per EDIT_INTERVAL
+# seconds is sent per message, and fields that already hold the requested value are left
+# out (an edit with nothing left is skipped). Edited messages are kept in a small cache so
+# they are not fetched again for the next edit.
+
+# Seconds to wait after the first request so that a burst is merged into one edit
+EDIT_DEBOUNCE = float(os.getenv("EDIT_DEBOUNCE", 0.5))
+# Minimum seconds between two edits of the same message
+EDIT_INTERVAL = float(os.getenv("EDIT_INTERVAL", 1))
+MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", 128))
+
+# Pending edits by message id: {"message", "fields", "requested_at", "last_edit_at", "task"}
+edit_jobs = {}
+# Messages by id, least recently used first: {"message", "applied": {field: signature}}
+message_cache = OrderedDict()
+edit_stats = {"requested": 0, "sent": 0, "skipped": 0, "fetched": 0}
+
+
+async def get_message(channel: Messageable, message_id: int) -> Message:
+    """Returns a message from the cache, fetching it if it is not cached.
+
+    Args:
+        channel (Messageable): The channel or thread the message was sent in.
+        message_id (int): The id of the message.
+
+    Returns:
+        Message: The Discord message.
+    """
+    entry = message_cache.get(message_id)
+    if entry:
+        message_cache.move_to_end(message_id)
+        return entry["message"]
+    message = await channel.fetch_message(message_id)
+    edit_stats["fetched"] += 1
+    cache_message(message)
+    return message
+
+
+def cache_message(message: Message, applied: dict = None):
+    """Adds a message to the cache, evicting the least recently used messages.
+
+    Args:
+        message (Message): The Discord message.
+        applied (dict, optional): Signatures of the fields that were just sent. Defaults to None.
+    """
+    entry = message_cache.setdefault(message.id, {"applied": {}})
+    entry["message"] = message
+    entry["applied"].update(applied or {})
+    message_cache.move_to_end(message.id)
+    while len(message_cache) > MESSAGE_CACHE_SIZE:
+        message_cache.popitem(last=False)
+
+
+def forget_message(message_id: int):
+    """Removes a message from the cache, ex. once it has been deleted.
+
+    Args:
+        message_id (int): The id of the message.
+    """
+    message_cache.pop(message_id, None)
+
+
+def current_embed(message: Message) -> Embed:
+    """Returns a copy of the latest embed of a message, including edits that are still pending.
+
+    Args:
+        message (Message): The Discord message.
+
+    Returns:
+        Embed: The embed to build the next edit from.
+    """
+    job = edit_jobs.get(message.id)
+    if job and job["fields"].get("embed"):
+        return job["fields"]["embed"].copy()
+    entry = message_cache.get(message.id)
+    latest = entry["message"] if entry else message
+    return latest.embeds[0].copy()
+
+
+def signature(field: str, value):
+    """Returns a comparable form of an edit field, to detect edits that change nothing."""
+    if isinstance(value, Embed):
+        return value.to_dict()
+    if field == "view":
+        if value is None:
+            return None
+        return (
+            type(value).__name__,
+            [getattr(item, "custom_id", None) for item in value.children],
+        )
+    return value
+
+
+def schedule_edit(message: Message, **fields):
+    """Queues an edit of a message. Fields not given keep their current or pending value.
+
+    Args:
+        message (Message): The Discord message.
+        **fields: The Message.edit arguments (ex. content, embed, view).
+    """
+    edit_stats["requested"] += 1
+    job = edit_jobs.get(message.id)
+    if job:
+        job["fields"].update(fields)
+        if not job["requested_at"]:
+            job["requested_at"] = time.monotonic()
+        return
+    job = {
+        "message": message,
+        "fields": dict(fields),
+        "requested_at": time.monotonic(),
+        "last_edit_at": 0,
+    }
+    edit_jobs[message.id] = job
+    job["task"] = asyncio.create_task(run_edit_job(message.id))
+
+
+async def run_edit_job(message_id: int):
+    """Sends the pending edits of a message until none are left.
+
+    Args:
+        message_id (int): The id of the target message.
+    """
+    job = edit_jobs[message_id]
+    try:
+        while job["fields"]:
+            delay = (
+                max(
+                    job["requested_at"] + EDIT_DEBOUNCE,
+                    job["last_edit_at"] + EDIT_INTERVAL,
+                )
+                - time.monotonic()
+            )
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            fields, job["fields"], job["requested_at"] = job["fields"], {}, 0
+            job["message"] = await apply_edit(job["message"], fields)
+            job["last_edit_at"] = time.monotonic()
+            if job["message"] is None:
+                return
+    except Exception as e:
+        printlog(f"Failed to edit message ['id'={message_id}].", e)
+    finally:
+        edit_jobs.pop(message_id, None)
+
+
+async def apply_edit(message: Message, fields: dict):
+    """Sends the fields of an edit that differ from what was last sent.
+
+    Args:
+        message (Message): The Discord message.
+        fields (dict): The Message.edit arguments.
+
+    Returns:
+        The edited message, or None if the message no longer exists.
+    """
+    applied = message_cache.get(message.id, {}).get("applied", {})
+    changed = {
+        field: value
+        for field, value in fields.items()
+        if field not in applied or applied[field] != signature(field, value)
+    }
+    if not changed:
+        edit_stats["skipped"] += 1
+        return message
+    try:
+        edited = await message.edit(**changed)
+    except NotFound:
+        forget_message(message.id)
+        return None
+    except HTTPException:
+        # The state of the message is unknown, so the next edit sends every field
+        forget_message(message.id)
+        raise
+    edit_stats["sent"] += 1
+    cache_message(
+        edited, {field: signature(field, value) for field, value in changed.items()}
+    )
+    return edited
+
+
+async def close():
+    """Sends the pending edits of every message."""
+    for job in list(edit_jobs.values()):
+        job["task"].cancel()
+        if job["fields"]:
+            try:
+                await apply_edit(job["message"], job["fields"])
+            except Exception as e:
+                printlog(f"Failed to edit message ['id'={job['message'].id}].", e)
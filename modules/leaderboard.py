@@ -1,18 +1,25 @@
+from datetime import datetime
 from pprint import pprint
 
 from discord import Embed, Guild, Interaction, Member, Message, TextChannel, User
+from pymongo import UpdateOne
 
-from db import mdb
+from db import mdb, schema
 from guilds import guild as _guild
 from modules import challenge
+from modules import rating as _rating
 from utils.color import GOLD
-from utils.constants import GUILDS, ICON
+from utils.constants import HISTORY, ICON, LEADERBOARD
 from utils.log import printlog
+from views.leaderboard_view import LeaderboardView
 
 # leaderboard.py
 # leaderboard for 1v1 challenges
 
-LEADERBOARD = "leaderboard"
+# Number of users per leaderboard page
+LEADERBOARD_SIZE = 10
+# Number of latest results kept in a user's form
+FORM_SIZE = 5
 
 
 def find_leaderboard_user(db_guild: dict, user_name: str):
@@ -49,9 +56,56 @@ def find_leaderboard_user_by_id(db_guild: dict, user_id: int):
     return None
 
 
+async def find_leaderboard_page(
+    guild_id: int, cursor: tuple = None, before: bool = False
+):
+    """Finds one page of rated leaderboard users, from highest to lowest rating.
+    Pages are found from a cursor on the indexed (rating, id) order, so no users outside
+    the page are read.
+
+    Args:
+        guild_id (int): The target guild id.
+        cursor (tuple, optional): The (rating, id) of the user the page starts after (or ends before). Defaults to the first page.
+        before (bool, optional): Flag to find the page that ends before the cursor. Defaults to False.
+
+    Returns:
+        A tuple of the users of the page, and whether there are more users past the page in that direction. On error, returns (None, False).
+    """
+    target = {**schema.RATED_USERS, "guild_id": guild_id}
+    sort = schema.LEADERBOARD_ORDER
+    if cursor:
+        rating, user_id = cursor
+        if before:
+            target["$or"] = [
+                {"rating": {"$gt": rating}},
+                {"rating": rating, "id": {"$lt": user_id}},
+            ]
+        else:
+            target["$or"] = [
+                {"rating": {"$lt": rating}},
+                {"rating": rating, "id": {"$gt": user_id}},
+            ]
+    if before:
+        sort = [(key, -direction) for key, direction in sort]
+    # One extra user is read to know whether another page follows
+    users = await mdb.find_documents(
+        target,
+        LEADERBOARD,
+        sort=sort,
+        projection={"_id": 0, "id": 1, "name": 1, "rating": 1},
+        limit=LEADERBOARD_SIZE + 1,
+    )
+    if users is None:
+        return None, False
+    has_more = len(users) > LEADERBOARD_SIZE
+    users = users[:LEADERBOARD_SIZE]
+    if before:
+        users.reverse()
+    return users, has_more
+
+
 async def retrieve_leaderboard(interaction: Interaction):
-    """Retrieves all users in a leaderboard.
-    TODO: Paginated with 10 users per page.
+    """Sends the first page of a guild leaderboard, with buttons to turn the pages.
 
     Args:
         interaction (Interaction): The discord command interaction.
@@ -60,21 +114,54 @@ async def retrieve_leaderboard(interaction: Interaction):
         bool: True if successful. Otherwise, False.
     """
     guild: Guild = interaction.guild
-    db_guild: dict = await _guild.find_guild(guild.id)
-    db_leaderboard: dict = db_guild["leaderboard"]
-    try:
-        leaderboard_embed = create_server_leaderboard_embed(guild, db_leaderboard)
-        await interaction.channel.send(embed=leaderboard_embed)
-        await interaction.followup.send(
-            f"Found leaderboard for server '***{guild.name}***'!", ephemeral=True
-        )
-        return True
-    except Exception:
+    users, has_next = await find_leaderboard_page(guild.id)
+    if users is None:
         await interaction.followup.send(
             f"Failed to find leaderboard for server '***{guild.name}***'",
             ephemeral=True,
         )
         return False
+    leaderboard_embed = create_server_leaderboard_embed(guild, users)
+    leaderboard_view = LeaderboardView(users, 0, False, has_next)
+    await interaction.channel.send(embed=leaderboard_embed, view=leaderboard_view)
+    await interaction.followup.send(
+        f"Found leaderboard for server '***{guild.name}***'!", ephemeral=True
+    )
+    return True
+
+
+async def turn_leaderboard_page(
+    interaction: Interaction, leaderboard_view: LeaderboardView, forward: bool
+):
+    """Shows the next or previous page of a leaderboard message.
+
+    Args:
+        interaction (Interaction): The button interaction.
+        leaderboard_view (LeaderboardView): The view of the leaderboard message.
+        forward (bool): True for the next page, False for the previous page.
+
+    Returns:
+        bool: True if successful. Otherwise, False.
+    """
+    guild: Guild = interaction.guild
+    cursor = leaderboard_view.last_cursor if forward else leaderboard_view.first_cursor
+    users, has_more = await find_leaderboard_page(guild.id, cursor, before=not forward)
+    if not users:
+        await interaction.response.send_message(
+            "There are no more players on the leaderboard.", ephemeral=True
+        )
+        return False
+    if forward:
+        offset = leaderboard_view.offset + LEADERBOARD_SIZE
+        leaderboard_view.set_page(users, offset, True, has_more)
+    else:
+        offset = max(leaderboard_view.offset - len(users), 0)
+        leaderboard_view.set_page(users, offset, has_more, True)
+    await interaction.response.edit_message(
+        embed=create_server_leaderboard_embed(guild, users, offset),
+        view=leaderboard_view,
+    )
+    return True
 
 
 async def retrieve_leaderboard_user_stats(
@@ -104,7 +191,7 @@ async def retrieve_leaderboard_user_stats(
     # Parse args
     # usage = 'Usage: `/leaderboard stats [name]`'
     guild: Guild = interaction.guild
-    db_guild = await _guild.find_guild(guild.id)
+    db_guild = await _guild.find_guild(guild.id, {LEADERBOARD: {"id": user.id}})
     # Check if user is in leaderboard
     db_user = find_leaderboard_user_by_id(db_guild, user.id)
     if not db_user:
@@ -113,7 +200,8 @@ async def retrieve_leaderboard_user_stats(
         )
         return False
     # Send stats of user
-    stat_embed = create_player_stat_embed(db_user, user)
+    rating_index = await _rating.get_rating_index(guild.id)
+    stat_embed = create_player_stat_embed(db_user, user, rating_index.rank(user.id))
     await interaction.channel.send(embed=stat_embed)
     await interaction.followup.send(
         f"Found stats for user <@!{user.id}>!", ephemeral=True
@@ -121,88 +209,167 @@ async def retrieve_leaderboard_user_stats(
     return True
 
 
-async def create_leaderboard_user(
-    guild: Guild, db_challenge: dict, db_player: dict, win: bool
-):
-    """Creates a new user in a guild challenge leaderboard.
+def history_entry(guild_id: int, db_challenge: dict, db_player: dict, win: bool):
+    """Returns the history document of one player's result in a challenge.
 
     Args:
-        guild (Guild): The target discord guild.
-        db_challenge (dict): The challenge database document.
+        guild_id (int): The target guild id.
+        db_challenge (dict): The reported challenge database document.
         db_player (dict): The player database document.
         win (bool): The match result. True if a win, False, if a loss.
 
     Returns:
-        The new user document if successful. Otherwise, False.
+        dict: The history document.
     """
-    new_user = {
-        "id": db_player["id"],
-        "name": db_player["name"],
-        "wins": 1 if win else 0,
-        "losses": 0 if win else 1,
-        "matches": [db_challenge["id"]],
+    player1, player2 = db_challenge["player1"], db_challenge["player2"]
+    opponent = player2 if db_player["id"] == player1["id"] else player1
+    return {
+        "guild_id": guild_id,
+        "user_id": db_player["id"],
+        "challenge_id": db_challenge["id"],
+        "opponent_id": opponent["id"],
+        "win": win,
+        "reported_at": db_challenge["completed"] or datetime.now(),
     }
-    try:
-        await _guild.push_to_guild(guild, LEADERBOARD, new_user)
-        print(
-            f"Added new user ['id'='{db_player['id']}'] to leaderboard ['guild_id'='{guild.id}']."
-        )
-    except Exception as e:
-        printlog(
-            f"Failed to add user ['id'={db_player['id']}] to leaderboard ['guild_id'='{guild.id}'].",
-            e,
-        )
-        return None
-    return new_user
 
 
-async def update_leaderboard_user_score(
-    guild_id: int, db_challenge: dict, db_user: dict, win: bool
-):
-    """Updates a user's wins/losses in a guild challenge leaderboard.
+def summarize_history(history: list) -> dict:
+    """Returns the streak and form counters of a user from their history, oldest first.
+
+    Args:
+        history (list): The user's history documents.
+
+    Returns:
+        dict: The "streak", "best_streak" and "form" counters.
+    """
+    streak = best_streak = 0
+    for entry in history:
+        streak = max(streak, 0) + 1 if entry["win"] else min(streak, 0) - 1
+        best_streak = max(best_streak, streak)
+    form = ["W" if entry["win"] else "L" for entry in history[-FORM_SIZE:]]
+    return {"streak": streak, "best_streak": best_streak, "form": form}
+
+
+def result_update(guild_id: int, db_player: dict, win: bool) -> UpdateOne:
+    """Returns the write that counts a challenge result for a player, adding the player to
+    the leaderboard if needed. The write is an update pipeline, so every counter is
+    computed from the stored values by the database rather than read and written back.
 
     Args:
         guild_id (int): The target guild id.
-        db_challenge (dict): The challenge database document.
-        db_user (dict): The leaderboard user database document.
+        db_player (dict): The player database document.
         win (bool): The match result. True if a win, False, if a loss.
 
     Returns:
-        The updated leaderboard user document if successful. Otherwise, None.
+        UpdateOne: The upsert.
     """
+
+    def stored(field: str, default=0):
+        return {"$ifNull": [f"${field}", default]}
+
     if win:
-        db_user["wins"] += 1
+        streak = {"$add": [{"$max": [stored("streak"), 0]}, 1]}
     else:
-        db_user["losses"] += 1
-
-    # Add challenge to list
-    db_user["matches"].append(db_challenge["id"])
-    try:
-        result = await set_leaderboard_user(guild_id, db_user["id"], db_user)
-        if not result:
-            print(
-                f"Failed to update record of to user ['id'='{db_user['id']}'] in leaderboard ['guild_id'='{guild_id}']."
-            )
-        if win:
-            print(
-                f"Added win to user ['id'='{db_user['id']}'] in leaderboard ['guild_id'='{guild_id}']."
-            )
-        else:
-            print(
-                f"Added loss to user ['id'='{db_user['id']}'] in leaderboard ['guild_id'='{guild_id}']."
-            )
-    except Exception as e:
-        if win:
-            printlog(
-                f"Failed to add user ['id'={db_user['id']}] in leaderboard ['guild_id'='{guild_id}'].",
-                e,
-            )
-        else:
-            printlog(
-                f"Failed to add loss to user ['id'='{db_user['id']}'] in leaderboard ['guild_id'='{guild_id}']."
-            )
-        return None
-    return db_user
+        streak = {"$subtract": [{"$min": [stored("streak"), 0]}, 1]}
+    pipeline = [
+        {
+            "$set": {
+                "name": stored("name", db_player["name"]),
+                "wins": {"$add": [stored("wins"), 1 if win else 0]},
+                "losses": {"$add": [stored("losses"), 0 if win else 1]},
+                "total": {"$add": [stored("total"), 1]},
+                "streak": streak,
+            }
+        },
+        {
+            "$set": {
+                "best_streak": {"$max": [stored("best_streak"), "$streak"]},
+                "form": {
+                    "$slice": [
+                        {"$concatArrays": [stored("form", []), ["W" if win else "L"]]},
+                        -FORM_SIZE,
+                    ]
+                },
+            }
+        },
+    ]
+    return UpdateOne(
+        {"guild_id": guild_id, "id": db_player["id"]}, pipeline, upsert=True
+    )
+
+
+async def record_challenge_result(
+    guild_id: int, db_challenge: dict, winner: dict, loser: dict
+):
+    """Counts a reported challenge for both players in one bulk write, and records it in
+    the history collection.
+
+    Args:
+        guild_id (int): The target guild id.
+        db_challenge (dict): The reported challenge database document.
+        winner (dict): The winning player database document.
+        loser (dict): The losing player database document.
+
+    Returns:
+        bool: True if successful. Otherwise, False.
+    """
+    result = await mdb.bulk_write(
+        [result_update(guild_id, winner, True), result_update(guild_id, loser, False)],
+        LEADERBOARD,
+        ordered=False,
+    )
+    if not result:
+        printlog(
+            f"Failed to update leaderboard for challenge ['id'={db_challenge['id']}] ['guild_id'='{guild_id}']."
+        )
+        return False
+    await mdb.add_documents(
+        [
+            history_entry(guild_id, db_challenge, winner, True),
+            history_entry(guild_id, db_challenge, loser, False),
+        ],
+        HISTORY,
+    )
+    print(
+        f"Added win to user ['id'='{winner['id']}'] and loss to user ['id'='{loser['id']}'] in leaderboard ['guild_id'='{guild_id}']."
+    )
+    return True
+
+
+async def remove_leaderboard_result(guild_id: int, db_challenge: dict):
+    """Removes a deleted challenge from the history and counters of both of its players.
+    Streaks and form are recounted from each player's remaining history.
+
+    Args:
+        guild_id (int): The target guild id.
+        db_challenge (dict): The deleted challenge database document.
+
+    Returns:
+        bool: True if successful. Otherwise, False.
+    """
+    target = {"guild_id": guild_id, "challenge_id": db_challenge["id"]}
+    entries = await mdb.find_documents(target, HISTORY)
+    if not entries:
+        return False
+    await mdb.delete_documents(target, HISTORY)
+    for entry in entries:
+        history = await mdb.find_documents(
+            {"guild_id": guild_id, "user_id": entry["user_id"]},
+            HISTORY,
+            sort=schema.HISTORY_ORDER,
+        )
+        await mdb.update_single_document(
+            {"guild_id": guild_id, "id": entry["user_id"]},
+            {
+                "$inc": {"total": -1, "wins" if entry["win"] else "losses": -1},
+                "$set": summarize_history(history or []),
+            },
+            LEADERBOARD,
+        )
+        print(
+            f"Removed {'win' if entry['win'] else 'loss'} from leaderboard user ['id'='{entry['user_id']}']."
+        )
+    return True
 
 
 #######################
@@ -210,39 +377,56 @@ async def update_leaderboard_user_score(
 #######################
 
 
-def create_server_leaderboard_embed(guild: Guild, db_leaderboard: dict) -> Embed:
-    """[INCOMPLETE] Creates an embed to display the server leaderboard.
-    TODO: ELO Tracker + leaderboard list.
+def create_server_leaderboard_embed(
+    guild: Guild, db_leaderboard: list, offset: int = 0
+) -> Embed:
+    """Creates an embed to display the server leaderboard.
 
     Args:
         guild (Guild): The discord guild.
-        db_leaderboard (dict): The target leaderboard database document.
+        db_leaderboard (list): The leaderboard users to list, from highest to lowest rating.
+        offset (int, optional): The number of better rated users before the list. Defaults to 0.
 
     Returns:
         Embed: The resulting Embed instance.
     """
     embed = Embed(title=f"Server Challenge Leaderboard", color=GOLD)
-    embed.set_author(name=guild.name, icon_url=guild.icon.url)
-    embed.add_field(name="Player", value="1. Zain")
-    embed.add_field(name="Rating", value="1200")
+    embed.set_author(name=guild.name, icon_url=guild.icon.url if guild.icon else None)
+    players = "\n".join(
+        f"{offset + i + 1}. {db_user['name']}"
+        for i, db_user in enumerate(db_leaderboard)
+    )
+    ratings = "\n".join(f"{db_user['rating']:.0f}" for db_user in db_leaderboard)
+    embed.add_field(name="Player", value=players or "No rated players yet.")
+    embed.add_field(name="Rating", value=ratings or "-")
     embed.set_footer(text=f"beta-bot | GitHub 🤖", icon_url=ICON)
     return embed
 
 
-def create_player_stat_embed(db_user: dict, user: Member) -> Embed:
+def format_streak(streak: int) -> str:
+    """Formats a streak counter, ex. W3 for three wins in a row or L2 for two losses."""
+    if streak == 0:
+        return "-"
+    return f"W{streak}" if streak > 0 else f"L{-streak}"
+
+
+def create_player_stat_embed(db_user: dict, user: Member, rank: int = None) -> Embed:
     """Creates an embed to display user stats in a guild leaderboard.
 
     Args:
         db_user (dict): The target user database document.
         user (Member): Tje target user discird instance.
+        rank (int, optional): The user's rank by rating. Defaults to None.
 
     Returns:
         Embed: The resulting Embed instance.
     """
-    total_matches = len(db_user["matches"])
+    # Users from before the history collection still have their challenge ids
+    total_matches = db_user.get("total", len(db_user.get("matches", [])))
     wins = db_user["wins"]
     losses = db_user["losses"]
-    win_rate = "{0:.2%}".format(wins / total_matches)
+    # Users rated only from tournament matches have no challenges yet
+    win_rate = "{0:.2%}".format(wins / total_matches) if total_matches else "-"
     embed = Embed(
         title=f"📈  Leaderboard Player Stats",
         description=f"Stats for: <@!{db_user['id']}>",
@@ -256,6 +440,10 @@ def create_player_stat_embed(db_user: dict, user: Member) -> Embed:
     embed.add_field(name="Losses", value=f"{losses}")
     embed.add_field(name="Total Challenges", value=f"{total_matches}")
     embed.add_field(name="Win Rate", value=f"{win_rate}")
+    embed.add_field(name="Streak", value=format_streak(db_user.get("streak", 0)))
+    embed.add_field(name="Form", value=" ".join(db_user.get("form", [])) or "-")
+    embed.add_field(name="Rating", value=f"{_rating.rating_of(db_user)['rating']:.0f}")
+    embed.add_field(name="Rank", value=f"#{rank}" if rank else "-")
     embed.set_footer(text=f"beta-bot | GitHub 🤖", icon_url=ICON)
     return embed
 
@@ -274,10 +462,10 @@ async def set_leaderboard_user(guild_id: int, user_id: int, new_user: dict):
         new_user (dict): The new user database document.
 
     Returns:
-        The updated guild document if successful. Otherwise, returns None.
+        The updated leaderboard user document if successful. Otherwise, returns None.
     """
     return await mdb.update_single_document(
-        {"guild_id": guild_id, "leaderboard.id": user_id},
-        {"$set": {f"leaderboard.$": new_user}},
-        GUILDS,
+        {"guild_id": guild_id, "id": user_id},
+        {"$set": schema.strip_document(new_user)},
+        LEADERBOARD,
     )
@@ -1,7 +1,9 @@
-from datetime import datetime
+import asyncio
+import os
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime, timedelta
 from pprint import pprint
 
-import challonge
 import discord
 import pytz
 from discord import (
@@ -18,19 +20,41 @@ from discord import (
     User,
 )
 
+from api import challonge
+from db import eventlog, mdb, schema
 from guilds import guild as _guild
+from modules import bracket as _bracket
 from modules import challenge as _challenge
+from modules import editor as _editor
+from modules import outbox as _outbox
 from modules import participant as _participant
+from modules import rating as _rating
+from modules import render as _render
 from modules import tournament as _tournament
 from utils.color import BLACK, GREEN, RED, WOOP_PURPLE
 from utils.common import full_command
-from utils.constants import ICON, MATCHES
+from utils import index as _index
+from utils.constants import ICON, MATCHES, TOURNAMENTS
 from utils.log import printlog
 from views.voting_view import VotingView
 
 # match.py
 # Tournament matches
 
+# Calls of new matches are serialized per tournament id
+match_call_locks = defaultdict(asyncio.Lock)
+# Match messages deleted at the same time when they cannot be bulk deleted
+MATCH_DELETE_CONCURRENCY = int(os.getenv("MATCH_DELETE_CONCURRENCY", 5))
+# Tournament ids by match message id, least recently used first. Button presses are routed
+# to their own tournament, so guilds can run several tournaments at the same time.
+match_routes = OrderedDict()
+MATCH_ROUTE_CACHE_SIZE = int(os.getenv("MATCH_ROUTE_CACHE_SIZE", 4096))
+# Match messages sent before pausing when many matches open at once (ex. at the start
+# of a large bracket), and the seconds to pause. Discord allows about 5 messages per
+# 5 seconds in a channel.
+MATCH_CALL_BATCH = int(os.getenv("MATCH_CALL_BATCH", 5))
+MATCH_CALL_INTERVAL = float(os.getenv("MATCH_CALL_INTERVAL", 5))
+
 
 def find_match(db_tournament: dict, match_id: int):
     """Retrieves and returns a match document from the database (if it exists).
@@ -42,11 +66,7 @@ def find_match(db_tournament: dict, match_id: int):
     Returns:
         The match document if found. Otherwise, None.
     """
-    tournament_matches = db_tournament["matches"]
-    result = [match for match in tournament_matches if match["id"] == match_id]
-    if result:
-        return result[0]
-    return None
+    return _index.find(db_tournament["matches"], "id", match_id)
 
 
 def find_match_by_challonge_id(db_tournament: dict, challonge_id: int):
@@ -59,13 +79,7 @@ def find_match_by_challonge_id(db_tournament: dict, challonge_id: int):
     Returns:
         The match document if found. Otherwise, None.
     """
-    tournament_matches = db_tournament["matches"]
-    result = [
-        match for match in tournament_matches if match["challonge_id"] == challonge_id
-    ]
-    if result:
-        return result[0]
-    return None
+    return _index.find(db_tournament["matches"], "challonge_id", challonge_id)
 
 
 async def create_match(
@@ -120,10 +134,11 @@ async def create_match(
 
     # Add match document to database
     new_match["id"] = match_message.id
+    add_match_route(match_message.id, db_tournament["id"])
     if db_flag:
         try:
             db_guild, db_tournament = await _tournament.add_to_tournament(
-                db_guild["guild_id"], tournament_title, MATCHES, new_match
+                db_guild["guild_id"], tournament_title, MATCHES, new_match, "match_called"
             )
             print(
                 f"Added new match ['id'='{match_message.id}'] to tournament ['name'='{tournament_title}']."
@@ -137,68 +152,185 @@ async def create_match(
     return new_match
 
 
+def add_match_route(message_id: int, tournament_id: int):
+    """Remembers the tournament of a match message.
+
+    Args:
+        message_id (int): The id of the match message (and match).
+        tournament_id (int): The id of the tournament the match belongs to.
+    """
+    match_routes[message_id] = tournament_id
+    match_routes.move_to_end(message_id)
+    while len(match_routes) > MATCH_ROUTE_CACHE_SIZE:
+        match_routes.popitem(last=False)
+
+
+async def route_match_message(guild_id: int, message_id: int):
+    """Returns the id of the tournament a match message belongs to.
+    Routes are cached; on a miss, the match is looked up by its indexed id.
+
+    Args:
+        guild_id (int): The id of the guild the message was sent in.
+        message_id (int): The id of the match message (and match).
+
+    Returns:
+        The tournament id if the message is a match message. Otherwise, None.
+    """
+    tournament_id = match_routes.get(message_id)
+    if tournament_id is not None:
+        match_routes.move_to_end(message_id)
+        return tournament_id
+    db_match = await mdb.find_document(
+        {"guild_id": guild_id, "id": message_id},
+        MATCHES,
+        projection={"tournament_id": 1},
+    )
+    if not db_match:
+        return None
+    add_match_route(message_id, db_match["tournament_id"])
+    return db_match["tournament_id"]
+
+
 async def delete_match(
     tournament_thread: Thread, db_guild: dict, db_tournament: dict, match_id: int
 ):
-    """Deletes a match, and recursively deletes all dependent matches.
-    First deletes the match from the database, then attempts to delete the match message.
+    """Deletes a match, and all matches that depend on it.
 
     Args:
         tournament_thread (Thread): The tournament thread.
         db_guild (dict): The guild database document.
         db_tournament (dict): The tournament database document
-        match_id (int): _description_
+        match_id (int): The id of the target match.
 
     Returns:
-        _type_: _description_
+        A tuple of the updated guild document and tournament document if successful.
+        Otherwise, a tuple of None, None.
     """
-    guild: Guild = tournament_thread.guild
-    guild_id = guild.id
-    tournament_title = db_tournament["title"]
+    return await delete_matches(tournament_thread, db_guild, db_tournament, [match_id])
 
-    # Check if match is in database
-    try:
+
+def find_dependent_matches(db_tournament: dict, match_ids: list) -> list:
+    """Returns the given matches and every match that depends on them, through next_matches.
+
+    Args:
+        db_tournament (dict): The tournament database document.
+        match_ids (list): The ids of the target matches.
+
+    Returns:
+        list: The ids of the matches in the database, in breadth-first order.
+    """
+    found = []
+    visited = set()
+    queue = deque(match_ids)
+    while queue:
+        match_id = queue.popleft()
+        if match_id in visited:
+            continue
+        visited.add(match_id)
         db_match = find_match(db_tournament, match_id)
-    except:
+        if not db_match:
+            continue
+        found.append(match_id)
+        queue.extend(db_match["next_matches"])
+    return found
+
+
+async def delete_matches(
+    tournament_thread: Thread, db_guild: dict, db_tournament: dict, match_ids: list
+):
+    """Deletes matches, and all matches that depend on them.
+    First deletes every match from the database in one request, then deletes the match messages.
+
+    Args:
+        tournament_thread (Thread): The tournament thread.
+        db_guild (dict): The guild database document.
+        db_tournament (dict): The tournament database document
+        match_ids (list): The ids of the target matches.
+
+    Returns:
+        A tuple of the updated guild document and tournament document if successful.
+        Otherwise, a tuple of None, None.
+    """
+    guild_id = tournament_thread.guild.id
+    tournament_title = db_tournament["title"]
+    deleted_ids = find_dependent_matches(db_tournament, match_ids)
+    if not deleted_ids:
+        return (db_guild, db_tournament)
+
+    # Delete from matches
+    if not await eventlog.log(
+        guild_id,
+        db_tournament["id"],
+        "matches_deleted",
+        [eventlog.delete(MATCHES, deleted_ids)],
+        {"ids": deleted_ids},
+    ):
         print(
-            "Something went wrong when checking database for match ['id'='{match_id}']."
+            f"Failed to delete {len(deleted_ids)} matches from database for tournament ['name'='{tournament_title}']."
         )
+        return (None, None)
+    print(
+        f"Deleted {len(deleted_ids)} matches from tournament ['name'='{tournament_title}']."
+    )
 
-    if db_match:
-        # Recursively delete matches that come after this one
-        for next_match_id in db_match["next_matches"]:
-            db_guild, db_tournament = await delete_match(
-                tournament_thread, db_guild, db_tournament, next_match_id
-            )
+    # Delete match messages
+    for match_id in deleted_ids:
+        match_routes.pop(match_id, None)
+    await delete_match_messages(tournament_thread, deleted_ids)
+    db_guild = await _guild.find_guild(guild_id, {TOURNAMENTS: {"id": db_tournament["id"]}})
+    return (db_guild, _tournament.find_tournament_by_id(db_guild, db_tournament["id"]))
 
-        # Delete from matches
-        try:
-            db_guild, db_tournament = await _tournament.remove_from_tournament(
-                guild_id, tournament_title, MATCHES, match_id
-            )
-            print(
-                f"Deleted match ['id'='{db_match['id']}'] from tournament ['name'='{tournament_title}']."
-            )
-        except:
-            print(
-                f"Failed to delete match [id='{match_id}'] from database for tournament ['name'='{tournament_title}']."
-            )
-            return (None, None)
 
-        # Delete match message
-        try:
-            match_message = await tournament_thread.fetch_message(db_match["id"])
-            await match_message.delete()  # delete message from channel
-        except NotFound:
-            printlog(
-                f"Failed to delete message for match [id='{match_id}']; Not found."
-            )
-        except discord.Forbidden:
-            printlog(
-                f"Failed to delete message for match [id='{match_id}']; Bot does not have proper permissions."
-            )
-            return (None, None)
-    return (db_guild, db_tournament)
+async def delete_match_messages(tournament_thread: Thread, match_ids: list):
+    """Deletes match messages from a tournament thread.
+    Messages younger than two weeks are bulk deleted (up to 100 per request) if the bot can
+    manage messages; the others are deleted one by one, MATCH_DELETE_CONCURRENCY at a time.
+
+    Args:
+        tournament_thread (Thread): The tournament thread.
+        match_ids (list): The ids of the match messages.
+    """
+    remaining = list(match_ids)
+    permissions = tournament_thread.permissions_for(tournament_thread.guild.me)
+    if permissions.manage_messages:
+        # Discord only bulk deletes messages younger than 14 days
+        bulk_cutoff = discord.utils.utcnow() - timedelta(days=13)
+        recent = [
+            match_id
+            for match_id in remaining
+            if discord.utils.snowflake_time(match_id) > bulk_cutoff
+        ]
+        for i in range(0, len(recent), 100):
+            chunk = recent[i : i + 100]
+            if len(chunk) < 2:
+                break
+            try:
+                await tournament_thread.delete_messages(
+                    [discord.Object(id=match_id) for match_id in chunk]
+                )
+                remaining = [
+                    match_id for match_id in remaining if match_id not in chunk
+                ]
+            except discord.HTTPException as e:
+                printlog("Failed to bulk delete match messages.", e)
+                break
+
+    semaphore = asyncio.Semaphore(MATCH_DELETE_CONCURRENCY)
+
+    async def delete_message(match_id: int):
+        async with semaphore:
+            try:
+                await tournament_thread.get_partial_message(match_id).delete()
+            except NotFound:
+                printlog(
+                    f"Failed to delete message for match [id='{match_id}']; Not found."
+                )
+            except discord.Forbidden:
+                printlog(
+                    f"Failed to delete message for match [id='{match_id}']; Bot does not have proper permissions."
+                )
+
+    await asyncio.gather(*[delete_message(match_id) for match_id in remaining])
 
 
 async def vote_match_button(interaction: Interaction, button: Button) -> bool:
@@ -214,8 +346,6 @@ async def vote_match_button(interaction: Interaction, button: Button) -> bool:
     channel: TextChannel = interaction.channel
     guild: Guild = interaction.guild
     message: Message = interaction.message
-    db_guild = await _guild.find_guild(guild.id)
-    match_message: Message = await channel.fetch_message(message.id)
     emoji = button.emoji.name
 
     # Check args
@@ -223,10 +353,17 @@ async def vote_match_button(interaction: Interaction, button: Button) -> bool:
         await interaction.followup.send("Invalid vote.")
         return False
 
-    # Get current active tournament, if any
-    db_tournament = _tournament.find_active_tournament(db_guild)
+    # Load only the active tournament the match belongs to
+    tournament_id = await route_match_message(guild.id, message.id)
+    if tournament_id is None:
+        return False
+    db_guild = await _guild.find_guild(
+        guild.id, {TOURNAMENTS: {**schema.ACTIVE_TOURNAMENT, "id": tournament_id}}
+    )
+    db_tournament = _tournament.find_tournament_by_id(db_guild, tournament_id)
     if not db_tournament:
         return False
+    match_message: Message = await channel.fetch_message(message.id)
 
     # Check if reaction was on a match message
     db_match = find_match(db_tournament, match_message.id)
@@ -487,30 +624,39 @@ async def report_match(
         )
         score = "0-1"
         
-    # Update on challonge
-    try:
-        challonge.matches.update(
-            tournament_challonge_id,
-            match_challonge_id,
-            scores_csv=score,
-            winner_id=winner["challonge_id"],
-        )
-    except Exception as e:
+    # Queue the result for challonge; the bracket advances from the database meanwhile
+    if not await _outbox.enqueue(
+        db_guild["guild_id"],
+        tournament_challonge_id,
+        "update_match",
+        f"update_match:{match_challonge_id}:{winner['challonge_id']}",
+        {
+            "match_id": match_challonge_id,
+            "scores_csv": score,
+            "winner_id": winner["challonge_id"],
+        },
+    ):
         printlog(
-            f"Something went wrong when reporting match ['challonge_id'={match_challonge_id}] on challonge.",
-            e,
+            f"Something went wrong when reporting match ['challonge_id'={match_challonge_id}] on challonge."
         )
         return None, None
     
     # Update status in db
     try:
-        db_match.update(
-            {
-                "completed": datetime.now(tz=pytz.timezone("US/Eastern")),
-                "winner_emote": winner_emote,
-            }
+        match_result = {
+            "completed": datetime.now(tz=pytz.timezone("US/Eastern")),
+            "winner_emote": winner_emote,
+            "is_dq": is_dq,
+        }
+        db_match.update(match_result)
+        await update_match(
+            db_guild["guild_id"],
+            db_tournament,
+            match_id,
+            {"$set": match_result},
+            "match_reported",
+            {"match_id": match_id, "winner_id": winner["id"], "is_dq": is_dq},
         )
-        await set_match(db_guild["guild_id"], db_tournament, db_match)
     except Exception as e:
         printlog(f"Failed to report match ['id'={match_id}] in database.", e)
         return None, None
@@ -535,8 +681,14 @@ async def report_match(
     )
     
     # Call new open matches
+    # Disqualifications forfeit the player's later matches on Challonge, which the local
+    # bracket does not track, so they are reconciled with Challonge instead
     count = await call_open_matches(
-        client, match_message.channel, db_guild, db_tournament
+        client,
+        match_message.channel,
+        db_guild,
+        db_tournament,
+        reported_match=None if is_dq else db_match,
     )
     
     # Check if was last match in the tournament
@@ -544,24 +696,26 @@ async def report_match(
         await match_message.channel.send(
             f"'***{db_tournament['title']}***' has been completed! Use `/bracket finalize {db_tournament['title']}` to finalize the results!"
         )
+
+    # Update the leaderboard ratings of both players; disqualifications were not played
+    if not is_dq:
+        loser = participant2 if winner_emote == "1️⃣" else participant1
+        await _rating.record_result(db_guild["guild_id"], winner, loser)
         
     # Update tournament embed image
     try:
-        tournament_channel = await match_message.guild.fetch_channel(
+        tournament_channel = match_message.guild.get_channel(
             db_tournament["channel_id"]
-        )
+        ) or await match_message.guild.fetch_channel(db_tournament["channel_id"])
         if str(tournament_channel.type) == "forum":
-            tournament_message: Message = await match_message.channel.fetch_message(
-                db_tournament["id"]
+            tournament_message: Message = await _editor.get_message(
+                match_message.channel, db_tournament["id"]
             )
         else:
-            tournament_message: Message = await tournament_channel.fetch_message(
-                db_tournament["id"]
+            tournament_message: Message = await _editor.get_message(
+                tournament_channel, db_tournament["id"]
             )
-        updated_tournament_embed = _tournament.create_tournament_image(
-            db_tournament, tournament_message.embeds[0]
-        )
-        await tournament_message.edit(content=None, embed=updated_tournament_embed)
+        _render.schedule_tournament_image(db_tournament, tournament_message)
     except Exception as e:
         printlog(
             f"Failed to create image for tournament ['title'='{tournament_title}'].", e
@@ -570,84 +724,246 @@ async def report_match(
 
 
 async def call_open_matches(
-    client: Client, tournament_thread: Thread, db_guild: dict, db_tournament: dict
+    client: Client,
+    tournament_thread: Thread,
+    db_guild: dict,
+    db_tournament: dict,
+    reported_match: dict = None,
 ) -> int:
-    """Calls newly opened matches from challonge.
-    Returns 
+    """Calls the matches opened by a reported match.
+    The opened matches are derived from the stored bracket structure, so Challonge is only
+    queried for tournaments started without one, or if no reported match is provided.
 
     Args:
         client (Client): The Discord bot client user.
         tournament_thread (Thread): The tournament Discord thread.
         db_guild (dict): The guild database document.
         db_tournament (dict): The target tournament database document.
+        reported_match (dict, optional): The reported match database document. Defaults to None.
 
     Returns:
         int: The number of new open matches if successful. Otherwise, returns -1.
     """
-    # Fetch new open matches from challonge.
+    if not reported_match or not db_tournament.get("bracket"):
+        return await reconcile_open_matches(
+            client, tournament_thread, db_guild, db_tournament
+        )
+    # Serialize with other reports in this tournament, so that two results reported at
+    # the same time cannot both miss the match they open together
+    async with match_call_locks[db_tournament["id"]]:
+        try:
+            await refresh_matches(db_tournament)
+            opened_matches = _bracket.find_opened_matches(
+                db_tournament, reported_match["challonge_id"]
+            )
+        except Exception as e:
+            printlog("Failed to get new matches.", e)
+            return -1
+        return await call_matches(
+            client, tournament_thread, db_guild, db_tournament, opened_matches
+        )
+
+
+async def reconcile_open_matches(
+    client: Client, tournament_thread: Thread, db_guild: dict, db_tournament: dict
+) -> int:
+    """Calls every open match on Challonge that has not been called yet.
+    Challonge is the source of truth for the bracket, so this also recovers matches that
+    were missed (ex. forfeits after a disqualification).
+
+    Args:
+        client (Client): The Discord bot client user.
+        tournament_thread (Thread): The tournament Discord thread.
+        db_guild (dict): The guild database document.
+        db_tournament (dict): The target tournament database document.
+
+    Returns:
+        int: The number of open matches if successful. Otherwise, returns -1.
+    """
+    # Fetch open matches from challonge, once it has every queued result
+    if not await _outbox.drain(db_tournament["challonge"]["id"]):
+        printlog(
+            f"Queued challonge writes of tournament ['title'='{db_tournament['title']}'] are still pending."
+        )
+        return -1
     try:
-        challonge_matches = challonge.matches.index(
+        challonge_matches = await challonge.matches.index(
             db_tournament["challonge"]["id"], state="open"
         )
     except Exception as e:
         printlog("Failed to get new matches.", e)
         return -1
-    
-    for challonge_match in challonge_matches:
-        # Check if match has already been called (in database)
+    async with match_call_locks[db_tournament["id"]]:
         try:
-            check_match = find_match_by_challonge_id(
-                db_tournament, challonge_match["id"]
-            )
+            await refresh_matches(db_tournament)
         except Exception as e:
-            printlog("Failed to check match in database.", e)
+            printlog("Failed to get new matches.", e)
             return -1
-        
-        # Get match message too
-        if check_match:
-            continue
-        new_match = await create_match(
-            client, tournament_thread, db_guild, db_tournament, challonge_match
+        count = await call_matches(
+            client, tournament_thread, db_guild, db_tournament, challonge_matches
         )
-        db_tournament["matches"].append(new_match)
-        
-        # Add new match message_id to dependent matches' next_matches list
+    return len(challonge_matches) if count >= 0 else -1
+
+
+async def reconcile_active_tournaments(client: Client):
+    """Reconciles the called matches of every active tournament with Challonge.
+
+    Args:
+        client (Client): The Discord bot client user.
+    """
+    for db_tournament in await schema.find_tournaments(schema.ACTIVE_TOURNAMENT):
         try:
-            db_match1 = find_match_by_challonge_id(
-                db_tournament, challonge_match["player1_prereq_match_id"]
+            tournament_thread = client.get_channel(
+                db_tournament["id"]
+            ) or await client.fetch_channel(db_tournament["id"])
+            db_guild = await _guild.find_guild(db_tournament["guild_id"], {})
+            count = await reconcile_open_matches(
+                client, tournament_thread, db_guild, db_tournament
             )
-            if db_match1:
-                db_match1["next_matches"].append(new_match["id"])
-                await set_match(db_guild["guild_id"], db_tournament, db_match1)
-                print(
-                    f"Added new match ['id'={new_match['id']}] to next_matches of match ['id'='{db_match1['id']}']."
-                )
+            if count < 0:
+                raise ValueError("open matches could not be called")
         except Exception as e:
-            print(
-                f"Failed to add new match ['id'='{new_match['id']}'] to next_matches of match ['id'='{db_match1['id']}']"
+            printlog(
+                f"Failed to reconcile matches for tournament ['title'='{db_tournament['title']}'].",
+                e,
             )
-            print(e)
+
+
+async def refresh_matches(db_tournament: dict):
+    """Reloads the called matches of a tournament from the database.
+
+    Args:
+        db_tournament (dict): The target tournament database document.
+    """
+    db_matches = await mdb.find_documents(
+        {"tournament_id": db_tournament["id"]}, MATCHES, sort=schema.INSERTION_ORDER
+    )
+    if db_matches is None:
+        raise ValueError(
+            f"Failed to load matches of tournament ['id'={db_tournament['id']}]."
+        )
+    db_tournament["matches"] = schema.index_documents(
+        MATCHES, [schema.strip_document(db_match) for db_match in db_matches]
+    )
+
+
+async def call_matches(
+    client: Client,
+    tournament_thread: Thread,
+    db_guild: dict,
+    db_tournament: dict,
+    challonge_matches: list,
+) -> int:
+    """Calls the given open matches that have not been called yet, and links them to
+    the matches they depend on.
+
+    Args:
+        client (Client): The Discord bot client user.
+        tournament_thread (Thread): The tournament Discord thread.
+        db_guild (dict): The guild database document.
+        db_tournament (dict): The target tournament database document.
+        challonge_matches (list): The open matches in the Challonge match format.
+
+    Returns:
+        int: The number of newly called matches if successful. Otherwise, returns -1.
+    """
+    db_matches = {
+        db_match["challonge_id"]: db_match for db_match in db_tournament["matches"]
+    }
+    uncalled_matches = [
+        challonge_match
+        for challonge_match in challonge_matches
+        if challonge_match["id"] not in db_matches
+    ]
+    count = 0
+    # Large brackets open many matches at once, so they are called in paced batches
+    for start in range(0, len(uncalled_matches), MATCH_CALL_BATCH):
+        if start:
+            await asyncio.sleep(MATCH_CALL_INTERVAL)
+        called_matches = []
+        failed = False
         try:
-            if (
-                challonge_match["player1_prereq_match_id"]
-                != challonge_match["player2_prereq_match_id"]
-            ):
-                db_match2 = find_match_by_challonge_id(
-                    db_tournament, challonge_match["player2_prereq_match_id"]
+            for challonge_match in uncalled_matches[start : start + MATCH_CALL_BATCH]:
+                new_match = await create_match(
+                    client,
+                    tournament_thread,
+                    db_guild,
+                    db_tournament,
+                    challonge_match,
+                    db_flag=False,
                 )
-                if db_match2:
-                    db_match2["next_matches"].append(new_match["id"])
-                    await set_match(db_guild["guild_id"], db_tournament, db_match2)
-                    print(
-                        f"Added new match ['id'={new_match['id']}] to next_matches of match ['id'='{db_match2['id']}']."
-                    )
+                called_matches.append((challonge_match, new_match))
         except Exception as e:
-            print(
-                f"Failed to add new match ['id'='{new_match['id']}'] to next_matches of match ['id'='{db_match2['id']}']"
+            printlog(
+                f"Failed to call match in tournament ['title'='{db_tournament['title']}'].",
+                e,
             )
-            print(e)
+            failed = True
+        # Save the matches that were sent, even if the batch failed part way
+        if called_matches and not await add_matches(
+            db_guild["guild_id"],
+            db_tournament,
+            [new_match for _, new_match in called_matches],
+        ):
+            return -1
+        for challonge_match, new_match in called_matches:
+            db_tournament["matches"].append(new_match)
+            db_matches[new_match["challonge_id"]] = new_match
+            count += 1
+
+            # Add new match message_id to dependent matches' next_matches list
+            prereq_ids = {
+                challonge_match["player1_prereq_match_id"],
+                challonge_match["player2_prereq_match_id"],
+            }
+            for prereq_id in prereq_ids:
+                db_prereq = db_matches.get(prereq_id)
+                if not db_prereq:
+                    continue
+                try:
+                    await add_next_match(
+                        db_guild["guild_id"], db_tournament, db_prereq, new_match["id"]
+                    )
+                    print(
+                        f"Added new match ['id'={new_match['id']}] to next_matches of match ['id'='{db_prereq['id']}']."
+                    )
+                except Exception as e:
+                    print(
+                        f"Failed to add new match ['id'='{new_match['id']}'] to next_matches of match ['id'='{db_prereq['id']}']"
+                    )
+                    print(e)
+                    return -1
+        if failed:
             return -1
-    return len(challonge_matches)
+    return count
+
+
+async def add_matches(guild_id: int, db_tournament: dict, new_matches: list) -> bool:
+    """Adds called matches to a tournament in a single write.
+
+    Args:
+        guild_id (int): The target guild id.
+        db_tournament (dict): The tournament database document.
+        new_matches (list): The new match documents.
+
+    Returns:
+        bool: True if successful. Otherwise, False.
+    """
+    if not await eventlog.log(
+        guild_id,
+        db_tournament["id"],
+        "matches_called",
+        [eventlog.put(MATCHES, new_match) for new_match in new_matches],
+        {"ids": [new_match["id"] for new_match in new_matches]},
+    ):
+        printlog(
+            f"Failed to add {len(new_matches)} matches to tournament ['title'='{db_tournament['title']}']."
+        )
+        return False
+    print(
+        f"Added {len(new_matches)} matches to tournament ['title'='{db_tournament['title']}']."
+    )
+    return True
 
 
 async def override_match_result(
@@ -680,6 +996,10 @@ async def override_match_result(
     )
     if not tournament_thread:
         return False
+
+    # Apply queued challonge writes first
+    if not await _outbox.wait_for_challonge(interaction, db_tournament):
+        return False
     
     # Check if actually changing the winner
     if (
@@ -691,13 +1011,14 @@ async def override_match_result(
         )
         return False
     
+    previous_winner_emote = db_match["winner_emote"]
+
     # Delete newly created matches
     next_matches = db_match["next_matches"]
     if len(next_matches) > 0:
-        for next_match_id in next_matches:
-            db_guild, db_tournament = await delete_match(
-                tournament_thread, db_guild, db_tournament, next_match_id
-            )
+        db_guild, db_tournament = await delete_matches(
+            tournament_thread, db_guild, db_tournament, next_matches
+        )
     
     # Report match
     match_message = await channel.fetch_message(db_match["id"])
@@ -716,6 +1037,9 @@ async def override_match_result(
     printlog(
         f"User ['name'='{user.name}#{user.discriminator}'] overwrote result for match ['id'='{db_match['id']}']. Winner: {db_winner['name']} {winner_emote}."
     )
+    # The previous result was already rated, so the guild's ratings are replayed
+    if previous_winner_emote:
+        await _rating.recompute_ratings(db_guild["guild_id"])
     await tournament_thread.send(
         embed=create_report_embed(interaction, db_match, db_winner)
     )
@@ -757,6 +1081,10 @@ async def repair_match(interaction: Interaction, tournament_title: str = "") ->
     except ValueError:
         return False
     
+    # Apply queued challonge writes first
+    if not await _outbox.wait_for_challonge(interaction, db_tournament):
+        return False
+
     # Go through all matches and check if they need to be recalled
     printlog(
         f"User '{user.name}#{user.discriminator}' called match medic for tournament '{db_tournament['title']}'"
@@ -771,7 +1099,7 @@ async def repair_match(interaction: Interaction, tournament_title: str = "") ->
         try:
             await tournament_thread.fetch_message(db_match["id"])
         except NotFound:
-            ch_match = challonge.matches.show(
+            ch_match = await challonge.matches.show(
                 db_tournament["challonge"]["id"], db_match["challonge_id"]
             )
             
@@ -786,7 +1114,7 @@ async def repair_match(interaction: Interaction, tournament_title: str = "") ->
             )
             
             # Update match id in database
-            await set_match(guild.id, db_tournament, new_match)
+            await set_match(guild.id, db_tournament, new_match, db_match["id"])
             print(f"Repaired match ['id'='{db_match['id']}'].")
             count += 1
     
@@ -833,12 +1161,16 @@ async def reset_match(interaction: Interaction, match_challonge_id: int) -> True
         await interaction.followup.send(f"This match has not been completed.")
         return False
     
+    # Apply queued challonge writes first
+    if not await _outbox.wait_for_challonge(interaction, db_tournament):
+        return False
+
     # Reset match on challonge
     try:
-        challonge.matches.reopen(
+        await challonge.matches.reopen(
             db_tournament["challonge"]["id"], match_challonge_id
         )  # does not return anything
-        ch_match = challonge.matches.show(
+        ch_match = await challonge.matches.show(
             db_tournament["challonge"]["id"], match_challonge_id
         )
     except Exception as e:
@@ -853,6 +1185,8 @@ async def reset_match(interaction: Interaction, match_challonge_id: int) -> True
     db_guild, db_tournament = await delete_match(
         tournament_thread, db_guild, db_tournament, db_match["id"]
     )
+    # The deleted results were already rated, so the guild's ratings are replayed
+    await _rating.recompute_ratings(db_guild["guild_id"])
     
     # Recreate match
     await create_match(
@@ -865,21 +1199,18 @@ async def reset_match(interaction: Interaction, match_challonge_id: int) -> True
     
     # Update tournament embed
     try:
-        tournament_channel = await tournament_thread.guild.fetch_channel(
+        tournament_channel = tournament_thread.guild.get_channel(
             db_tournament["channel_id"]
-        )
+        ) or await tournament_thread.guild.fetch_channel(db_tournament["channel_id"])
         if str(tournament_channel.type) == "forum":
-            tournament_message: Message = await tournament_thread.fetch_message(
-                db_tournament["id"]
+            tournament_message: Message = await _editor.get_message(
+                tournament_thread, db_tournament["id"]
             )
         else:
-            tournament_message: Message = await tournament_channel.fetch_message(
-                db_tournament["id"]
+            tournament_message: Message = await _editor.get_message(
+                tournament_channel, db_tournament["id"]
             )
-        updated_tournament_embed = _tournament.create_tournament_image(
-            db_tournament, tournament_message.embeds[0]
-        )
-        await tournament_message.edit(embed=updated_tournament_embed)
+        _render.schedule_tournament_image(db_tournament, tournament_message)
     except Exception as e:
         printlog(
             f"Failed to create image for tournament ['title'='{tournament_title}'].", e
@@ -895,6 +1226,37 @@ async def reset_match(interaction: Interaction, match_challonge_id: int) -> True
 ######################
 
 
+async def update_match(
+    guild_id: int,
+    db_tournament: dict,
+    match_id: int,
+    update_obj: dict,
+    event_type: str,
+    data: dict = None,
+):
+    """Applies an update to a single match document in the database, as one logged event.
+    Only the targeted fields are written, so the cost does not depend on the size of the tournament.
+
+    Args:
+        guild_id (int): The target guild id.
+        db_tournament (dict): The tournament database document.
+        match_id (int): The target match id.
+        update_obj (dict): The $set or $addToSet operators to apply (ex. {"$set": {"player1.vote": "1️⃣"}}).
+        event_type (str): The type of the logged event (ex. "vote_cast").
+        data (dict, optional): The facts of the logged event. Defaults to the match id.
+
+    Returns:
+        bool: True if successful. Otherwise, False.
+    """
+    return await eventlog.log(
+        guild_id,
+        db_tournament["id"],
+        event_type,
+        eventlog.writes_from_update(MATCHES, match_id, update_obj),
+        data or {"match_id": match_id},
+    )
+
+
 async def update_player(
     guild_id: int,
     db_tournament: dict,
@@ -908,48 +1270,92 @@ async def update_player(
         guild_id (int): The guild database document.
         db_tournament (dict): The tournament database document.
         match_id (int): The target match id.
-        updated_player1 (_type_, optional): The updated player1 document. Defaults to None.
-        updated_player2 (_type_, optional): The updated player2 document. Defaults to None.
+        updated_player1 (dict, optional): The updated player1 document. Defaults to None.
+        updated_player2 (dict, optional): The updated player2 document. Defaults to None.
 
     Returns:
-        _type_: _description_
+        bool: True if successful. Otherwise, False.
     """
-    tournament_title = db_tournament["title"]
-    match_index = _tournament.find_index_in_tournament(
-        db_tournament, MATCHES, "id", match_id
-    )
-    if updated_player1:
-        db_tournament["matches"][match_index]["player1"] = updated_player1
-    if updated_player2:
-        db_tournament["matches"][match_index]["player2"] = updated_player2
     if not (updated_player1 or updated_player2):
-        return None
-    return await _tournament.set_tournament(guild_id, tournament_title, db_tournament)
+        return False
+    db_match = find_match(db_tournament, match_id)
+    fields = {}
+    for player_key, updated_player in (
+        ("player1", updated_player1),
+        ("player2", updated_player2),
+    ):
+        if not updated_player:
+            continue
+        if db_match:
+            db_match[player_key] = updated_player
+        fields.update(
+            {f"{player_key}.{key}": value for key, value in updated_player.items()}
+        )
+    return await update_match(
+        guild_id, db_tournament, match_id, {"$set": fields}, "vote_cast"
+    )
+
+
+async def add_next_match(
+    guild_id: int, db_tournament: dict, db_match: dict, next_match_id: int
+):
+    """Links a match to one of the matches that its players advance to.
+
+    Args:
+        guild_id (int): The target guild id.
+        db_tournament (dict): The tournament database document.
+        db_match (dict): The target match document.
+        next_match_id (int): The id of the next match.
+
+    Returns:
+        bool: True if successful. Otherwise, False.
+    """
+    if next_match_id not in db_match["next_matches"]:
+        db_match["next_matches"].append(next_match_id)
+    return await update_match(
+        guild_id,
+        db_tournament,
+        db_match["id"],
+        {"$addToSet": {"next_matches": next_match_id}},
+        "match_linked",
+        {"match_id": db_match["id"], "next_match_id": next_match_id},
+    )
 
 
-async def set_match(guild_id: int, db_tournament: dict, db_match: dict):
+async def set_match(
+    guild_id: int, db_tournament: dict, db_match: dict, match_id: int = None
+):
     """Sets the targeted match document to a new match document in the database.
 
     Args:
         guild_id (int): The target guild id.
         db_tournament (dict): The tournament database document.
         db_match (dict): The updated match document.
+        match_id (int, optional): The id of the match to replace. Defaults to the id of db_match.
 
     Returns:
-        A pair of the updated guild document and updated tournament document.
+        bool: True if successful. Otherwise, False.
     """
-    tournament_title = db_tournament["title"]
+    match_id = match_id or db_match["id"]
     match_index = _tournament.find_index_in_tournament(
-        db_tournament, MATCHES, "id", db_match["id"]
+        db_tournament, MATCHES, "id", match_id
+    )
+    if match_index != -1:
+        db_tournament["matches"][match_index] = db_match
+    return await update_match(
+        guild_id,
+        db_tournament,
+        match_id,
+        {"$set": schema.strip_document(db_match)},
+        "match_recalled",
+        {"match_id": match_id, "new_match_id": db_match["id"]},
     )
-    db_tournament["matches"][match_index] = db_match
-    return await _tournament.set_tournament(guild_id, tournament_title, db_tournament)
 
 
 async def fetch_tournament_and_match(
     interaction: Interaction, db_guild: dict, match_challonge_id: int
 ):
-    """Returns the current active tournament and targeted match if they exist.
+    """Returns the active tournament of the targeted match and the match if they exist.
 
     Args:
         interaction (Interaction): The Discord command interaction.
@@ -960,20 +1366,21 @@ async def fetch_tournament_and_match(
         A tuple containing the tournament database document and the match database document. 
         Otherwise, returns a tuple of (None and None).
     """
-    # Fetch active tournament
-    db_tournament = _tournament.find_active_tournament(db_guild)
-    if not db_tournament:
+    # Fetch active tournaments
+    active_tournaments = _tournament.find_active_tournaments(db_guild)
+    if not active_tournaments:
         await interaction.followup.send(
             f"There are currently no active tournaments.", ephemeral=True
         )
         return (None, None)
     
-    # Get match
-    db_match = find_match_by_challonge_id(db_tournament, match_challonge_id)
-    if not db_match:
-        await interaction.followup.send(f"`match_id` is invalid.", ephemeral=True)
-        return (None, None)
-    return (db_tournament, db_match)
+    # Get match; Challonge match ids are unique across tournaments
+    for db_tournament in active_tournaments:
+        db_match = find_match_by_challonge_id(db_tournament, match_challonge_id)
+        if db_match:
+            return (db_tournament, db_match)
+    await interaction.followup.send(f"`match_id` is invalid.", ephemeral=True)
+    return (None, None)
 
 
 async def parse_vote(
@@ -1279,17 +1686,15 @@ def get_round_name(db_tournament: dict, match_id: int, round: int) -> str:
         match num_rounds - round:
             case 0:
                 if db_tournament["tournament_type"] == "double elimination":
-                    try:
-                        matches = challonge.matches.index(
-                            db_tournament["challonge"]["id"]
-                        )
-                        matches.sort(reverse=True, key=(lambda match: match["id"]))
-                        if match_id != matches[0]["id"]:
-                            return "Grand Finals Set 1"
-                        else:
-                            return "Grand Finals Set 2"
-                    except:
+                    grand_finals_reset = _bracket.is_grand_finals_reset(
+                        db_tournament, match_id
+                    )
+                    if grand_finals_reset is None:
                         return "Grand Finals"
+                    elif grand_finals_reset:
+                        return "Grand Finals Set 2"
+                    else:
+                        return "Grand Finals Set 1"
                 else:
                     return "Grand Finals"
             case 1:
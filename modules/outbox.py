@@ -0,0 +1,431 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+
+import aiohttp
+from discord import Interaction
+from pymongo import UpdateOne
+
+from api import challonge
+from api.challonge import RETRY_STATUSES, ChallongeException
+from db import eventlog, mdb, schema
+from utils.constants import OUTBOX, PARTICIPANTS
+from utils.log import printlog
+
+# outbox.py
+# Durable queue of Challonge writes
+#
+# Votes, joins and leaves update the database and reply to the user right away; the
+# Challonge writes they need are recorded in the outbox collection instead of being sent
+# inline. A worker per Challonge tournament applies the recorded writes in the order they
+# were made, retrying while Challonge is unreachable. Every entry has an idempotency key:
+# recording the same write twice (ex. a repeated vote) queues it once, and participants
+# are tagged with their key on Challonge (as "misc"), so a retried bulk add never adds
+# anyone twice. Pending entries survive restarts and are picked up again by resume().
+# Commands that read from Challonge (start, seeding, finalize, ...) drain the queue first.
+
+# Seconds before the first retry of a write that could not reach Challonge; doubles per attempt
+OUTBOX_RETRY_BASE = 1
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", 60))
+# Attempts before a write that keeps failing is dropped, so it cannot block the queue forever
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 100))
+# Writes are sent once per attempt; the worker owns every retry, so that an add that may
+# have been applied is looked up on Challonge before it is sent again
+NO_RETRIES = 0
+# Seconds a command waits for a tournament's queued writes before giving up
+OUTBOX_DRAIN_TIMEOUT = float(os.getenv("OUTBOX_DRAIN_TIMEOUT", 30))
+
+# Running workers by Challonge tournament id
+outbox_workers = {}
+outbox_stats = {"queued": 0, "applied": 0, "retried": 0, "rejected": 0, "failed": 0}
+
+
+async def enqueue(
+    guild_id: int, challonge_id: int, operation: str, key: str, args: dict
+) -> bool:
+    """Records a Challonge write and wakes the worker of its tournament.
+    Recording a write with the key of a write that is still queued does nothing.
+
+    Args:
+        guild_id (int): The id of the guild the write belongs to.
+        challonge_id (int): The Challonge id of the target tournament.
+        operation (str): The name of the write (see OPERATIONS).
+        key (str): The idempotency key of the write.
+        args (dict): The arguments of the write.
+
+    Returns:
+        bool: True if the write was recorded. Otherwise, False.
+    """
+    entry = {
+        "guild_id": guild_id,
+        "challonge_id": challonge_id,
+        "operation": operation,
+        "key": key,
+        "args": args,
+        "attempts": 0,
+        "error": None,
+        "created_at": datetime.now(tz=timezone.utc),
+    }
+    result = await mdb.bulk_write(
+        [UpdateOne({"key": key}, {"$setOnInsert": entry}, upsert=True)], OUTBOX
+    )
+    if result is None:
+        printlog(f"Failed to queue Challonge write ['key'='{key}'].")
+        return False
+    if result.upserted_count:
+        outbox_stats["queued"] += 1
+    schedule(challonge_id)
+    return True
+
+
+def schedule(challonge_id: int):
+    """Starts the worker of a tournament, or tells the running worker to look again.
+
+    Args:
+        challonge_id (int): The Challonge id of the target tournament.
+    """
+    job = outbox_workers.get(challonge_id)
+    if job:
+        job["pending"] = True
+        return
+    job = {"pending": True}
+    outbox_workers[challonge_id] = job
+    job["task"] = asyncio.create_task(run_worker(challonge_id))
+
+
+async def run_worker(challonge_id: int):
+    """Applies the queued writes of a tournament, oldest first, until none are left.
+
+    Args:
+        challonge_id (int): The Challonge id of the target tournament.
+    """
+    job = outbox_workers[challonge_id]
+    attempts = 0
+    try:
+        while job["pending"]:
+            job["pending"] = False
+            while True:
+                entries = await mdb.find_documents(
+                    {"challonge_id": challonge_id},
+                    OUTBOX,
+                    sort=schema.INSERTION_ORDER,
+                    limit=1,
+                )
+                if entries is None:
+                    # The database is unreachable; look again later
+                    attempts += 1
+                    await asyncio.sleep(retry_delay(attempts))
+                    continue
+                if not entries:
+                    break
+                attempts = 0
+                await apply_entry(entries[0])
+    except Exception as e:
+        printlog(
+            f"Outbox worker of Challonge tournament ['id'={challonge_id}] stopped.", e
+        )
+    finally:
+        del outbox_workers[challonge_id]
+
+
+def retry_delay(attempts: int) -> float:
+    """Returns the seconds to wait before the next attempt of a failed write."""
+    return min(OUTBOX_RETRY_BASE * 2 ** (attempts - 1), OUTBOX_RETRY_MAX)
+
+
+def is_transient(error: Exception) -> bool:
+    """Checks if a failed write may succeed when retried.
+
+    Args:
+        error (Exception): The error raised by the write.
+
+    Returns:
+        bool: True if Challonge was unreachable, timed out, rate limited the write or
+        failed with a server error. Otherwise, False.
+    """
+    if isinstance(error, ChallongeException):
+        return error.status is not None and (
+            error.status >= 500 or error.status in RETRY_STATUSES
+        )
+    # ConnectionError is also raised by operations that could not reach the database
+    return isinstance(
+        error, (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError)
+    )
+
+
+async def apply_entry(entry: dict):
+    """Applies a queued write, retrying while it fails for transient reasons, and
+    removes it from the queue. Writes that fail OUTBOX_MAX_ATTEMPTS times are dropped.
+
+    Args:
+        entry (dict): The outbox entry.
+    """
+    while True:
+        # Attempts are counted before they are made, so that an attempt interrupted by a
+        # restart is known to the next one
+        entry["attempts"] += 1
+        await mdb.update_single_document(
+            {"_id": entry["_id"]}, {"$inc": {"attempts": 1}}, OUTBOX
+        )
+        try:
+            await OPERATIONS[entry["operation"]](entry)
+            outbox_stats["applied"] += 1
+        except Exception as e:
+            transient = is_transient(e)
+            if transient and entry["attempts"] < OUTBOX_MAX_ATTEMPTS:
+                outbox_stats["retried"] += 1
+                await mdb.update_single_document(
+                    {"_id": entry["_id"]}, {"$set": {"error": str(e)}}, OUTBOX
+                )
+                await asyncio.sleep(retry_delay(entry["attempts"]))
+                continue
+            if isinstance(e, ChallongeException) and not transient:
+                outbox_stats["rejected"] += 1
+                printlog(
+                    f"Challonge rejected queued write ['key'='{entry['key']}']; it has been dropped.",
+                    e,
+                )
+            else:
+                outbox_stats["failed"] += 1
+                printlog(
+                    f"Failed to apply queued write ['key'='{entry['key']}'] after {entry['attempts']} attempt(s); it has been dropped.",
+                    e,
+                )
+        break
+    await mdb.delete_document({"_id": entry["_id"]}, OUTBOX)
+
+
+async def drain(challonge_id: int, timeout: float = OUTBOX_DRAIN_TIMEOUT) -> bool:
+    """Waits until every queued write of a tournament has been applied.
+
+    Args:
+        challonge_id (int): The Challonge id of the target tournament.
+        timeout (float, optional): The most seconds to wait. Defaults to OUTBOX_DRAIN_TIMEOUT.
+
+    Returns:
+        bool: True if the queue is empty. False if writes are still pending after the timeout,
+        or if the queue could not be read.
+    """
+    # Also picks up writes recorded before a restart
+    schedule(challonge_id)
+    try:
+        await asyncio.wait_for(
+            asyncio.shield(outbox_workers[challonge_id]["task"]), timeout
+        )
+    except asyncio.TimeoutError:
+        return False
+    # A worker that stopped on an error leaves its writes queued
+    remaining = await mdb.find_documents(
+        {"challonge_id": challonge_id}, OUTBOX, projection={"_id": 1}, limit=1
+    )
+    return remaining == []
+
+
+async def wait_for_challonge(
+    interaction: Interaction, db_tournament: dict, respond: bool = True
+) -> bool:
+    """Drains the queued writes of a tournament before a command reads from Challonge.
+
+    Args:
+        interaction (Interaction): The Discord command interaction.
+        db_tournament (dict): The target tournament database document.
+        respond (bool, optional): Flag to determine whether to respond if writes are still pending. Defaults to True.
+
+    Returns:
+        bool: True if Challonge is up to date. Otherwise, False.
+    """
+    if await drain(db_tournament["challonge"]["id"]):
+        return True
+    if respond:
+        await interaction.followup.send(
+            f"Challonge is still catching up with '***{db_tournament['title']}***'. Please try again in a moment.",
+            ephemeral=True,
+        )
+    return False
+
+
+async def resume():
+    """Starts the workers of every tournament with writes left from a previous run."""
+    entries = await mdb.find_documents({}, OUTBOX, projection={"challonge_id": 1})
+    for challonge_id in {entry["challonge_id"] for entry in entries or []}:
+        schedule(challonge_id)
+
+
+async def close():
+    """Stops the workers. Writes that were not applied stay queued for the next run."""
+    for job in list(outbox_workers.values()):
+        job["task"].cancel()
+
+
+################
+## OPERATIONS ##
+################
+
+
+async def update_match(entry: dict):
+    """Reports a match result. Reporting the same result again has no effect."""
+    args = entry["args"]
+    await challonge.matches.update(
+        entry["challonge_id"],
+        args["match_id"],
+        scores_csv=args["scores_csv"],
+        winner_id=args["winner_id"],
+        retries=NO_RETRIES,
+    )
+
+
+async def find_tagged_participants(challonge_id: int, keys: set) -> dict:
+    """Returns the Challonge participants tagged with one of the given idempotency keys.
+
+    Args:
+        challonge_id (int): The Challonge id of the target tournament.
+        keys (set): The idempotency keys.
+
+    Returns:
+        dict: The Challonge participants by key.
+    """
+    ch_participants = await challonge.participants.index(challonge_id)
+    return {
+        ch_participant["misc"]: ch_participant
+        for ch_participant in ch_participants
+        if ch_participant.get("misc") in keys
+    }
+
+
+async def add_participants(entry: dict):
+    """Adds a batch of participants to Challonge, then stores their Challonge ids and seeds.
+    Participants that Challonge rejects are removed from the database.
+    """
+    args = entry["args"]
+    challonge_id = entry["challonge_id"]
+    participants = args["participants"]
+    added = {}
+    if entry["attempts"] > 1:
+        # A previous attempt may have been applied before its response was lost
+        added = await find_tagged_participants(
+            challonge_id, {participant["key"] for participant in participants}
+        )
+    missing = [
+        participant for participant in participants if participant["key"] not in added
+    ]
+    if missing:
+        try:
+            response = await challonge.participants.bulk_add(
+                challonge_id,
+                [
+                    {"name": participant["name"], "misc": participant["key"]}
+                    for participant in missing
+                ],
+                retries=NO_RETRIES,
+            )
+        except ChallongeException as e:
+            if is_transient(e):
+                raise
+            # One bad entry fails the whole bulk add, so add the participants one by one
+            printlog(
+                f"Failed to bulk add {len(missing)} users to challonge tournament; adding them individually.",
+                e,
+            )
+            response = []
+            for participant in missing:
+                try:
+                    response.append(
+                        await challonge.participants.create(
+                            challonge_id,
+                            participant["name"],
+                            misc=participant["key"],
+                            retries=NO_RETRIES,
+                        )
+                    )
+                except ChallongeException as e:
+                    if is_transient(e):
+                        raise
+                    printlog(
+                        f"Failed to add user ['name'='{participant['name']}'] to challonge tournament. User may already exist.",
+                        e,
+                    )
+        for ch_participant in response:
+            added[ch_participant["misc"]] = ch_participant
+
+    # The join key guards against a user who has left (and maybe joined again) meanwhile
+    db_participants = await mdb.find_documents(
+        {
+            "guild_id": entry["guild_id"],
+            "tournament_id": args["tournament_id"],
+            "join_key": {"$in": [participant["key"] for participant in participants]},
+        },
+        PARTICIPANTS,
+        projection={"id": 1, "join_key": 1},
+    )
+    if db_participants is None:
+        raise ConnectionError("participants could not be read")
+    joined = {db_participant["join_key"] for db_participant in db_participants}
+    writes = []
+    rejected = []
+    for participant in participants:
+        if participant["key"] not in joined:
+            continue
+        ch_participant = added.get(participant["key"])
+        if ch_participant:
+            writes.append(
+                eventlog.set_fields(
+                    PARTICIPANTS,
+                    participant["id"],
+                    {
+                        "challonge_id": ch_participant["id"],
+                        "seed": ch_participant["seed"],
+                    },
+                )
+            )
+        else:
+            rejected.append(participant["id"])
+    if rejected:
+        writes.append(eventlog.delete(PARTICIPANTS, rejected))
+    if not await eventlog.log(
+        entry["guild_id"],
+        args["tournament_id"],
+        "participants_registered",
+        writes,
+        {"rejected": rejected},
+    ):
+        raise ConnectionError("participants could not be updated")
+
+
+async def destroy_participant(entry: dict):
+    """Removes a participant from Challonge, or disqualifies them once the tournament has
+    started. Participants that are already gone are skipped.
+    """
+    args = entry["args"]
+    challonge_id = entry["challonge_id"]
+    participant_id = args["participant_id"]
+    if not participant_id:
+        # The participant left before their join reached Challonge
+        tagged = await find_tagged_participants(challonge_id, {args["join_key"]})
+        if not tagged:
+            return
+        participant_id = tagged[args["join_key"]]["id"]
+    try:
+        await challonge.participants.destroy(
+            challonge_id, participant_id, retries=NO_RETRIES
+        )
+    except ChallongeException as e:
+        if e.status != 404:
+            raise
+
+
+async def destroy_tournament(entry: dict):
+    """Deletes a tournament from Challonge. Tournaments that are already gone are skipped."""
+    try:
+        await challonge.tournaments.destroy(entry["challonge_id"], retries=NO_RETRIES)
+    except ChallongeException as e:
+        if e.status != 404:
+            raise
+
+
+# Queued writes by name
+OPERATIONS = {
+    "update_match": update_match,
+    "add_participants": add_participants,
+    "destroy_participant": destroy_participant,
+    "destroy_tournament": destroy_tournament,
+}
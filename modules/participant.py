@@ -1,7 +1,10 @@
+import asyncio
+import os
 import re
+from collections import defaultdict
 from pprint import pprint
+from uuid import uuid4
 
-import challonge
 from discord import (
     Client,
     Embed,
@@ -14,14 +17,27 @@ from discord import (
     Thread,
 )
 
+from api import challonge
+from db import eventlog
 from guilds import guild as _guild
 from modules import match as _match
+from modules import outbox as _outbox
 from modules import tournament as _tournament
+from utils import index as _index
+from utils.constants import PARTICIPANTS, TOURNAMENTS
 from utils.log import printlog
 
 # participant.py
 # Tournament participant functions
 
+# Seconds that joins are collected for before they are registered together
+REGISTRATION_WINDOW = float(os.getenv("REGISTRATION_WINDOW", 1.5))
+
+# Open registration batches by tournament id
+registration_queues = {}
+# Ids of users waiting to be registered, by tournament id
+pending_registrations = defaultdict(set)
+
 user_match = re.compile(r"^<@[0-9]+>$")
 
 
@@ -35,25 +51,20 @@ def find_participant(db_tournament: dict, participant_id: int):
     Returns:
         The participant document if found. Otherwise, None.
     """
-    result = [
-        participant
-        for participant in db_tournament["participants"]
-        if participant["id"] == participant_id
-    ]
-    if result:
-        return result[0]
-    return None
+    return _index.find(db_tournament["participants"], "id", participant_id)
 
 
 def find_participant_by_challonge_id(db_tournament: dict, challonge_id):
-    result = [
-        participant
-        for participant in db_tournament["participants"]
-        if participant["challonge_id"] == challonge_id
-    ]
-    if result:
-        return result[0]
-    return None
+    """Returns a participant in a tournament by challonge id.
+
+    Args:
+        db_tournament (dict): The tournament database document.
+        challonge_id (int): The target participant challonge id.
+
+    Returns:
+        The participant document if found. Otherwise, None.
+    """
+    return _index.find(db_tournament["participants"], "challonge_id", challonge_id)
 
 
 async def join_tournament(interaction: Interaction) -> bool:
@@ -127,7 +138,9 @@ async def add_participant(
     guild: Guild = interaction.guild
     message: Message = interaction.message
     user: Member = member or interaction.user
-    db_guild = await _guild.find_add_guild(guild)
+    db_guild = await _guild.find_add_guild(
+        guild, {} if db_tournament else {TOURNAMENTS: {"id": message.id}}
+    )
 
     # Fetch tournament
     if not db_tournament:
@@ -166,8 +179,10 @@ async def add_participant(
         participant_ids.append(participant["id"])
     challonge_id = db_tournament["challonge"]["id"]
 
-    # Check if already in participants list
-    if user.id in participant_ids:
+    # Check if already in participants list (or waiting to be added)
+    if user.id in participant_ids or user.id in pending_registrations.get(
+        db_tournament["id"], ()
+    ):
         if respond:
             await interaction.followup.send(
                 f"You have already joined '***{tournament_title}***'.", ephemeral=True
@@ -175,79 +190,179 @@ async def add_participant(
         return False
 
     # Check if tournament is at capacity
-    if db_tournament["max_participants"] and db_tournament["max_participants"] == len(
+    if db_tournament["max_participants"] and db_tournament["max_participants"] <= len(
         db_tournament["participants"]
-    ):
+    ) + len(pending_registrations.get(db_tournament["id"], ())):
         if respond:
             await interaction.followup.send(
                 f"Unable to join '***{tournament_title}***'. Tournament has reached maximum participants."
             )
         return False
 
-    # Add user to challonge tournament
-    try:
-        response = challonge.participants.create(
-            challonge_id, f"{user.name}#{user.discriminator}"
-        )
-    except Exception as e:
-        printlog(
-            f"Failed to add user ['name'='{user.name}#{user.discriminator}'] to challonge tournament. User may already exist.",
-            e,
-        )
+    # Queue the user for the next registration batch
+    new_participant = await queue_registration(
+        guild.id, db_tournament, tournament_channel, tournament_thread, user
+    )
+    if not new_participant:
         if respond:
             await interaction.followup.send(
                 f"Something went wrong when trying to join '***{tournament_title}***'.",
                 ephemeral=True,
             )
         return False
+    if respond:
+        await interaction.followup.send(
+            f"Successfully joined '***{tournament_title}***'.", ephemeral=True
+        )
+    return True
+
+
+async def queue_registration(
+    guild_id: int,
+    db_tournament: dict,
+    tournament_channel: TextChannel | ForumChannel,
+    tournament_thread: Thread,
+    user: Member,
+):
+    """Queues a user to join a tournament and waits for their registration batch.
+    Joins that arrive within REGISTRATION_WINDOW seconds of the first one are registered
+    together: one Challonge bulk add, one database write and one tournament embed edit.
+
+    Args:
+        guild_id (int): The guild id.
+        db_tournament (dict): The tournament database document.
+        tournament_channel (TextChannel | ForumChannel): The tournament Discord channel.
+        tournament_thread (Thread): The tournament Discord thread.
+        user (Member): The Discord member to register.
 
-    # Add user to participants list in database
-    new_participant = {
-        "id": user.id,
-        "challonge_id": response["id"],
-        "name": f"{user.name}#{user.discriminator}",
-        "seed": response["seed"],
-        "placement": None,
-        "active": True,
-    }
+    Returns:
+        The new participant document if successful. Otherwise, None.
+    """
+    tournament_id = db_tournament["id"]
+    queue = registration_queues.get(tournament_id)
+    if not queue:
+        queue = {"requests": []}
+        registration_queues[tournament_id] = queue
+        queue["task"] = asyncio.create_task(
+            run_registration_batch(guild_id, tournament_id)
+        )
+    queue.update(
+        {
+            "title": db_tournament["title"],
+            "channel": tournament_channel,
+            "thread": tournament_thread,
+        }
+    )
+    future = asyncio.get_running_loop().create_future()
+    queue["requests"].append({"user": user, "future": future})
+    pending_registrations[tournament_id].add(user.id)
     try:
-        db_guild, db_tournament = await _tournament.add_to_tournament(
-            guild.id, tournament_title, "participants", new_participant
-        )
-    except:
-        print(
-            f"Failed to add user '{new_participant['name']}' to tournament ['title'='{tournament_title}'] participants."
-        )
-        if respond:
-            await interaction.followup.send(
-                f"Something went wrong when trying to join '***{tournament_title}***'.",
-                ephemeral=True,
-            )
-        return False
-    if db_guild:
-        print(
-            f"Added participant '{new_participant['name']}' ['id'='{user.id}'] to tournament ['title'='{tournament_title}']."
+        return await future
+    finally:
+        pending_registrations[tournament_id].discard(user.id)
+        if not pending_registrations[tournament_id]:
+            del pending_registrations[tournament_id]
+
+
+async def run_registration_batch(guild_id: int, tournament_id: int):
+    """Registers every user queued for a tournament once the registration window closes.
+
+    Args:
+        guild_id (int): The guild id.
+        tournament_id (int): The id of the target tournament.
+    """
+    await asyncio.sleep(REGISTRATION_WINDOW)
+    # Joins from now on start the next batch
+    queue = registration_queues.pop(tournament_id)
+    requests = queue["requests"]
+    new_participants = {}
+    try:
+        new_participants = await register_participants(
+            guild_id, queue, [request["user"] for request in requests]
         )
-        # Update message
-        await _tournament.edit_tournament_message(
-            db_tournament, tournament_channel, tournament_thread
+    except Exception as e:
+        printlog(
+            f"Failed to register {len(requests)} participants to tournament ['title'='{queue['title']}'].",
+            e,
         )
-    else:
+    for request in requests:
+        if not request["future"].done():
+            request["future"].set_result(new_participants.get(request["user"].id))
+
+
+async def register_participants(guild_id: int, queue: dict, users: list) -> dict:
+    """Adds a batch of users to a tournament in the database and queues them for Challonge.
+    The participants get their Challonge ids once the outbox applies the bulk add.
+
+    Args:
+        guild_id (int): The guild id.
+        queue (dict): The registration batch (tournament title, channel and thread).
+        users (list): The Discord members to register.
+
+    Returns:
+        dict: The new participant documents by user id.
+    """
+    tournament_title = queue["title"]
+    db_guild = await _guild.find_guild(guild_id, {TOURNAMENTS: {"title": tournament_title}})
+    db_tournament = _tournament.find_tournament(db_guild, tournament_title) if db_guild else None
+    if not db_tournament:
+        return {}
+
+    # Add users to participants list in database
+    # New participants are seeded after the existing ones, so no other seed changes
+    num_participants = len(db_tournament["participants"])
+    new_participants = [
+        {
+            "id": user.id,
+            "challonge_id": None,
+            "name": f"{user.name}#{user.discriminator}",
+            "seed": num_participants + i + 1,
+            "placement": None,
+            "active": True,
+            # Tags the participant on Challonge, so the join is only applied once
+            "join_key": f"join:{db_tournament['id']}:{user.id}:{uuid4().hex[:8]}",
+        }
+        for i, user in enumerate(users)
+    ]
+    db_guild, db_tournament = await _tournament.add_many_to_tournament(
+        guild_id, tournament_title, PARTICIPANTS, new_participants, "participants_joined"
+    )
+    if not db_guild:
         print(
-            f"Failed to add participant '{new_participant['name']}' ['id'='{user.id}'] to tournament ['title'='{tournament_title}']."
-        )
-        if respond:
-            await interaction.followup.send(
-                f"Something went wrong when trying to join '***{tournament_title}***'.",
-                ephemeral=True,
-            )
-        return False
-    await sync_seeding(db_guild, db_tournament)
-    if respond:
-        await interaction.followup.send(
-            f"Successfully joined '***{tournament_title}***'.", ephemeral=True
+            f"Failed to add {len(new_participants)} participants to tournament ['title'='{tournament_title}']."
+        )
+        return {}
+
+    # Add users to challonge tournament
+    if not await _outbox.enqueue(
+        guild_id,
+        db_tournament["challonge"]["id"],
+        "add_participants",
+        new_participants[0]["join_key"],
+        {
+            "tournament_id": db_tournament["id"],
+            "participants": [
+                {"id": participant["id"], "name": participant["name"], "key": participant["join_key"]}
+                for participant in new_participants
+            ],
+        },
+    ):
+        await eventlog.log(
+            guild_id,
+            db_tournament["id"],
+            "participants_rejected",
+            [eventlog.delete(PARTICIPANTS, [participant["id"] for participant in new_participants])],
         )
-    return True
+        return {}
+    print(
+        f"Added {len(new_participants)} participants to tournament ['title'='{tournament_title}']."
+    )
+
+    # Update message
+    await _tournament.edit_tournament_message(
+        db_tournament, queue["channel"], queue["thread"]
+    )
+    return {participant["id"]: participant for participant in new_participants}
 
 
 async def remove_participant(
@@ -272,7 +387,9 @@ async def remove_participant(
     guild: Guild = interaction.guild
     message: Message = interaction.message
     user: Member = member or interaction.user
-    db_guild = await _guild.find_add_guild(guild)
+    db_guild = await _guild.find_add_guild(
+        guild, {} if db_tournament else {TOURNAMENTS: {"id": message.id}}
+    )
 
     # Fetch tournament
     if not db_tournament:
@@ -331,12 +448,9 @@ async def remove_participant(
             db_tournament["participants"],
         )
     )[0]
-    try:
-        challonge.participants.destroy(challonge_id, db_participant["challonge_id"])
-    except Exception as e:
+    if not await queue_destroy_participant(guild.id, db_tournament, db_participant):
         printlog(
-            f"Failed to remove user ['name'='{db_participant['name']}'] from challonge tournament. User may not exist.",
-            e,
+            f"Failed to remove user ['name'='{db_participant['name']}'] from challonge tournament."
         )
         if respond:
             await interaction.followup.send(
@@ -348,7 +462,11 @@ async def remove_participant(
     # Remove user from participants list
     try:
         db_guild, db_tournament = await _tournament.remove_from_tournament(
-            guild.id, tournament_title, "participants", db_participant["id"]
+            guild.id,
+            tournament_title,
+            "participants",
+            db_participant["id"],
+            "participant_left",
         )
     except:
         print(
@@ -378,7 +496,7 @@ async def remove_participant(
                 ephemeral=True,
             )
         return False
-    await sync_seeding(db_guild, db_tournament)
+    await close_seed_gap(guild.id, db_tournament, db_participant["seed"])
     if respond:
         await interaction.followup.send(
             f"Successfully removed from '***{tournament_title}***'.", ephemeral=True
@@ -410,11 +528,18 @@ async def randomize_seeding(
         )
     except ValueError:
         return False
+
+    # Apply queued joins and leaves first, so that every participant has a challonge id
+    db_guild, db_tournament = await _tournament.sync_with_challonge(
+        interaction, db_tournament
+    )
+    if not db_tournament:
+        return False
     tournament_challonge_id = db_tournament["challonge"]["id"]
 
     # Randomize seeding on challonge
     try:
-        challonge.participants.randomize(tournament_challonge_id)
+        await challonge.participants.randomize(tournament_challonge_id)
     except:
         printlog(
             f"Failed to randomize seeding for tournament ['title'='{tournament_title}'] on challonge."
@@ -462,6 +587,13 @@ async def set_seed(
         )
     except ValueError:
         return False
+
+    # Apply queued joins and leaves first, so that every participant has a challonge id
+    db_guild, db_tournament = await _tournament.sync_with_challonge(
+        interaction, db_tournament
+    )
+    if not db_tournament:
+        return False
     tournament_challonge_id = db_tournament["challonge"]["id"]
 
     # Check if valid participant mention
@@ -489,7 +621,7 @@ async def set_seed(
 
     # Update seed on challonge
     try:
-        challonge.participants.update(
+        await challonge.participants.update(
             tournament_challonge_id, db_participant["challonge_id"], seed=seed
         )
     except:
@@ -503,7 +635,13 @@ async def set_seed(
         db_tournament, "participants", "challonge_id", db_participant["challonge_id"]
     )
     db_tournament["participants"][p_index].update({"seed": seed})
-    await _tournament.set_tournament(guild.id, tournament_title, db_tournament)
+    await _tournament.set_tournament(
+        guild.id,
+        tournament_title,
+        db_tournament,
+        "seed_set",
+        {"user_id": user.id, "participant_id": participant.id, "seed": seed},
+    )
     await interaction.followup.send(
         f"Succesfully updated seed for <@{participant.id}> to **{seed}**.",
         ephemeral=True,
@@ -614,18 +752,21 @@ async def disqualify_participant(
     # Update participant in database
     try:
         await _tournament.set_tournament(
-            db_guild["guild_id"], tournament_title, db_tournament
+            db_guild["guild_id"],
+            tournament_title,
+            db_tournament,
+            "participant_disqualified",
+            {"id": db_participant["id"]},
         )
     except:
         print("Failed to DQ participant in database.")
         return False
     # Disqualify participant on challonge
-    try:
-        challonge.participants.destroy(challonge_id, db_participant["challonge_id"])
-    except Exception as e:
+    if not await queue_destroy_participant(
+        db_guild["guild_id"], db_tournament, db_participant
+    ):
         printlog(
-            f"Failed to DQ participant ['name'='{participant_name}'] from tournament ['title'='{tournament_title}']",
-            e,
+            f"Failed to DQ participant ['name'='{participant_name}'] from tournament ['title'='{tournament_title}']"
         )
         return False
     # Update all open matches
@@ -677,6 +818,51 @@ def parse_user_mention(interaction: Interaction, user_mention: str):
         return interaction.user
 
 
+async def queue_destroy_participant(
+    guild_id: int, db_tournament: dict, db_participant: dict
+) -> bool:
+    """Queues the removal of a participant from Challonge, or their disqualification if the
+    tournament has started.
+
+    Args:
+        guild_id (int): The guild id.
+        db_tournament (dict): The tournament database document.
+        db_participant (dict): The target participant document.
+
+    Returns:
+        bool: True if the removal was queued. Otherwise, False.
+    """
+    join_key = db_participant.get("join_key")
+    return await _outbox.enqueue(
+        guild_id,
+        db_tournament["challonge"]["id"],
+        "destroy_participant",
+        f"destroy_participant:{join_key or db_participant['challonge_id']}",
+        {"participant_id": db_participant["challonge_id"], "join_key": join_key},
+    )
+
+
+async def close_seed_gap(guild_id: int, db_tournament: dict, seed: int):
+    """Moves the participants seeded below a removed participant up by one seed, the same
+    way Challonge does when a participant is removed.
+
+    Args:
+        guild_id (int): The guild id.
+        db_tournament (dict): The tournament database document, without the removed participant.
+        seed (int): The seed of the removed participant.
+    """
+    writes = []
+    for db_participant in db_tournament["participants"]:
+        if db_participant["seed"] > seed:
+            db_participant["seed"] -= 1
+            writes.append(
+                eventlog.set_fields(
+                    PARTICIPANTS, db_participant["id"], {"seed": db_participant["seed"]}
+                )
+            )
+    await eventlog.log(guild_id, db_tournament["id"], "seed_gap_closed", writes)
+
+
 async def sync_seeding(db_guild: dict, db_tournament: dict):
     """Updates tournament participants in database to have the same seeding as listed on challonge.
 
@@ -690,17 +876,15 @@ async def sync_seeding(db_guild: dict, db_tournament: dict):
     tournament_challonge_id = db_tournament["challonge"]["id"]
     try:
         # Update seeding in db
-        result = challonge.participants.index(tournament_challonge_id)
+        result = await challonge.participants.index(tournament_challonge_id)
         for ch_participant in result:
-            p_index = _tournament.find_index_in_tournament(
-                db_tournament, "participants", "challonge_id", ch_participant["id"]
+            db_participant = find_participant_by_challonge_id(
+                db_tournament, ch_participant["id"]
             )
-            if p_index >= 0:
-                db_tournament["participants"][p_index].update(
-                    {"seed": ch_participant["seed"]}
-                )
+            if db_participant:
+                db_participant.update({"seed": ch_participant["seed"]})
         await _tournament.set_tournament(
-            db_guild["guild_id"], db_tournament["title"], db_tournament
+            db_guild["guild_id"], db_tournament["title"], db_tournament, "seeding_synced"
         )
         print(
             f"Synchronized seeding of tournament ['title'='{db_tournament['title']}']."
@@ -0,0 +1,410 @@
+import asyncio
+import math
+import os
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from pymongo import UpdateOne
+
+from db import mdb
+from utils.constants import CHALLENGES, LEADERBOARD, MATCHES, PARTICIPANTS
+from utils.log import printlog
+
+# rating.py
+# Player ratings for the challenge leaderboard
+#
+# Every reported challenge and tournament match updates the ratings of both players in the
+# leaderboard collection, using Elo or Glicko-2 (RATING_SYSTEM). Each guild's ratings are
+# also kept in a RatingIndex, a list sorted by rating, so that the top of the leaderboard
+# and a player's rank are found by bisection instead of sorting every user per request.
+# Lookups take O(log n); a rating change moves one entry of the list, which is O(n) but
+# only copies memory, and happens once per reported result rather than per request.
+# recompute_ratings replays a guild's whole history, ex. after a result is deleted.
+
+# Either "elo" or "glicko2"
+RATING_SYSTEM = os.getenv("RATING_SYSTEM", "elo")
+DEFAULT_RATING = 1500.0
+# Largest Elo rating change per game
+ELO_K = float(os.getenv("ELO_K", 32))
+# Glicko-2 defaults: rating deviation, volatility, and the volatility constraint (tau)
+DEFAULT_RD = 350.0
+DEFAULT_VOLATILITY = 0.06
+GLICKO_TAU = float(os.getenv("GLICKO_TAU", 0.5))
+GLICKO_SCALE = 173.7178
+
+RATING_FIELDS = ("rating", "rd", "volatility")
+
+# Sorted ratings per guild id, built on first use
+rating_indexes = {}
+# Rating updates read and then write both players, so they are serialized per guild
+rating_locks = defaultdict(asyncio.Lock)
+
+
+class RatingIndex:
+    """The users of a leaderboard, sorted from highest to lowest rating.
+    rank bisects the sorted list in O(log n) and top slices a page of it, but update and
+    remove shift the list, which takes O(n).
+    """
+
+    def __init__(self, users: list = ()):
+        self.keys = []
+        self.ratings = {}
+        for user in users:
+            self.ratings[user["id"]] = user.get("rating", DEFAULT_RATING)
+        self.keys = sorted(
+            (-rating, user_id) for user_id, rating in self.ratings.items()
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def update(self, user_id: int, rating: float):
+        """Sets the rating of a user, adding the user if needed. Takes O(n)."""
+        self.remove(user_id)
+        self.ratings[user_id] = rating
+        insort(self.keys, (-rating, user_id))
+
+    def remove(self, user_id: int):
+        """Removes a user from the index, if present. Takes O(n)."""
+        rating = self.ratings.pop(user_id, None)
+        if rating is None:
+            return
+        i = bisect_left(self.keys, (-rating, user_id))
+        if i < len(self.keys) and self.keys[i] == (-rating, user_id):
+            del self.keys[i]
+
+    def rank(self, user_id: int):
+        """Returns the 1-based rank of a user, or None if the user is not rated."""
+        rating = self.ratings.get(user_id)
+        if rating is None:
+            return None
+        return bisect_left(self.keys, (-rating, user_id)) + 1
+
+    def top(self, count: int, offset: int = 0) -> list:
+        """Returns (user_id, rating) pairs of the best rated users, starting at offset."""
+        return [
+            (user_id, -negative_rating)
+            for negative_rating, user_id in self.keys[offset : offset + count]
+        ]
+
+
+def default_rating() -> dict:
+    """Returns the rating fields of an unrated player."""
+    return {
+        "rating": DEFAULT_RATING,
+        "rd": DEFAULT_RD,
+        "volatility": DEFAULT_VOLATILITY,
+    }
+
+
+def rating_of(db_user: dict) -> dict:
+    """Returns the rating fields of a leaderboard user, with defaults for missing fields."""
+    rating = default_rating()
+    if db_user:
+        rating.update(
+            {field: db_user[field] for field in RATING_FIELDS if field in db_user}
+        )
+    return rating
+
+
+def expected_score(rating: float, opponent_rating: float) -> float:
+    """Returns the Elo probability of a player beating an opponent."""
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+def rate_elo(winner: dict, loser: dict):
+    """Returns the new rating fields of both players after a game, using Elo."""
+    change = ELO_K * (1 - expected_score(winner["rating"], loser["rating"]))
+    return (
+        {**winner, "rating": winner["rating"] + change},
+        {**loser, "rating": loser["rating"] - change},
+    )
+
+
+def glicko2_update(player: dict, opponent: dict, score: float) -> dict:
+    """Returns the new rating fields of a player after one game, using Glicko-2.
+    Each game is treated as its own rating period.
+
+    Args:
+        player (dict): The rating fields of the player.
+        opponent (dict): The rating fields of the opponent, before the game.
+        score (float): 1 for a win, 0 for a loss.
+
+    Returns:
+        dict: The new rating fields.
+    """
+    return glicko2_period(player, [(opponent, score)])
+
+
+def glicko2_period(player: dict, games: list) -> dict:
+    """Returns the new rating fields of a player after a rating period, using Glicko-2.
+
+    Args:
+        player (dict): The rating fields of the player.
+        games (list): (opponent rating fields, score) pairs of the games in the period.
+
+    Returns:
+        dict: The new rating fields.
+    """
+    mu = (player["rating"] - DEFAULT_RATING) / GLICKO_SCALE
+    phi = player["rd"] / GLICKO_SCALE
+    sigma = player["volatility"]
+
+    variance_inverse = 0
+    improvement = 0
+    for opponent, score in games:
+        opponent_mu = (opponent["rating"] - DEFAULT_RATING) / GLICKO_SCALE
+        opponent_phi = opponent["rd"] / GLICKO_SCALE
+        g = 1 / math.sqrt(1 + 3 * opponent_phi**2 / math.pi**2)
+        expected = 1 / (1 + math.exp(-g * (mu - opponent_mu)))
+        variance_inverse += g**2 * expected * (1 - expected)
+        improvement += g * (score - expected)
+    v = 1 / variance_inverse
+    delta = v * improvement
+
+    # New volatility, by the Illinois algorithm
+    a = math.log(sigma**2)
+
+    def f(x):
+        ex = math.exp(x)
+        return (
+            ex * (delta**2 - phi**2 - v - ex) / (2 * (phi**2 + v + ex) ** 2)
+            - (x - a) / GLICKO_TAU**2
+        )
+
+    bound_a = a
+    if delta**2 > phi**2 + v:
+        bound_b = math.log(delta**2 - phi**2 - v)
+    else:
+        k = 1
+        while f(a - k * GLICKO_TAU) < 0:
+            k += 1
+        bound_b = a - k * GLICKO_TAU
+    f_a, f_b = f(bound_a), f(bound_b)
+    while abs(bound_b - bound_a) > 1e-6:
+        c = bound_a + (bound_a - bound_b) * f_a / (f_b - f_a)
+        f_c = f(c)
+        if f_c * f_b <= 0:
+            bound_a, f_a = bound_b, f_b
+        else:
+            f_a /= 2
+        bound_b, f_b = c, f_c
+    new_sigma = math.exp(bound_a / 2)
+
+    pre_phi = math.sqrt(phi**2 + new_sigma**2)
+    new_phi = 1 / math.sqrt(1 / pre_phi**2 + 1 / v)
+    new_mu = mu + new_phi**2 * improvement
+    return {
+        "rating": GLICKO_SCALE * new_mu + DEFAULT_RATING,
+        "rd": GLICKO_SCALE * new_phi,
+        "volatility": new_sigma,
+    }
+
+
+def rate(winner: dict, loser: dict):
+    """Returns the new rating fields of both players after a game.
+
+    Args:
+        winner (dict): The rating fields of the winner (see rating_of).
+        loser (dict): The rating fields of the loser.
+
+    Returns:
+        A tuple of the new rating fields of the winner and of the loser.
+    """
+    if RATING_SYSTEM == "glicko2":
+        return glicko2_update(winner, loser, 1), glicko2_update(loser, winner, 0)
+    return rate_elo(winner, loser)
+
+
+def rating_update(guild_id: int, player: dict, rating: dict) -> UpdateOne:
+    """Returns the write that sets the rating of a player, adding the player to the
+    leaderboard if needed."""
+    return UpdateOne(
+        {"guild_id": guild_id, "id": player["id"]},
+        {
+            "$set": rating,
+            "$setOnInsert": {
+                "name": player["name"],
+                "wins": 0,
+                "losses": 0,
+                "total": 0,
+                "streak": 0,
+                "best_streak": 0,
+                "form": [],
+            },
+        },
+        upsert=True,
+    )
+
+
+async def get_rating_index(guild_id: int) -> RatingIndex:
+    """Returns the rating index of a guild, loading it on first use.
+
+    Args:
+        guild_id (int): The target guild id.
+
+    Returns:
+        RatingIndex: The sorted ratings of the guild's leaderboard.
+    """
+    index = rating_indexes.get(guild_id)
+    if index is None:
+        users = await mdb.find_documents(
+            {"guild_id": guild_id}, LEADERBOARD, projection={"id": 1, "rating": 1}
+        )
+        if users is None:
+            return RatingIndex()
+        index = rating_indexes.setdefault(guild_id, RatingIndex(users))
+    return index
+
+
+async def record_result(guild_id: int, winner: dict, loser: dict):
+    """Updates the ratings of two players after a reported challenge or match.
+
+    Args:
+        guild_id (int): The target guild id.
+        winner (dict): The winning player; needs "id" and "name".
+        loser (dict): The losing player; needs "id" and "name".
+
+    Returns:
+        A tuple of the new rating fields of the winner and of the loser if successful. Otherwise, None.
+    """
+    async with rating_locks[guild_id]:
+        users = await mdb.find_documents(
+            {"guild_id": guild_id, "id": {"$in": [winner["id"], loser["id"]]}},
+            LEADERBOARD,
+            projection={"id": 1, **{field: 1 for field in RATING_FIELDS}},
+        )
+        if users is None:
+            return None
+        by_id = {user["id"]: user for user in users}
+        ratings = rate(
+            rating_of(by_id.get(winner["id"])), rating_of(by_id.get(loser["id"]))
+        )
+        result = await mdb.bulk_write(
+            [
+                rating_update(guild_id, player, rating)
+                for player, rating in zip((winner, loser), ratings)
+            ],
+            LEADERBOARD,
+        )
+        if not result:
+            return None
+        index = await get_rating_index(guild_id)
+        for player, rating in zip((winner, loser), ratings):
+            index.update(player["id"], rating["rating"])
+    print(
+        f"Rated result in leaderboard ['guild_id'='{guild_id}']: '{winner['name']}' {ratings[0]['rating']:.0f}, '{loser['name']}' {ratings[1]['rating']:.0f}."
+    )
+    return ratings
+
+
+async def find_results(guild_id: int) -> list:
+    """Returns every reported challenge and tournament match of a guild, oldest first.
+    Disqualifications are left out, since they were not played.
+
+    Args:
+        guild_id (int): The target guild id.
+
+    Returns:
+        list: (winner, loser) pairs of player dicts with "id" and "name" if successful.
+        Otherwise, None.
+    """
+    fields = {"player1": 1, "player2": 1, "winner_emote": 1, "completed": 1}
+    reported = {
+        "guild_id": guild_id,
+        "completed": {"$ne": False},
+        "winner_emote": {"$in": ["1️⃣", "2️⃣"]},
+    }
+    challenges, matches, participants = await asyncio.gather(
+        mdb.find_documents(reported, CHALLENGES, projection=fields),
+        mdb.find_documents(
+            {**reported, "is_dq": {"$ne": True}},
+            MATCHES,
+            projection={**fields, "tournament_id": 1},
+        ),
+        mdb.find_documents(
+            {"guild_id": guild_id},
+            PARTICIPANTS,
+            projection={"id": 1, "name": 1, "tournament_id": 1},
+        ),
+    )
+    if challenges is None or matches is None or participants is None:
+        return None
+    # Tournament matches only store player ids; names come from the participants
+    names = {
+        (participant["tournament_id"], participant["id"]): participant["name"]
+        for participant in participants
+    }
+    results = []
+    for db_challenge in challenges:
+        players = [db_challenge["player1"], db_challenge["player2"]]
+        results.append(
+            (db_challenge["completed"], players, db_challenge["winner_emote"])
+        )
+    for db_match in matches:
+        players = [
+            {
+                "id": db_match[player]["id"],
+                "name": names.get(
+                    (db_match["tournament_id"], db_match[player]["id"]), ""
+                ),
+            }
+            for player in ("player1", "player2")
+        ]
+        results.append((db_match["completed"], players, db_match["winner_emote"]))
+    results.sort(key=lambda result: result[0])
+    return [
+        (players[0], players[1]) if winner_emote == "1️⃣" else (players[1], players[0])
+        for _, players, winner_emote in results
+    ]
+
+
+async def recompute_ratings(guild_id: int):
+    """Recomputes every rating of a guild from its reported challenges and matches.
+
+    Args:
+        guild_id (int): The target guild id.
+
+    Returns:
+        int: The number of rated users if successful. Otherwise, None.
+    """
+    async with rating_locks[guild_id]:
+        results = await find_results(guild_id)
+        if results is None:
+            # Replaying part of the history would lose the missing results
+            printlog(f"Failed to recompute ratings ['guild_id'='{guild_id}'].")
+            return None
+        ratings, players = {}, {}
+        for winner, loser in results:
+            for player in (winner, loser):
+                players.setdefault(player["id"], player)
+            ratings[winner["id"]], ratings[loser["id"]] = rate(
+                ratings.get(winner["id"], default_rating()),
+                ratings.get(loser["id"], default_rating()),
+            )
+        # Users without any result go back to the default rating
+        users = await mdb.find_documents(
+            {"guild_id": guild_id}, LEADERBOARD, projection={"id": 1, "name": 1}
+        )
+        for user in users or []:
+            players.setdefault(user["id"], user)
+            ratings.setdefault(user["id"], default_rating())
+        if ratings:
+            result = await mdb.bulk_write(
+                [
+                    rating_update(guild_id, players[user_id], rating)
+                    for user_id, rating in ratings.items()
+                ],
+                LEADERBOARD,
+                ordered=False,
+            )
+            if not result:
+                printlog(f"Failed to recompute ratings ['guild_id'='{guild_id}'].")
+                return None
+        rating_indexes[guild_id] = RatingIndex(
+            [{"id": user_id, **rating} for user_id, rating in ratings.items()]
+        )
+    print(
+        f"Recomputed {len(ratings)} ratings from {len(results)} results ['guild_id'='{guild_id}']."
+    )
+    return len(ratings)
@@ -0,0 +1,258 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
+from discord import Message
+
+from api import imgur
+from modules import editor as _editor
+from modules import outbox as _outbox
+from utils.log import printlog
+from utils.raster import rasterize
+
+# render.py
+# Background rendering of tournament bracket images
+#
+# Challonge serves brackets as SVG, which Discord does not preview, so each bracket is
+# rasterized to PNG and uploaded to imgur. Rasterizing (see utils/raster.py) runs in a
+# process pool instead of on the event loop thread. Requests are debounced per tournament:
+# a burst of match reports collapses into a single render of the latest bracket, and the
+# tournament embed is updated once the render finishes. Results are reported to Challonge through the outbox, so a
+# render waits for the tournament's queued writes before fetching the bracket. Rendered
+# images are cached by the hash of their SVG, so an unchanged bracket is never rasterized
+# or uploaded twice.
+
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", 2))
+# Seconds without new requests before a tournament is rendered
+RENDER_DEBOUNCE = float(os.getenv("RENDER_DEBOUNCE", 3))
+# Upper bound on how long a steady stream of requests can delay a render
+RENDER_MAX_DELAY = float(os.getenv("RENDER_MAX_DELAY", 15))
+RENDER_TIMEOUT = 30
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", 64))
+
+# Workers are spawned rather than forked, since forking would copy the database client and
+# the threads of the bot process. Spawned workers import the main module again, so main.py
+# only starts the bot when it is run directly.
+render_executor = ProcessPoolExecutor(
+    max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn")
+)
+
+# Pending render jobs by tournament id
+render_jobs = {}
+
+# Links to rendered images by SVG hash, least recently used first: {sha256: url}
+render_cache = OrderedDict()
+render_cache_stats = {"hits": 0, "misses": 0}
+
+_session: aiohttp.ClientSession = None
+
+
+async def fetch_svg(svg_url: str):
+    """Downloads an SVG image.
+
+    Args:
+        svg_url (str): The url of the image.
+
+    Returns:
+        The SVG image if successful. Otherwise, None.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=RENDER_TIMEOUT)
+        )
+    try:
+        async with _session.get(svg_url) as response:
+            if response.status != 200:
+                printlog(
+                    f"Failed to fetch bracket '{svg_url}'; status {response.status}."
+                )
+                return None
+            return await response.read()
+    except Exception as e:
+        printlog(f"Failed to fetch bracket '{svg_url}'.", e)
+        return None
+
+
+def get_cached_url(svg_hash: str):
+    """Returns the link to a rendered image from the cache and marks it as recently used.
+
+    Args:
+        svg_hash (str): The sha256 hash of the SVG image.
+
+    Returns:
+        The link to the hosted image if found. Otherwise, None.
+    """
+    cached = render_cache.get(svg_hash)
+    if cached is None:
+        render_cache_stats["misses"] += 1
+        return None
+    render_cache_stats["hits"] += 1
+    render_cache.move_to_end(svg_hash)
+    return cached
+
+
+def cache_url(svg_hash: str, image_url: str):
+    """Adds the link to a rendered image to the cache, evicting the least recently used links.
+
+    Args:
+        svg_hash (str): The sha256 hash of the SVG image.
+        image_url (str): The link to the hosted image.
+    """
+    render_cache[svg_hash] = image_url
+    render_cache.move_to_end(svg_hash)
+    while len(render_cache) > RENDER_CACHE_SIZE:
+        render_cache.popitem(last=False)
+
+
+def render_cache_info() -> dict:
+    """Returns the hit/miss counters and size of the render cache."""
+    lookups = render_cache_stats["hits"] + render_cache_stats["misses"]
+    return {
+        **render_cache_stats,
+        "size": len(render_cache),
+        "hit_rate": render_cache_stats["hits"] / lookups if lookups else 0,
+    }
+
+
+async def render_tournament_image(challonge_url: str):
+    """Renders the current bracket of a Challonge tournament and uploads it to imgur.
+    Brackets that have already been rendered are served from the cache.
+
+    Args:
+        challonge_url (str): The url of the Challonge tournament.
+
+    Returns:
+        The link to the bracket image if successful. Otherwise, None.
+    """
+    svg = await fetch_svg(f"{challonge_url}.svg")
+    if not svg:
+        return None
+    svg_hash = hashlib.sha256(svg).hexdigest()
+    cached_url = get_cached_url(svg_hash)
+    if cached_url:
+        return cached_url
+    loop = asyncio.get_running_loop()
+    png = await loop.run_in_executor(render_executor, rasterize, svg)
+    image_url = await imgur.upload_image(png)
+    if image_url:
+        cache_url(svg_hash, image_url)
+    return image_url
+
+
+def schedule_tournament_image(db_tournament: dict, tournament_message: Message) -> bool:
+    """Requests a new bracket image for a tournament embed.
+    The image is rendered in the background once no new requests have been made for the
+    tournament for RENDER_DEBOUNCE seconds.
+
+    Args:
+        db_tournament (dict): The target tournament database document.
+        tournament_message (Message): The tournament Discord message.
+
+    Returns:
+        bool: True if an image was requested. False if the tournament has no bracket yet.
+    """
+    if len(db_tournament["participants"]) < 2:
+        return False
+    tournament_id = db_tournament["id"]
+    now = time.monotonic()
+    job = render_jobs.get(tournament_id)
+    if job:
+        job.update(
+            {
+                "message": tournament_message,
+                "challonge_url": db_tournament["challonge"]["url"],
+                "requested_at": now,
+                "version": job["version"] + 1,
+            }
+        )
+        return True
+    job = {
+        "title": db_tournament["title"],
+        "message": tournament_message,
+        "challonge_id": db_tournament["challonge"]["id"],
+        "challonge_url": db_tournament["challonge"]["url"],
+        "first_requested_at": now,
+        "requested_at": now,
+        "version": 0,
+    }
+    render_jobs[tournament_id] = job
+    job["task"] = asyncio.create_task(run_render_job(tournament_id))
+    return True
+
+
+async def run_render_job(tournament_id: int):
+    """Renders the bracket image of a tournament until no new requests are pending.
+
+    Args:
+        tournament_id (int): The id of the target tournament.
+    """
+    job = render_jobs[tournament_id]
+    try:
+        while True:
+            # Wait for the burst of requests to settle
+            delay = (
+                min(
+                    job["requested_at"] + RENDER_DEBOUNCE,
+                    job["first_requested_at"] + RENDER_MAX_DELAY,
+                )
+                - time.monotonic()
+            )
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            # Render only once Challonge has the results, or the image would be out of date
+            if not await _outbox.drain(job["challonge_id"]):
+                await asyncio.sleep(RENDER_DEBOUNCE)
+                continue
+            version = job["version"]
+            image_url = await render_tournament_image(job["challonge_url"])
+            if image_url:
+                await set_embed_image(job["message"], image_url)
+            else:
+                printlog(
+                    f"Failed to create image for tournament ['title'='{job['title']}']."
+                )
+            # Render again if the bracket changed while rendering
+            if job["version"] == version:
+                return
+            job["first_requested_at"] = job["requested_at"]
+    except Exception as e:
+        printlog(
+            f"Failed to create image for tournament ['title'='{job['title']}'].", e
+        )
+    finally:
+        render_jobs.pop(tournament_id, None)
+
+
+async def set_embed_image(tournament_message: Message, image_url: str):
+    """Sets the image of a tournament embed.
+    The image is added to the latest embed (including queued edits), so that edits made
+    while rendering are kept.
+
+    Args:
+        tournament_message (Message): The tournament Discord message.
+        image_url (str): The url of the bracket image.
+    """
+    embed = _editor.current_embed(tournament_message)
+    if embed.image and embed.image.url == image_url:
+        return
+    embed.set_image(url=image_url)
+    _editor.schedule_edit(tournament_message, embed=embed)
+
+
+async def close():
+    """Stops the render workers and closes the HTTP sessions."""
+    global _session
+    for job in list(render_jobs.values()):
+        job["task"].cancel()
+    render_executor.shutdown(wait=False, cancel_futures=True)
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    await imgur.close()
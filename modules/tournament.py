@@ -1,3 +1,4 @@
+import asyncio
 import os
 import re
 from cgi import print_exception
@@ -5,10 +6,8 @@ from datetime import date, datetime, timedelta, timezone
 from pprint import pprint
 from traceback import print_exception
 
-import challonge
 import discord
 import pytz
-import requests
 from discord import (
     Client,
     Embed,
@@ -24,26 +23,28 @@ from discord import (
 # from discord.ext import tasks
 from dotenv import load_dotenv
 
+from api import challonge
 from guilds import channel as _channel
 from guilds import guild as _guild
+from modules import bracket as _bracket
+from modules import editor as _editor
 from modules import match as _match
+from modules import outbox as _outbox
 from modules import participant as _participant
-from db import mdb
+from modules import rating as _rating
+from modules import render as _render
+from db import eventlog, mdb, schema
 from utils.color import GOLD, WOOP_PURPLE
-from utils.common import full_command
+from utils.common import fit_lines, full_command
+from utils import index as _index
 from utils.constants import (
-    GUILDS,
     ICON,
-    IMGUR_CLIENT_ID,
-    IMGUR_URL,
     MAX_ENTRANTS,
     TOURNAMENTS,
 )
 from utils.log import printlog
 
-from cairosvg import svg2png
-
-from views.registration_view import RegistrationView  # SVG to PNG
+from views.registration_view import RegistrationView
 
 # tournament.py
 # User created tournaments
@@ -51,6 +52,8 @@ from views.registration_view import RegistrationView  # SVG to PNG
 load_dotenv()
 
 MIN_ENTRANTS = 2
+# Largest number of tournaments in progress at the same time in a guild; 0 for no limit
+MAX_ACTIVE_TOURNAMENTS = int(os.getenv("MAX_ACTIVE_TOURNAMENTS", 0))
 EASTERN_ZONE = pytz.timezone("US/Eastern")
 
 time_re_long = re.compile(
@@ -69,15 +72,7 @@ def find_tournament(db_guild: dict, tournament_title: str):
     Returns:
         The tournament database document if found. Otherwise, None.
     """
-    guild_tournaments = db_guild["tournaments"]
-    result = [
-        tournament
-        for tournament in guild_tournaments
-        if tournament["title"] == tournament_title
-    ]
-    if result:
-        return result[0]
-    return None
+    return _index.find(db_guild["tournaments"], "title", tournament_title)
 
 
 def find_tournament_by_id(db_guild: dict, tournament_id: int):
@@ -90,19 +85,41 @@ def find_tournament_by_id(db_guild: dict, tournament_id: int):
     Returns:
         The tournament database document if found. Otherwise, None.
     """
-    result = [
+    return _index.find(db_guild["tournaments"], "id", tournament_id)
+
+
+def has_reported_matches(db_tournament: dict) -> bool:
+    """Checks if any match of a tournament has a reported result, which counts towards ratings.
+
+    Args:
+        db_tournament (dict): The tournament database document.
+
+    Returns:
+        bool: True if a match has been reported. Otherwise, False.
+    """
+    return any(db_match["completed"] for db_match in db_tournament["matches"])
+
+
+def find_active_tournaments(db_guild: dict):
+    """Returns the active tournaments in a guild, oldest first.
+    Active means the tournament is in progress, but has not been completed.
+
+    Args:
+        db_guild (dict): The guild database document.
+
+    Returns:
+        A list of the active tournament database documents.
+    """
+    return [
         tournament
         for tournament in db_guild["tournaments"]
-        if tournament["id"] == tournament_id
+        if tournament["in_progress"] and not tournament["completed"]
     ]
-    if result:
-        return result[0]
-    return None
 
 
 def find_active_tournament(db_guild: dict):
-    """Returns the current active tournament in a guild.
-    Active means the tournament is in progress, but has not been completed.
+    """Returns the oldest active tournament in a guild.
+    A guild can run several tournaments at once; see find_active_tournaments.
 
     Args:
         db_guild (dict): The guild database document.
@@ -110,16 +127,8 @@ def find_active_tournament(db_guild: dict):
     Returns:
         The tournament database document of the active tournament if found. Otherwise, None.
     """
-    try:
-        return list(
-            filter(
-                lambda tournament: tournament["in_progress"]
-                and not tournament["completed"],
-                db_guild["tournaments"],
-            )
-        )[0]
-    except:
-        return None
+    active_tournaments = find_active_tournaments(db_guild)
+    return active_tournaments[0] if active_tournaments else None
 
 
 def find_most_recent_tournament(db_guild: dict, completed: bool):
@@ -197,7 +206,7 @@ async def create_tournament(
     tournament_title: str,
     time: str = "",
     single_elim: bool = False,
-    max_participants: int = 24,
+    max_participants: int = MAX_ENTRANTS,
     respond: bool = True,
 ):
     """Creates a new tournament and adds it to the guild.
@@ -212,7 +221,7 @@ async def create_tournament(
         tournament_title (str): The title of the target tournament.
         time (str, optional): The time of the tournament. Defaults to "".
         single_elim (bool, optional): Flag to determine if the tournament is single elimination. Defaults to False.
-        max_participants (int, optional): The number of maximum participants in a tournament. Defaults to 24.
+        max_participants (int, optional): The number of maximum participants in a tournament. Defaults to MAX_ENTRANTS.
         respond (bool, optional): Flag to determine if a Discord message should be sent in response. Defaults to True.
 
     Returns:
@@ -286,9 +295,10 @@ async def create_tournament(
                 f"Tournament with title '{tournament_title}' already exists in this server."
             )
         return None, None, None
+    tournament_challonge = tournament_message = tournament_thread = None
     try:
         # Create challonge tournament
-        tournament_challonge = challonge.tournaments.create(
+        tournament_challonge = await challonge.tournaments.create(
             name=tournament_title,
             url=None,
             tournament_type="single elimination"
@@ -328,6 +338,7 @@ async def create_tournament(
             "open": True,
             "in_progress": False,
             "num_rounds": None,
+            "bracket": None,
         }
 
         embed = create_tournament_embed(new_tournament, interaction.user)
@@ -374,10 +385,8 @@ async def create_tournament(
             )
 
         # Delete challonge tournament
-        try:
-            challonge.tournaments.destroy(tournament_challonge["id"])
-        except:
-            pass
+        if tournament_challonge:
+            await queue_destroy_tournament(guild.id, tournament_challonge["id"])
 
         # Delete tournament message
         try:
@@ -465,19 +474,17 @@ async def delete_tournament(
     except:
         print(f"Failed to delete tournament ['name'={tournament_title}].")
     if result:
-        try:
-            challonge.tournaments.destroy(
-                db_tournament["challonge"]["id"]
-            )  # delete tournament from challonge
-        except Exception as e:
-            printlog(
-                f"Failed to delete tournament [id='{db_tournament['id']}] from challonge [id='{db_tournament['challonge']['id']}].",
-                e,
-            )
+        # Delete tournament from challonge
+        if not await queue_destroy_tournament(
+            guild.id, db_tournament["challonge"]["id"]
+        ):
             retval = False
         print(
             f"User '{user.name}#{user.discriminator}' [id={user.id}] deleted tournament '{tournament_title}'."
         )
+        # Its reported matches were deleted with it, so the guild's ratings are replayed
+        if has_reported_matches(db_tournament):
+            await _rating.recompute_ratings(guild.id)
     else:
         if respond:
             await interaction.followup.send(
@@ -501,6 +508,7 @@ async def delete_tournament(
                 db_tournament["id"]
             )
             await tournament_message.delete()  # delete message from channel
+            _editor.forget_message(tournament_message.id)
         except discord.NotFound:
             print(
                 f"Failed to delete message for tournament '{tournament_title}' ['id'='{db_tournament['id']}']; Not found."
@@ -612,7 +620,7 @@ async def update_tournament(
         db_tournament["max_participants"] = max_participants
 
     # Update the tournament on challonge
-    challonge.tournaments.update(
+    await challonge.tournaments.update(
         db_tournament["challonge"]["id"],
         name=db_tournament["title"],
         tournament_type=db_tournament["tournament_type"],
@@ -621,22 +629,24 @@ async def update_tournament(
     )
 
     # Update the tournament in database
-    await set_tournament(guild.id, tournament_title, db_tournament)
+    await set_tournament(
+        guild.id, tournament_title, db_tournament, data={"user_id": user.id}
+    )
 
     # Update tournament embed
     if _channel.in_forum(interaction):
-        tournament_message: Message = await tournament_thread.fetch_message(
-            db_tournament["id"]
+        tournament_message: Message = await _editor.get_message(
+            tournament_thread, db_tournament["id"]
         )
     else:
-        tournament_message: Message = await tournament_channel.fetch_message(
-            db_tournament["id"]
+        tournament_message: Message = await _editor.get_message(
+            tournament_channel, db_tournament["id"]
         )
     author: Member = (
         await guild.fetch_member(db_tournament["author"]["id"]) or interaction.user
     )
     new_tournament_embed = create_tournament_embed(db_tournament, author)
-    await tournament_message.edit(embed=new_tournament_embed)
+    _editor.schedule_edit(tournament_message, embed=new_tournament_embed)
     if interaction.channel.id != tournament_thread.id:
         await tournament_thread.send(
             f"This tournament has been updated by <@{user.id}>."
@@ -685,21 +695,37 @@ async def start_tournament(interaction: Interaction, tournament_title: str) -> b
         )
         return False
 
-    # Only allow one tournament to be started at a time in a guild
-    active_tournament = find_active_tournament(db_guild)
-    if active_tournament and active_tournament["id"] != db_tournament["id"]:
-        active_tournament_id = (
-            active_tournament["channel_id"] or active_tournament["id"]
+    # Limit the number of tournaments running at the same time in a guild (if set)
+    active_tournaments = find_active_tournaments(db_guild)
+    if MAX_ACTIVE_TOURNAMENTS and len(active_tournaments) >= MAX_ACTIVE_TOURNAMENTS:
+        active_channels = ", ".join(
+            f"<#{tournament['channel_id'] or tournament['id']}>"
+            for tournament in active_tournaments
         )
         await interaction.followup.send(
-            f"There may only be one active tournament per server.\nCurrent active tournament in: <#{active_tournament_id}>.",
+            f"There may only be {MAX_ACTIVE_TOURNAMENTS} active tournament(s) per server.\nCurrent active tournaments in: {active_channels}.",
             ephemeral=True,
         )
         return False
 
+    # Apply queued joins and leaves first, so that every participant has a challonge id
+    db_guild, db_tournament = await sync_with_challonge(interaction, db_tournament)
+    if not db_tournament:
+        return False
+
+    # Save the registration state, which resetting the tournament returns to
+    if not await eventlog.mark_start(guild.id, db_tournament["id"]):
+        printlog(
+            f"Failed to save the registration state of tournament ['title'='{tournament_title}']."
+        )
+        await interaction.followup.send(
+            f"Something went wrong when starting '***{tournament_title}***'."
+        )
+        return False
+
     # Start tournament on challonge
     try:
-        challonge.tournaments.start(
+        await challonge.tournaments.start(
             db_tournament["challonge"]["id"], include_participants=1, include_matches=1
         )
     except Exception as e:
@@ -715,18 +741,29 @@ async def start_tournament(interaction: Interaction, tournament_title: str) -> b
     )
 
     # Challonge API changed? Retrive matches.
-    challonge_matches = challonge.matches.index(db_tournament["challonge"]["id"])
+    challonge_matches = await challonge.matches.index(db_tournament["challonge"]["id"])
 
-    # Get total number of rounds
-    max_round = 0
-    for match in challonge_matches:
-        round = match["round"]
-        if round > max_round:
-            max_round = round
+    # Store the bracket structure so it does not have to be fetched again
+    bracket = _bracket.create_bracket(
+        challonge_matches, db_tournament["tournament_type"]
+    )
 
     # Set tournament to closed in database and set total number of rounds
-    db_tournament.update({"open": False, "in_progress": True, "num_rounds": max_round})
-    await set_tournament(guild.id, tournament_title, db_tournament)
+    db_tournament.update(
+        {
+            "open": False,
+            "in_progress": True,
+            "num_rounds": bracket["num_rounds"],
+            "bracket": bracket,
+        }
+    )
+    await set_tournament(
+        guild.id,
+        tournament_title,
+        db_tournament,
+        "tournament_started",
+        {"user_id": user.id},
+    )
     print(
         f"User ['name'='{user.name}#{user.discriminator}'] started tournament ['title'='{tournament_title}']."
     )
@@ -734,18 +771,16 @@ async def start_tournament(interaction: Interaction, tournament_title: str) -> b
     # Send start message
     await tournament_thread.send(embed=create_start_embed(interaction, db_tournament))
 
-    # Get each initial open matches
+    # Call the initial open matches
     matches = list(filter(lambda match: (match["state"] == "open"), challonge_matches))
-    for match in matches:
-        try:
-            await _match.create_match(
-                interaction.client, tournament_thread, db_guild, db_tournament, match
-            )
-        except Exception as e:
-            printlog(
-                f"Failed to add match ['match_id'='{match['id']}'] to tournament ['title'='{tournament_title}']",
-                e,
-            )
+    async with _match.match_call_locks[db_tournament["id"]]:
+        count = await _match.call_matches(
+            interaction.client, tournament_thread, db_guild, db_tournament, matches
+        )
+    if count < 0:
+        printlog(
+            f"Failed to call every open match in tournament ['title'='{tournament_title}']; the rest are called when matches are reconciled."
+        )
 
     # Update embed message
     await edit_tournament_message(db_tournament, tournament_channel, tournament_thread)
@@ -795,28 +830,63 @@ async def reset_tournament(interaction: Interaction, tournament_title: str) -> b
         )
         return False
 
-    # Delete every match message and document associated with the tournament
-    await delete_all_matches(tournament_thread, db_guild, db_tournament)
+    # Apply queued challonge writes first
+    if not await _outbox.wait_for_challonge(interaction, db_tournament):
+        return False
+
+    # Return to the registration state saved when the tournament started, which also
+    # truncates the event log; match messages are deleted afterwards
+    match_ids = [db_match["id"] for db_match in db_tournament["matches"]]
+    reported = has_reported_matches(db_tournament)
+    if await eventlog.reset_to_start(
+        guild.id, db_tournament["id"], {"open": True}, {"user_id": user.id}
+    ):
+        for match_id in match_ids:
+            _match.match_routes.pop(match_id, None)
+        await _match.delete_match_messages(tournament_thread, match_ids)
+        db_guild = await _guild.find_guild(
+            guild.id, {TOURNAMENTS: {"id": db_tournament["id"]}}
+        )
+        db_tournament = find_tournament_by_id(db_guild, db_tournament["id"])
+    else:
+        # Tournaments started before the event log existed have no registration state saved
+        await delete_all_matches(tournament_thread, db_guild, db_tournament)
 
-    # Set all participants back to active
-    for i in range(len(db_tournament["participants"])):
-        if not db_tournament["participants"][i]["active"]:
-            db_tournament["participants"][i].update({"active": True})
+        # Set all participants back to active
+        for i in range(len(db_tournament["participants"])):
+            if not db_tournament["participants"][i]["active"]:
+                db_tournament["participants"][i].update({"active": True})
+
+        # Set open to true and reset number of rounds
+        db_tournament.update(
+            {
+                "open": True,
+                "in_progress": False,
+                "num_rounds": None,
+                "bracket": None,
+                "matches": [],
+            }
+        )
+        await set_tournament(
+            guild.id,
+            tournament_title,
+            db_tournament,
+            "tournament_reset",
+            {"user_id": user.id},
+        )
+
+    # The reported matches were deleted, so the guild's ratings are replayed
+    if reported:
+        await _rating.recompute_ratings(guild.id)
 
     # Reset tournament on challonge
     try:
-        challonge.tournaments.reset(challonge_id)
+        await challonge.tournaments.reset(challonge_id)
     except Exception as e:
         printlog(
             f"Something went wrong when resetting tournament ['title'='{tournament_title}'] on challonge.",
             e,
         )
-
-    # Set open to true and reset number of rounds
-    db_tournament.update(
-        {"open": True, "in_progress": False, "num_rounds": None, "matches": []}
-    )
-    await set_tournament(guild.id, tournament_title, db_tournament)
     print(
         f"User ['name'='{user.name}#{user.discriminator}'] reset tournament ['title'='{tournament_title}']."
     )
@@ -829,20 +899,21 @@ async def reset_tournament(interaction: Interaction, tournament_title: str) -> b
 
     # Check if forum channel before editing content
     if _channel.in_forum(interaction):
-        tournament_message = await tournament_thread.fetch_message(
-            db_tournament["id"]
+        tournament_message = await _editor.get_message(
+            tournament_thread, db_tournament["id"]
         )  # CANNOT FETCH INITIAL MESSAGE IN THREAD
-        await tournament_message.edit(
+        _editor.schedule_edit(
+            tournament_message,
             content="Open for Registration 🚨",
             embed=new_tournament_embed,
             view=RegistrationView(),
         )
     else:
-        tournament_message = await tournament_channel.fetch_message(
-            db_tournament["id"]
+        tournament_message = await _editor.get_message(
+            tournament_channel, db_tournament["id"]
         )  # CANNOT FETCH INITIAL MESSAGE IN THREAD
-        await tournament_message.edit(
-            embed=new_tournament_embed, view=RegistrationView()
+        _editor.schedule_edit(
+            tournament_message, embed=new_tournament_embed, view=RegistrationView()
         )
     await tournament_thread.send(embed=create_reset_embed(interaction, db_tournament))
     await interaction.followup.send(
@@ -885,9 +956,13 @@ async def finalize_tournament(interaction: Interaction, tournament_title: str) -
         return False
     challonge_id = db_tournament["challonge"]["id"]
 
+    # Apply queued challonge writes first
+    if not await _outbox.wait_for_challonge(interaction, db_tournament):
+        return False
+
     # Finalize tournament on challonge
     try:
-        final_tournament = challonge.tournaments.finalize(
+        final_tournament = await challonge.tournaments.finalize(
             challonge_id, include_participants=1, include_matches=1
         )
     except Exception as e:
@@ -896,7 +971,7 @@ async def finalize_tournament(interaction: Interaction, tournament_title: str) -
             e,
         )
         try:  # Try and retrive tournament information instead of finalizing
-            final_tournament = challonge.tournaments.show(
+            final_tournament = await challonge.tournaments.show(
                 challonge_id, include_participants=1, include_matches=1
             )
         except:
@@ -928,7 +1003,13 @@ async def finalize_tournament(interaction: Interaction, tournament_title: str) -
         db_tournament.update(
             {"result_url": result_message.jump_url}
         )  # update result jump url
-        await set_tournament(guild.id, tournament_title, db_tournament)
+        await set_tournament(
+            guild.id,
+            tournament_title,
+            db_tournament,
+            "tournament_finalized",
+            {"user_id": user.id},
+        )
     except:
         print(f"Failed to update final tournament ['id'='{db_tournament['id']}'].")
         return False
@@ -1037,14 +1118,20 @@ async def open_close_tournament(
         return False
 
     # Update the tournament on challonge
-    challonge.tournaments.update(
+    await challonge.tournaments.update(
         db_tournament["challonge"]["id"],
         open_signup=open,
     )
     db_tournament["open"] = open
 
     # Update the tournament in database
-    await set_tournament(guild.id, tournament_title, db_tournament)
+    await set_tournament(
+        guild.id,
+        tournament_title,
+        db_tournament,
+        "registration_opened" if open else "registration_closed",
+        {"user_id": user.id},
+    )
     print(
         f"User '{user.name}#{user.discriminator}' {action} registration in tournament ['title'='{tournament_title}']."
     )
@@ -1220,6 +1307,50 @@ async def find_valid_tournament(
     return (db_tournament, db_tournament["title"], tournament_thread)
 
 
+async def queue_destroy_tournament(guild_id: int, challonge_id: int):
+    """Queues the deletion of a tournament from challonge, after any writes still queued for it.
+
+    Args:
+        guild_id (int): The id of the guild the tournament belongs to.
+        challonge_id (int): The challonge id of the tournament.
+
+    Returns:
+        True if the deletion was queued. Otherwise, False.
+    """
+    if await _outbox.enqueue(
+        guild_id,
+        challonge_id,
+        "destroy_tournament",
+        f"destroy_tournament:{challonge_id}",
+        {},
+    ):
+        return True
+    printlog(f"Failed to delete tournament from challonge [id='{challonge_id}'].")
+    return False
+
+
+async def sync_with_challonge(
+    interaction: Interaction, db_tournament: dict, respond: bool = True
+):
+    """Applies the queued challonge writes of a tournament, then reloads the tournament.
+    Participants only get their challonge ids once their join has been applied.
+
+    Args:
+        interaction (Interaction): The Discord command interaction.
+        db_tournament (dict): The target tournament database document.
+        respond (bool, optional): Flag to determine whether to respond if writes are still pending. Defaults to True.
+
+    Returns:
+        A tuple of the reloaded guild document (with only the target tournament loaded) and tournament document if successful. Otherwise, a tuple of (None, None).
+    """
+    if not await _outbox.wait_for_challonge(interaction, db_tournament, respond):
+        return None, None
+    db_guild = await _guild.find_guild(
+        interaction.guild.id, {TOURNAMENTS: {"id": db_tournament["id"]}}
+    )
+    return db_guild, find_tournament_by_id(db_guild, db_tournament["id"])
+
+
 def find_index_in_tournament(
     db_tournament: dict, target_field: str, target_key: str, target_value
 ) -> int:
@@ -1234,75 +1365,143 @@ def find_index_in_tournament(
     Returns:
         int: The index of the target document if found. Otherwise, -1.
     """
-    for i, dic in enumerate(db_tournament[target_field]):
-        if dic[target_key] == target_value:
-            return i
-    return -1
+    return _index.position(db_tournament[target_field], target_key, target_value)
 
 
-async def set_tournament(guild_id: int, tournament_title: str, new_tournament: dict):
+async def set_tournament(
+    guild_id: int,
+    tournament_title: str,
+    new_tournament: dict,
+    event_type: str = "tournament_updated",
+    data: dict = None,
+):
     """Sets a tournament in a guild to the specified document.
+    Only the fields, participants and matches that changed are written, as one logged event.
 
     Args:
         guild_id (int): The guild database document.
         tournament_title (str): The title of the target tournament.
         new_tournament (dict): The new tournament document.
+        event_type (str, optional): The type of the logged event. Defaults to "tournament_updated".
+        data (dict, optional): The facts of the logged event. Defaults to None.
 
     Returns:
-        A tuple of the updated guild document and the updated tournament document.
+        A tuple of the updated guild document (with only the target tournament loaded) and the updated tournament document.
     """
-    updated_guild = await mdb.update_single_document(
-        {
-            "guild_id": guild_id,
-            "tournaments.title": tournament_title,
-            "tournaments.id": new_tournament["id"],
-        },
-        {"$set": {f"tournaments.$": new_tournament}},
-        GUILDS,
+    tournaments = await schema.find_tournaments(
+        {"guild_id": guild_id, "id": new_tournament["id"]}
+    )
+    if not tournaments:
+        return None, None
+    writes = eventlog.diff_tournament(tournaments[0], new_tournament)
+    if not await eventlog.log(
+        guild_id, new_tournament["id"], event_type, writes, data
+    ):
+        return None, None
+    updated_guild = await _guild.find_guild(
+        guild_id, {TOURNAMENTS: {"id": new_tournament["id"]}}
     )
     return updated_guild, find_tournament(updated_guild, tournament_title)
 
 
 async def add_to_tournament(
-    guild_id: int, tournament_title: str, target_field: str, document: dict
+    guild_id: int,
+    tournament_title: str,
+    target_field: str,
+    document: dict,
+    event_type: str,
 ):
     """Pushes a document to a tournament subarray.
+    The document is stored in the collection with the same name as the target field.
 
     Args:
         guild_id (int): The guild database document.
         tournament_title (str): The title of the target tournament.
         target_field (str): The target document field.
         document (dict): The document to add.
+        event_type (str): The type of the logged event (ex. "match_called").
 
     Returns:
-        A tuple of the updated guild document and the updated tournament document.
+        A tuple of the updated guild document (with only the target tournament loaded) and the updated tournament document.
     """
-    updated_guild = await mdb.update_single_document(
-        {"guild_id": guild_id, "tournaments.title": tournament_title},
-        {"$push": {f"tournaments.$.{target_field}": document}},
-        GUILDS,
+    return await add_many_to_tournament(
+        guild_id, tournament_title, target_field, [document], event_type
+    )
+
+
+async def add_many_to_tournament(
+    guild_id: int,
+    tournament_title: str,
+    target_field: str,
+    documents: list,
+    event_type: str,
+):
+    """Pushes several documents to a tournament subarray in a single write.
+    The documents are stored in the collection with the same name as the target field.
+
+    Args:
+        guild_id (int): The guild database document.
+        tournament_title (str): The title of the target tournament.
+        target_field (str): The target document field.
+        documents (list): The documents to add.
+        event_type (str): The type of the logged event (ex. "participants_joined").
+
+    Returns:
+        A tuple of the updated guild document (with only the target tournament loaded) and the updated tournament document.
+    """
+    tournament_doc = await mdb.find_document(
+        {"guild_id": guild_id, "title": tournament_title}, TOURNAMENTS, {"id": 1}
+    )
+    if not tournament_doc:
+        return None, None
+    if not await eventlog.log(
+        guild_id,
+        tournament_doc["id"],
+        event_type,
+        [eventlog.put(target_field, document) for document in documents],
+        {"ids": [document["id"] for document in documents]},
+    ):
+        return None, None
+    updated_guild = await _guild.find_guild(
+        guild_id, {TOURNAMENTS: {"id": tournament_doc["id"]}}
     )
     return updated_guild, find_tournament(updated_guild, tournament_title)
 
 
 async def remove_from_tournament(
-    guild_id: int, tournament_title: str, target_field: str, target_id: int
+    guild_id: int,
+    tournament_title: str,
+    target_field: str,
+    target_id: int,
+    event_type: str,
 ):
     """Pulls a document from a tournament subarray.
+    The document is removed from the collection with the same name as the target field.
 
     Args:
         guild_id (int): The guild database document.
         tournament_title (str): The title of the target tournament.
         target_field (str): The target document field.
         target_id (int): The id of the target document to remove.
+        event_type (str): The type of the logged event (ex. "participant_left").
 
     Returns:
-        A tuple of the updated guild document and the updated tournament document.
+        A tuple of the updated guild document (with only the target tournament loaded) and the updated tournament document.
     """
-    updated_guild = await mdb.update_single_document(
-        {"guild_id": guild_id, "tournaments.title": tournament_title},
-        {"$pull": {f"tournaments.$.{target_field}": {"id": target_id}}},
-        GUILDS,
+    tournament_doc = await mdb.find_document(
+        {"guild_id": guild_id, "title": tournament_title}, TOURNAMENTS, {"id": 1}
+    )
+    if not tournament_doc:
+        return None, None
+    await eventlog.log(
+        guild_id,
+        tournament_doc["id"],
+        event_type,
+        [eventlog.delete(target_field, [target_id])],
+        {"id": target_id},
+    )
+    updated_guild = await _guild.find_guild(
+        guild_id, {TOURNAMENTS: {"id": tournament_doc["id"]}}
     )
     return updated_guild, find_tournament(updated_guild, tournament_title)
 
@@ -1322,19 +1521,17 @@ async def delete_all_matches(
         Otherwise, a tuple of None, None.
     """
     tournament_title = db_tournament["title"]
-    for match in db_tournament["matches"]:
-        match_id = match["id"]
-        try:
-            db_guild, db_tournament = await _match.delete_match(
-                tournament_thread, db_guild, db_tournament, match_id
-            )
-        except Exception as e:
-            printlog(
-                f"Failed to delete match ['id'={match_id}] in tournament ['title'='{tournament_title}'].",
-                e,
-            )
-            return (None, None)
-    return (db_guild, db_tournament)
+    match_ids = [match["id"] for match in db_tournament["matches"]]
+    try:
+        return await _match.delete_matches(
+            tournament_thread, db_guild, db_tournament, match_ids
+        )
+    except Exception as e:
+        printlog(
+            f"Failed to delete matches in tournament ['title'='{tournament_title}'].",
+            e,
+        )
+        return (None, None)
 
 
 def parse_time(string: str) -> datetime:
@@ -1476,47 +1673,32 @@ async def edit_tournament_message(
     tournament_thread: Thread,
 ) -> bool:
     """Edits tournament embed message in a channel.
+    The edit is queued, so that edits made in quick succession are sent as one.
 
     Args:
         db_tournament (dict): The target tournament database document.
-        tournament_channel (TextChannel | ForumChannel): _description_
+        tournament_channel (TextChannel | ForumChannel): The tournament Discord channel.
         tournament_thread (Thread): The tournament Discord thread.
 
     Returns:
         bool: True if successful. Otherwise, False.
     """
-    tournament_title = db_tournament["title"]
     if str(tournament_channel.type) == "forum":
-        tournament_message = await tournament_thread.fetch_message(db_tournament["id"])
+        tournament_message = await _editor.get_message(
+            tournament_thread, db_tournament["id"]
+        )
     else:
-        tournament_message = await tournament_channel.fetch_message(db_tournament["id"])
-    embed = tournament_message.embeds[0]
+        tournament_message = await _editor.get_message(
+            tournament_channel, db_tournament["id"]
+        )
+    embed = _editor.current_embed(tournament_message)
     embed = update_embed_participants(db_tournament, embed)
 
     # Update the status
     status = str_status(db_tournament)
-    if db_tournament["in_progress"]:
-        await tournament_message.edit(view=None)
-    else:
-        await tournament_message.edit(view=RegistrationView())
+    view = None if db_tournament["in_progress"] else RegistrationView()
     embed.description = f"Status: {status}"
 
-    # Add bracket image.
-    if db_tournament["in_progress"]:
-        image_embed = None
-        try:
-            image_embed = create_tournament_image(db_tournament, embed)
-            if not image_embed:
-                printlog(
-                    f"Error when creating image for tournament ['title'='{tournament_title}']."
-                )
-            else:
-                embed = image_embed
-        except Exception as e:
-            printlog(
-                f"Failed to create image for tournament ['title'='{tournament_title}']."
-            )
-            print(e)
     if db_tournament["completed"]:
         time_str = db_tournament["completed"].strftime(
             "%A, %B %d, %Y %#I:%M %p %Z"
@@ -1527,7 +1709,11 @@ async def edit_tournament_message(
             inline=False,
         )
     content = status if tournament_channel.type == "forum" else ""
-    await tournament_message.edit(content=content, embed=embed)
+    _editor.schedule_edit(tournament_message, content=content, embed=embed, view=view)
+
+    # Update bracket image in the background
+    if db_tournament["in_progress"]:
+        _render.schedule_tournament_image(db_tournament, tournament_message)
     return True
 
 
@@ -1543,9 +1729,10 @@ def update_embed_participants(db_tournament: dict, embed: Embed) -> Embed:
     """
     participants = db_tournament["participants"]
     if len(participants) > 0:
-        participants_content = ""
-        for participant in participants:
-            participants_content += f"> <@{participant['id']}>\n"
+        # Large rosters do not fit in one field, so only the first entrants are listed
+        participants_content = fit_lines(
+            [f"> <@{participant['id']}>" for participant in participants]
+        )
     else:
         participants_content = "> *None*"
     max_participants = db_tournament["max_participants"]
@@ -1558,41 +1745,6 @@ def update_embed_participants(db_tournament: dict, embed: Embed) -> Embed:
     return embed
 
 
-def create_tournament_image(db_tournament: dict, embed: Embed):
-    """Creates an image of the tournament.
-    Converts the generated svg challonge image to png and uploads it to imgur.
-    Discord does not support svg images in preview.
-
-    Args:
-        db_tournament (dict): The target tournament database document.
-        embed (Embed): The tournament embed to update.
-
-    Returns:
-        Embed: The updated tournament embed.
-    """
-    if len(db_tournament["participants"]) < 2:
-        return None
-    tournament_title = db_tournament["title"]
-    challonge_url = db_tournament["challonge"]["url"]
-    svg_url = f"{challonge_url}.svg"
-    png_data = svg2png(url=svg_url)  # Convert svg to png
-    payload = {"image": png_data}
-    headers = {"Authorization": f"Client-ID {IMGUR_CLIENT_ID}"}
-    response = requests.request(
-        "POST", f"{IMGUR_URL}/image", headers=headers, data=payload, files=[]
-    )
-    if response.status_code == requests.codes.ok:
-        data = response.json()["data"]
-        image_link = data["link"]
-        embed.set_image(url=image_link)
-        return embed
-    else:
-        printlog(
-            f"Failed to create image for tournament ['title'='{tournament_title}']."
-        )
-        return None
-
-
 def create_seeding_embed(db_tournament: dict) -> Embed:
     """Creates an embed object with the seeding of the tournament.
 
@@ -1891,17 +2043,17 @@ async def create_test_tournament(
 
     Args:
         interaction (Interaction): The Discord command interaction.
-        num_participants (int, optional): The number of participants to add in the test tournament. Max of 4. Defaults to 4.
+        num_participants (int, optional): The number of participants to add in the test tournament. Max of MAX_ENTRANTS. Defaults to 4.
 
     Returns:
         bool: True if successful. Otherwise, False.
     """
     # Check number of participants
-    if num_participants > 4:
+    if num_participants > MAX_ENTRANTS:
         return await interaction.followup.send(
-            f"There is a maxmimum of 4 participants in the test tournament."
+            f"There is a maxmimum of {MAX_ENTRANTS} participants in the test tournament."
         )
-    
+
     printlog("Creating test tournament...")
     tournament_title = "Test Tournament"
     _, tournament_message, _ = None, None, None
@@ -1925,19 +2077,30 @@ async def create_test_tournament(
             interaction, tournament_title, respond=False
         )
 
-        members = [
+        # The test accounts first, then any other guild members
+        test_members = [
             guild.get_member_named("beta#3096"),
             guild.get_member_named("pika!#3722"),
             guild.get_member_named("Wooper#0478"),
             guild.get_member_named("WOOPBOT#4140"),
         ]
-        for i in range(num_participants):
-            try:
-                await _participant.add_participant(
+        members = [member for member in test_members if member]
+        members += [member for member in guild.members if member not in members]
+        if len(members) < num_participants:
+            await interaction.followup.send(
+                f"The server only has {len(members)} members to add to the test tournament."
+            )
+            num_participants = len(members)
+        # Joins are registered in batches, so add the participants concurrently
+        await asyncio.gather(
+            *[
+                _participant.add_participant(
                     interaction, db_tournament, member=members[i], respond=False
                 )
-            except:
-                pass
+                for i in range(num_participants)
+            ],
+            return_exceptions=True,
+        )
         await interaction.followup.send(
             f"Finished generating Test Tournament and participants."
         )
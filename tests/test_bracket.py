@@ -0,0 +1,164 @@
+import random
+
+from modules import bracket as _bracket
+
+# test_bracket.py
+# Tests for the local bracket engine (modules/bracket.py)
+#
+# The brackets below follow the structure Challonge returns for 4 entrants. Participants
+# have Challonge ids 101-104 and Discord ids 1-4.
+
+
+def challonge_match(
+    match_id: int,
+    round: int,
+    player1_id: int = None,
+    player2_id: int = None,
+    player1_prereq: int = None,
+    player2_prereq: int = None,
+    player1_loser: bool = False,
+    player2_loser: bool = False,
+) -> dict:
+    return {
+        "id": match_id,
+        "round": round,
+        "state": "pending",
+        "player1_id": player1_id,
+        "player2_id": player2_id,
+        "player1_prereq_match_id": player1_prereq,
+        "player2_prereq_match_id": player2_prereq,
+        "player1_is_prereq_match_loser": player1_loser,
+        "player2_is_prereq_match_loser": player2_loser,
+    }
+
+
+SINGLE_ELIMINATION = [
+    challonge_match(1, 1, 101, 104),
+    challonge_match(2, 1, 102, 103),
+    challonge_match(3, 2, player1_prereq=1, player2_prereq=2),
+]
+
+DOUBLE_ELIMINATION = [
+    challonge_match(11, 1, 101, 104),
+    challonge_match(12, 1, 102, 103),
+    # Winners finals
+    challonge_match(13, 2, player1_prereq=11, player2_prereq=12),
+    # Losers round 1 and losers finals
+    challonge_match(
+        14,
+        -1,
+        player1_prereq=11,
+        player2_prereq=12,
+        player1_loser=True,
+        player2_loser=True,
+    ),
+    challonge_match(15, -2, player1_prereq=13, player2_prereq=14, player1_loser=True),
+    # Grand finals and its reset
+    challonge_match(16, 3, player1_prereq=13, player2_prereq=15),
+    challonge_match(17, 3, player1_prereq=16, player2_prereq=16, player2_loser=True),
+]
+
+
+def create_tournament(challonge_matches: list, tournament_type: str) -> dict:
+    return {
+        "bracket": _bracket.create_bracket(challonge_matches, tournament_type),
+        "participants": [
+            {"id": challonge_id - 100, "challonge_id": challonge_id}
+            for challonge_id in range(101, 105)
+        ],
+        "matches": [],
+    }
+
+
+def report(db_tournament: dict, opened_match: dict, winner_id: int) -> list:
+    """Stores a called match with its result, and returns the matches it opens."""
+    db_tournament["matches"].append(
+        {
+            "challonge_id": opened_match["id"],
+            "completed": True,
+            "winner_emote": "1️⃣" if winner_id == opened_match["player1_id"] else "2️⃣",
+            "player1": {"id": opened_match["player1_id"] - 100},
+            "player2": {"id": opened_match["player2_id"] - 100},
+        }
+    )
+    return _bracket.find_opened_matches(db_tournament, opened_match["id"])
+
+
+def players(opened_matches: list) -> dict:
+    return {
+        match["id"]: (match["player1_id"], match["player2_id"])
+        for match in opened_matches
+    }
+
+
+def test_create_bracket_sorts_matches_and_keeps_bracket_fields():
+    shuffled = list(DOUBLE_ELIMINATION)
+    random.Random(1).shuffle(shuffled)
+    bracket = _bracket.create_bracket(shuffled, "double elimination")
+    assert [match["id"] for match in bracket["matches"]] == list(range(11, 18))
+    assert bracket["num_rounds"] == 3
+    assert all(
+        set(match) == set(_bracket.BRACKET_MATCH_FIELDS) for match in bracket["matches"]
+    )
+
+
+def test_grand_finals_reset_is_the_highest_match_id():
+    bracket = _bracket.create_bracket(DOUBLE_ELIMINATION, "double elimination")
+    assert bracket["grand_finals_reset_id"] == 17
+    assert _bracket.find_grand_finals(bracket)["id"] == 16
+    db_tournament = {"bracket": bracket}
+    assert _bracket.is_grand_finals_reset(db_tournament, 17)
+    assert not _bracket.is_grand_finals_reset(db_tournament, 16)
+
+
+def test_single_elimination_has_no_reset():
+    bracket = _bracket.create_bracket(SINGLE_ELIMINATION, "single elimination")
+    assert bracket["num_rounds"] == 2
+    assert bracket["grand_finals_reset_id"] is None
+    assert _bracket.find_grand_finals(bracket) is None
+
+
+def test_unknown_bracket_opens_nothing():
+    assert _bracket.find_opened_matches({"matches": []}, 1) is None
+    assert _bracket.is_grand_finals_reset({}, 1) is None
+
+
+def test_single_elimination_opens_finals_once_both_semifinals_are_reported():
+    db_tournament = create_tournament(SINGLE_ELIMINATION, "single elimination")
+    assert report(db_tournament, SINGLE_ELIMINATION[0], 101) == []
+    opened = report(db_tournament, SINGLE_ELIMINATION[1], 103)
+    assert players(opened) == {3: (101, 103)}
+    assert opened[0]["state"] == "open"
+
+
+def play_to_grand_finals(db_tournament: dict) -> dict:
+    """Plays the bracket up to grand finals: 101 wins the winners bracket, and 102 comes
+    back through the losers bracket. Returns the opened grand finals match."""
+    assert report(db_tournament, DOUBLE_ELIMINATION[0], 101) == []
+    opened = report(db_tournament, DOUBLE_ELIMINATION[1], 102)
+    # Winners finals and the first losers round open together
+    assert players(opened) == {13: (101, 102), 14: (104, 103)}
+    opened_by_id = {match["id"]: match for match in opened}
+    assert report(db_tournament, opened_by_id[14], 104) == []
+    opened = report(db_tournament, opened_by_id[13], 101)
+    assert players(opened) == {15: (102, 104)}
+    opened = report(db_tournament, opened[0], 102)
+    assert players(opened) == {16: (101, 102)}
+    return opened[0]
+
+
+def test_winners_finalist_winning_grand_finals_ends_the_bracket():
+    db_tournament = create_tournament(DOUBLE_ELIMINATION, "double elimination")
+    grand_finals = play_to_grand_finals(db_tournament)
+    assert report(db_tournament, grand_finals, 101) == []
+
+
+def test_losers_finalist_winning_grand_finals_opens_the_reset():
+    db_tournament = create_tournament(DOUBLE_ELIMINATION, "double elimination")
+    grand_finals = play_to_grand_finals(db_tournament)
+    opened = report(db_tournament, grand_finals, 102)
+    assert players(opened) == {17: (101, 102)}
+    assert opened[0]["player1_prereq_match_id"] == 16
+    assert opened[0]["player2_prereq_match_id"] == 16
+    # The reset is the last match of the bracket
+    assert report(db_tournament, opened[0], 102) == []
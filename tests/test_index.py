@@ -0,0 +1,98 @@
+import pickle
+
+from utils import index as _index
+from utils.index import DocumentIndex
+
+# test_index.py
+# Tests for keyed document lookups (utils/index.py)
+
+
+def create_index() -> DocumentIndex:
+    return DocumentIndex(
+        [
+            {"id": 1, "title": "weekly", "challonge_id": None},
+            {"id": 2, "title": "monthly", "challonge_id": 20},
+            {"id": 3, "title": "weekly", "challonge_id": 30},
+        ],
+        keys=("id", "title", "challonge_id"),
+    )
+
+
+def test_find_returns_the_first_matching_document():
+    documents = create_index()
+    assert documents.find("id", 2)["title"] == "monthly"
+    assert documents.find("title", "weekly")["id"] == 1
+    assert documents.find("challonge_id", 30)["id"] == 3
+    assert documents.position("id", 3) == 2
+
+
+def test_missing_values_are_not_found():
+    documents = create_index()
+    assert documents.find("id", 4) is None
+    assert documents.position("id", 4) == -1
+    # Documents without a value are not indexed, but the fallback scan still finds them
+    assert documents.find("challonge_id", None)["id"] == 1
+
+
+def test_keys_that_are_not_indexed_are_scanned():
+    documents = create_index()
+    assert documents.find("name", "finals") is None
+    documents[1]["name"] = "finals"
+    assert documents.find("name", "finals")["id"] == 2
+
+
+def test_appended_documents_are_indexed():
+    documents = create_index()
+    documents.build()
+    documents.append({"id": 4, "title": "finals", "challonge_id": 40})
+    documents += [{"id": 5, "title": "open", "challonge_id": 50}]
+    assert documents.find("title", "finals")["id"] == 4
+    assert documents.find("challonge_id", 50)["id"] == 5
+
+
+def test_removed_documents_are_no_longer_found():
+    documents = create_index()
+    documents.remove(documents.find("id", 1))
+    assert documents.find("id", 1) is None
+    # The remaining documents moved up, and are found at their new positions
+    assert documents.position("id", 2) == 0
+    assert documents.find("title", "weekly")["id"] == 3
+    del documents[0]
+    assert documents.find("id", 2) is None
+    assert documents.pop()["id"] == 3
+    assert documents.find("id", 3) is None
+
+
+def test_insert_and_sort_rebuild_positions():
+    documents = create_index()
+    documents.insert(0, {"id": 0, "title": "weekly", "challonge_id": 10})
+    assert documents.find("title", "weekly")["id"] == 0
+    documents.sort(key=lambda document: -document["id"])
+    assert documents.position("id", 3) == 0
+    assert documents.find("title", "weekly")["id"] == 3
+
+
+def test_documents_edited_in_place_are_found():
+    documents = create_index()
+    documents.build()
+    documents.find("id", 2)["title"] = "finals"
+    assert documents.find("title", "finals")["id"] == 2
+    assert documents.find("title", "monthly") is None
+    documents[0] = {"id": 7, "title": "weekly", "challonge_id": None}
+    assert documents.find("id", 7) is documents[0]
+    assert documents.find("id", 1) is None
+
+
+def test_module_helpers_accept_plain_lists():
+    documents = [{"id": 1}, {"id": 2}]
+    assert _index.find(documents, "id", 2) is documents[1]
+    assert _index.position(documents, "id", 3) == -1
+    assert _index.find(create_index(), "title", "monthly")["id"] == 2
+
+
+def test_copies_keep_their_keys():
+    documents = create_index()
+    copy = pickle.loads(pickle.dumps(documents))
+    assert isinstance(copy, DocumentIndex)
+    assert copy.keys == documents.keys
+    assert copy.find("challonge_id", 20)["id"] == 2
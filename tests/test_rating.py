@@ -0,0 +1,92 @@
+import pytest
+
+from modules import rating as _rating
+from modules.rating import RatingIndex
+
+# test_rating.py
+# Tests for the rating systems and the sorted rating index (modules/rating.py)
+
+
+def test_glicko2_matches_the_reference_example():
+    # The worked example from Glickman, "Example of the Glicko-2 system" (tau = 0.5)
+    player = {"rating": 1500, "rd": 200, "volatility": 0.06}
+    games = [
+        ({"rating": 1400, "rd": 30}, 1),
+        ({"rating": 1550, "rd": 100}, 0),
+        ({"rating": 1700, "rd": 300}, 0),
+    ]
+    result = _rating.glicko2_period(player, games)
+    assert result["rating"] == pytest.approx(1464.06, abs=0.05)
+    assert result["rd"] == pytest.approx(151.52, abs=0.01)
+    assert result["volatility"] == pytest.approx(0.05999, abs=1e-5)
+
+
+def test_glicko2_update_is_a_period_of_one_game():
+    player = {"rating": 1620, "rd": 80, "volatility": 0.06}
+    opponent = {"rating": 1480, "rd": 150, "volatility": 0.06}
+    assert _rating.glicko2_update(player, opponent, 0) == _rating.glicko2_period(
+        player, [(opponent, 0)]
+    )
+
+
+def test_rate_with_glicko2_moves_both_players(monkeypatch):
+    monkeypatch.setattr(_rating, "RATING_SYSTEM", "glicko2")
+    new_player = _rating.default_rating()
+    winner, loser = _rating.rate(new_player, new_player)
+    assert winner["rating"] > _rating.DEFAULT_RATING > loser["rating"]
+    assert winner["rating"] - _rating.DEFAULT_RATING == pytest.approx(
+        _rating.DEFAULT_RATING - loser["rating"]
+    )
+    # Playing makes a rating more certain
+    assert winner["rd"] < _rating.DEFAULT_RD
+    assert loser["rd"] < _rating.DEFAULT_RD
+
+
+def test_rate_with_elo(monkeypatch):
+    monkeypatch.setattr(_rating, "RATING_SYSTEM", "elo")
+    equal = {"rating": 1500}
+    winner, loser = _rating.rate(equal, equal)
+    assert winner["rating"] == pytest.approx(1500 + _rating.ELO_K / 2)
+    assert loser["rating"] == pytest.approx(1500 - _rating.ELO_K / 2)
+    # An upset moves the ratings further than an expected result
+    upset, _ = _rating.rate({"rating": 1300}, {"rating": 1700})
+    expected, _ = _rating.rate({"rating": 1700}, {"rating": 1300})
+    assert upset["rating"] - 1300 > expected["rating"] - 1700
+
+
+def test_rating_of_fills_in_defaults():
+    assert _rating.rating_of(None) == _rating.default_rating()
+    assert _rating.rating_of({"id": 1, "rating": 1600.0}) == {
+        **_rating.default_rating(),
+        "rating": 1600.0,
+    }
+
+
+def test_rating_index_ranks_from_highest_to_lowest():
+    index = RatingIndex(
+        [
+            {"id": 1, "rating": 1500.0},
+            {"id": 2, "rating": 1650.0},
+            {"id": 3},
+            {"id": 4, "rating": 1400.0},
+        ]
+    )
+    assert len(index) == 4
+    assert index.top(2) == [(2, 1650.0), (1, 1500.0)]
+    # Equal ratings are ordered by user id
+    assert index.top(2, offset=1) == [(1, 1500.0), (3, _rating.DEFAULT_RATING)]
+    assert [index.rank(user_id) for user_id in (2, 1, 3, 4)] == [1, 2, 3, 4]
+    assert index.rank(5) is None
+
+
+def test_rating_index_updates_and_removes_users():
+    index = RatingIndex([{"id": 1, "rating": 1500.0}, {"id": 2, "rating": 1600.0}])
+    index.update(1, 1700.0)
+    assert index.top(2) == [(1, 1700.0), (2, 1600.0)]
+    index.update(3, 1650.0)
+    assert index.rank(3) == 2
+    assert len(index) == 3
+    index.remove(1)
+    index.remove(1)
+    assert index.top(5) == [(3, 1650.0), (2, 1600.0)]
+    assert index.rank(1) is None
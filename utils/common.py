@@ -72,3 +72,30 @@ async def valid_bot_permissions(interaction: Interaction, respond: bool = True)
             )
         return False
     return True
+
+
+# Longest value Discord accepts in an embed field
+EMBED_FIELD_LIMIT = 1024
+
+
+def fit_lines(lines: list, limit: int = EMBED_FIELD_LIMIT) -> str:
+    """Joins lines into an embed field value that stays within the field limit.
+    Lines that do not fit are left out and counted in a last line instead.
+
+    Args:
+        lines (list): The lines to show, in order.
+        limit (int, optional): The longest value allowed. Defaults to EMBED_FIELD_LIMIT.
+
+    Returns:
+        str: The field value.
+    """
+    content = ""
+    for i, line in enumerate(lines):
+        remaining = len(lines) - i
+        overflow = f"> *...and {remaining} more*"
+        # Leave room for the overflow line unless this is the last line
+        reserved = len(overflow) + 1 if remaining > 1 else 0
+        if len(content) + len(line) + 1 + reserved > limit:
+            return content + overflow
+        content += f"{line}\n"
+    return content
@@ -15,9 +15,16 @@ TOURNAMENTS = 'tournaments'
 CHALLENGES = 'challenges'
 GUILDS = 'guilds'
 MATCHES = 'matches'
+PARTICIPANTS = 'participants'
+LEADERBOARD = 'leaderboard'
+HISTORY = 'history'
+OUTBOX = 'outbox'
+EVENTS = 'events'
+SNAPSHOTS = 'snapshots'
 
 ICON = 'https://static-cdn.jtvnw.net/jtv_user_pictures/638055be-8ceb-413e-8972-bd10359b8556-profile_image-70x70.png'
 IMGUR_CLIENT_ID = os.getenv('IMGUR_ID')
 IMGUR_URL = 'https://api.imgur.com/3'
 
-MAX_ENTRANTS = 24
\ No newline at end of file
+# Largest number of entrants in a tournament
+MAX_ENTRANTS = int(os.getenv('MAX_ENTRANTS', 512))
\ No newline at end of file
@@ -0,0 +1,184 @@
+# index.py
+# Keyed lookups for lists of documents
+#
+# Tournaments, participants and matches are kept as lists of dictionaries and looked up by
+# "id", "challonge_id" or "title". DocumentIndex is a list that also maps each indexed key
+# value to the position of its first document, so those lookups no longer scan the list.
+# Appends are indexed as they happen; any other change to the list (remove, insert, sort,
+# item assignment, ...) drops the maps, which are rebuilt on the next lookup. Documents can
+# still be edited in place, so every hit is checked against the document and a miss falls
+# back to a scan before giving up.
+
+
+class DocumentIndex(list):
+    """A list of documents that can be looked up by any of its indexed keys."""
+
+    def __init__(self, documents=(), keys: tuple = ("id",)):
+        """
+        Args:
+            documents (iterable, optional): The documents. Defaults to ().
+            keys (tuple, optional): The document keys to index. Defaults to ("id",).
+        """
+        super().__init__(documents)
+        self.keys = tuple(keys)
+        self._positions = None
+
+    def __reduce_ex__(self, protocol):
+        return (self.__class__, (list(self), self.keys))
+
+    def build(self):
+        """Rebuilds the position maps of every indexed key."""
+        self._positions = {key: {} for key in self.keys}
+        for position, document in enumerate(self):
+            self._index_document(position, document)
+
+    def _index_document(self, position: int, document: dict):
+        for key, positions in self._positions.items():
+            value = document.get(key)
+            if value is not None:
+                positions.setdefault(value, position)
+
+    def _invalidate(self):
+        self._positions = None
+
+    def position(self, key: str, value) -> int:
+        """Returns the position of the first document whose key matches a value.
+
+        Args:
+            key (str): The document key.
+            value (any): The target value.
+
+        Returns:
+            int: The position of the document if found. Otherwise, -1.
+        """
+        if key not in self.keys:
+            return scan(self, key, value)
+        if self._positions is None:
+            self.build()
+        position = self._positions[key].get(value)
+        if (
+            position is not None
+            and position < len(self)
+            and self[position].get(key) == value
+        ):
+            return position
+        # The document may have been edited in place since the maps were built
+        position = scan(self, key, value)
+        if position >= 0:
+            self.build()
+        return position
+
+    def find(self, key: str, value):
+        """Returns the first document whose key matches a value.
+
+        Args:
+            key (str): The document key.
+            value (any): The target value.
+
+        Returns:
+            The document if found. Otherwise, None.
+        """
+        position = self.position(key, value)
+        return self[position] if position >= 0 else None
+
+    def append(self, document: dict):
+        super().append(document)
+        if self._positions is not None:
+            self._index_document(len(self) - 1, document)
+
+    def extend(self, documents):
+        for document in documents:
+            self.append(document)
+
+    def __iadd__(self, documents):
+        self.extend(documents)
+        return self
+
+    def insert(self, position: int, document: dict):
+        super().insert(position, document)
+        self._invalidate()
+
+    def remove(self, document: dict):
+        super().remove(document)
+        self._invalidate()
+
+    def pop(self, position: int = -1):
+        document = super().pop(position)
+        self._invalidate()
+        return document
+
+    def clear(self):
+        super().clear()
+        self._invalidate()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._invalidate()
+
+    def reverse(self):
+        super().reverse()
+        self._invalidate()
+
+    def __setitem__(self, position, document):
+        replaced = self[position]
+        super().__setitem__(position, document)
+        # Replacing a document with one that has the same keys keeps the maps valid
+        if not isinstance(position, int) or any(
+            replaced.get(key) != document.get(key) for key in self.keys
+        ):
+            self._invalidate()
+
+    def __delitem__(self, position):
+        super().__delitem__(position)
+        self._invalidate()
+
+
+def scan(documents: list, key: str, value) -> int:
+    """Returns the position of the first document whose key matches a value, by scanning.
+
+    Args:
+        documents (list): The documents.
+        key (str): The document key.
+        value (any): The target value.
+
+    Returns:
+        int: The position of the document if found. Otherwise, -1.
+    """
+    for position, document in enumerate(documents):
+        if document.get(key) == value:
+            return position
+    return -1
+
+
+def find(documents: list, key: str, value):
+    """Returns the first document in a list whose key matches a value.
+    Uses the index of a DocumentIndex, and scans any other list.
+
+    Args:
+        documents (list): The documents.
+        key (str): The document key.
+        value (any): The target value.
+
+    Returns:
+        The document if found. Otherwise, None.
+    """
+    if isinstance(documents, DocumentIndex):
+        return documents.find(key, value)
+    position = scan(documents, key, value)
+    return documents[position] if position >= 0 else None
+
+
+def position(documents: list, key: str, value) -> int:
+    """Returns the position of the first document in a list whose key matches a value.
+
+    Args:
+        documents (list): The documents.
+        key (str): The document key.
+        value (any): The target value.
+
+    Returns:
+        int: The position of the document if found. Otherwise, -1.
+    """
+    if isinstance(documents, DocumentIndex):
+        return documents.position(key, value)
+    return scan(documents, key, value)
@@ -0,0 +1,63 @@
+import os
+import re
+
+from cairosvg import svg2png
+
+# raster.py
+# SVG to PNG conversion for the render workers
+#
+# The render workers (see modules/render.py) are spawned processes that load rasterize
+# from this module, so it must stay free of side effects and heavy imports.
+
+# Longest side of a rendered bracket in pixels; larger brackets are scaled down to fit
+RENDER_MAX_SIDE = int(os.getenv("RENDER_MAX_SIDE", 8192))
+# Largest rendered image in bytes; images over it are rendered again at a smaller scale
+RENDER_MAX_BYTES = int(os.getenv("RENDER_MAX_BYTES", 10 * 1024 * 1024))
+# Scale to shrink by on each retry, and the smallest scale tried
+RENDER_SHRINK = 0.7
+RENDER_MIN_SCALE = 0.1
+
+svg_tag_re = re.compile(rb"<svg\b[^>]*>")
+svg_width_re = re.compile(rb"\swidth=[\"']([\d.]+)")
+svg_height_re = re.compile(rb"\sheight=[\"']([\d.]+)")
+
+
+def svg_size(svg: bytes):
+    """Reads the width and height of an SVG image from its root element.
+
+    Args:
+        svg (bytes): The SVG image.
+
+    Returns:
+        A tuple of the width and height if both are set. Otherwise, None.
+    """
+    tag = svg_tag_re.search(svg)
+    if not tag:
+        return None
+    width = svg_width_re.search(tag.group())
+    height = svg_height_re.search(tag.group())
+    if not width or not height:
+        return None
+    return float(width.group(1)), float(height.group(1))
+
+
+def rasterize(svg: bytes) -> bytes:
+    """Converts an SVG image to PNG. Runs in a render worker process.
+    The image is scaled down so that its longest side is at most RENDER_MAX_SIDE pixels and
+    the PNG is at most RENDER_MAX_BYTES, so brackets with hundreds of entrants stay uploadable.
+
+    Args:
+        svg (bytes): The SVG image.
+
+    Returns:
+        bytes: The PNG image.
+    """
+    scale = 1
+    size = svg_size(svg)
+    if size and max(size) > RENDER_MAX_SIDE:
+        scale = RENDER_MAX_SIDE / max(size)
+    png = svg2png(bytestring=svg, scale=scale)
+    while len(png) > RENDER_MAX_BYTES and scale * RENDER_SHRINK >= RENDER_MIN_SCALE:
+        scale *= RENDER_SHRINK
+        png = svg2png(bytestring=svg, scale=scale)
+    return png
@@ -0,0 +1,38 @@
+import discord
+
+# Seconds after the last page turn before the page buttons stop working
+LEADERBOARD_TIMEOUT = 600
+
+
+class LeaderboardView(discord.ui.View):
+    def __init__(self, users, offset, has_previous, has_next) -> None:
+        super().__init__(timeout=LEADERBOARD_TIMEOUT)
+        self.previous_button = PageButton(forward=False, emoji="⬅️")
+        self.next_button = PageButton(forward=True, emoji="➡️")
+        self.add_item(self.previous_button)
+        self.add_item(self.next_button)
+        self.set_page(users, offset, has_previous, has_next)
+
+    def set_page(self, users, offset, has_previous, has_next):
+        """
+        Stores the cursors of the shown page and enables the buttons that lead somewhere.
+        """
+        self.offset = offset
+        self.first_cursor = (users[0]["rating"], users[0]["id"]) if users else None
+        self.last_cursor = (users[-1]["rating"], users[-1]["id"]) if users else None
+        self.previous_button.disabled = not has_previous
+        self.next_button.disabled = not has_next
+
+
+class PageButton(discord.ui.Button):
+    def __init__(self, forward, emoji) -> None:
+        super().__init__(emoji=emoji, style=discord.ButtonStyle.grey)
+        self.forward = forward
+
+    async def callback(self: discord.Button, interaction: discord.Interaction):
+        """
+        Callback method for leaderboard page buttons.
+        """
+        from modules.leaderboard import turn_leaderboard_page
+
+        await turn_leaderboard_page(interaction, self.view, self.forward)